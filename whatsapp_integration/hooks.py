@@ -26,12 +26,12 @@ app_license = "mit"
 
 # include js, css files in header of desk.html
 app_include_css = [
-	"/assets/whatsapp_integration/css/wa_chat.css?v=3",
+	"/assets/whatsapp_integration/css/wa_chat.css?v=6",
 	"/assets/whatsapp_integration/css/wa_media.css?v=1"
 ]
 app_include_js = [
-	"/assets/whatsapp_integration/js/wa_chat.js?v=3",
-	"/assets/whatsapp_integration/js/wa_media.js?v=1",
+	"/assets/whatsapp_integration/js/wa_chat.js?v=12",
+	"/assets/whatsapp_integration/js/wa_media.js?v=2",
 	"/assets/whatsapp_integration/js/wa_print.js?v=2"
 ]
 
@@ -145,8 +145,23 @@ app_include_js = [
 # Hook on document methods and events
 
 doc_events = {
+	"*": {
+		"after_insert": "whatsapp_integration.whatsapp_integration.notification_rules.dispatch",
+		"on_update": "whatsapp_integration.whatsapp_integration.notification_rules.dispatch",
+		"on_submit": "whatsapp_integration.whatsapp_integration.notification_rules.dispatch",
+		"on_cancel": "whatsapp_integration.whatsapp_integration.notification_rules.dispatch"
+	},
+	"Contact": {
+		"on_update": "whatsapp_integration.whatsapp_integration.party_index.update_contact",
+		"on_trash": "whatsapp_integration.whatsapp_integration.party_index.remove_contact"
+	},
+	"Customer": {
+		"on_update": "whatsapp_integration.whatsapp_integration.party_index.update_customer",
+		"on_trash": "whatsapp_integration.whatsapp_integration.party_index.remove_customer"
+	},
 	"Sales Invoice": {
-		"validate": "whatsapp_integration.whatsapp_integration.api.send_invoice_notification"
+		"on_update": "whatsapp_integration.whatsapp_integration.notifications.on_invoice_event",
+		"on_submit": "whatsapp_integration.whatsapp_integration.notifications.on_invoice_event"
 	}
 }
 
@@ -171,6 +186,13 @@ doc_events = {
 # 	],
 # }
 
+scheduler_events = {
+	"all": [
+		"whatsapp_integration.whatsapp_integration.notifications.enqueue_drain",
+		"whatsapp_integration.whatsapp_integration.history_import.enqueue_drain"
+	]
+}
+
 # Testing
 # -------
 
@@ -190,6 +212,10 @@ doc_events = {
 # 	"Task": "whatsapp_integration.task.get_dashboard_data"
 # }
 
+override_doctype_dashboards = {
+	"Customer": "whatsapp_integration.whatsapp_integration.party_index.get_customer_dashboard_data"
+}
+
 # exempt linked doctypes from being automatically cancelled
 #
 # auto_cancel_exempted_doctypes = ["Auto Repeat"]
@@ -243,9 +269,9 @@ doc_events = {
 # Automatically update python controller files with type annotations for this app.
 # export_python_type_annotations = True
 
-# default_log_clearing_doctypes = {
-# 	"Logging DocType Name": 30  # days to retain logs
-# }
+default_log_clearing_doctypes = {
+	"WhatsApp Event Trace": 14  # days to retain logs
+}
 
 # Translation
 # ------------
@@ -0,0 +1,17 @@
+import frappe
+from frappe.model.utils.index import add_index
+
+
+def execute():
+    """
+    Index WhatsApp Message for get_chat_history's keyset pages, which read a
+    group's messages before a (creation, name) cursor, newest first. Individual
+    chats use the standard index on creation.
+    """
+    try:
+        add_index("WhatsApp Message", ["group_id", "creation"])
+    except Exception as e:
+        frappe.log_error(
+            f"Error adding WhatsApp chat history indexes: {str(e)}",
+            "WhatsApp Index Patch Error"
+        )
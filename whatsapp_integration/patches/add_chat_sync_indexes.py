@@ -0,0 +1,17 @@
+import frappe
+from frappe.model.utils.index import add_index
+
+
+def execute():
+    """
+    Index WhatsApp Message for get_chat_history_since, which reads the rows of a
+    conversation changed after a (modified, name) cursor. Individual chats use the
+    standard index on modified.
+    """
+    try:
+        add_index("WhatsApp Message", ["group_id", "modified"])
+    except Exception as e:
+        frappe.log_error(
+            f"Error adding WhatsApp chat sync indexes: {str(e)}",
+            "WhatsApp Index Patch Error"
+        )
@@ -0,0 +1,21 @@
+import frappe
+from frappe.model.utils.index import add_index
+
+from whatsapp_integration.whatsapp_integration import party_index
+
+
+def execute():
+    """
+    Build the phone -> party index from existing Contacts and Customers, then
+    link the individual messages saved so far to their Contact and Customer.
+    """
+    try:
+        add_index("WhatsApp Message", ["customer", "creation"])
+        party_index.rebuild()
+        party_index.link_existing_messages()
+        frappe.db.commit()
+    except Exception as e:
+        frappe.log_error(
+            f"Error backfilling WhatsApp party phone index: {str(e)}\n{frappe.get_traceback()}",
+            "WhatsApp Index Patch Error"
+        )
@@ -0,0 +1,16 @@
+import frappe
+
+
+def execute():
+    """
+    Drop stored "not on WhatsApp" results. Earlier checks marked numbers that
+    WhatsApp normalizes (e.g. Brazilian ninth digit, Mexican 521 prefix) as
+    missing, which blocked sends to them; the next check stores them correctly.
+    """
+    try:
+        frappe.db.delete("WhatsApp Number Status", {"on_whatsapp": 0})
+    except Exception as e:
+        frappe.log_error(
+            f"Error clearing WhatsApp number statuses: {str(e)}",
+            "WhatsApp Number Status Patch Error"
+        )
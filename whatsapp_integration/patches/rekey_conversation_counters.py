@@ -0,0 +1,18 @@
+import frappe
+
+
+def execute():
+    """
+    Drop the unread counters kept per chat across all companies. Counters are now
+    kept per company and chat; they start from zero, and each user's read
+    baseline is set on their next inbox load.
+    """
+    try:
+        frappe.db.delete("WhatsApp Conversation Read")
+        frappe.db.delete("WhatsApp Conversation")
+        frappe.db.commit()
+    except Exception as e:
+        frappe.log_error(
+            f"Error resetting WhatsApp conversation counters: {str(e)}\n{frappe.get_traceback()}",
+            "WhatsApp Conversation Patch Error"
+        )
@@ -0,0 +1,20 @@
+import frappe
+
+from whatsapp_integration.whatsapp_integration import party_index
+
+
+def execute():
+    """
+    Rebuild the phone -> party index with full international numbers as keys.
+    It was keyed by the last 10 digits, which matched numbers of different
+    countries to the same party.
+    """
+    try:
+        party_index.rebuild()
+        party_index.link_existing_messages()
+        frappe.db.commit()
+    except Exception as e:
+        frappe.log_error(
+            f"Error rebuilding WhatsApp party phone index: {str(e)}\n{frappe.get_traceback()}",
+            "WhatsApp Index Patch Error"
+        )
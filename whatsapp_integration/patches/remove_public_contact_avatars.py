@@ -0,0 +1,23 @@
+import frappe
+
+
+def execute():
+    """
+    Delete profile pictures saved as public files, which anyone could fetch by
+    phone number. The next profile lookup downloads them again as private files.
+    """
+    try:
+        for name, phone in frappe.get_all(
+            "File",
+            filters={"attached_to_doctype": "WhatsApp Contact Profile", "is_private": 0},
+            fields=["name", "attached_to_name"],
+            as_list=True
+        ):
+            frappe.delete_doc("File", name, ignore_permissions=True)
+            frappe.db.set_value("WhatsApp Contact Profile", phone, "avatar", None, update_modified=False)
+        frappe.db.commit()
+    except Exception as e:
+        frappe.log_error(
+            f"Error removing public WhatsApp avatars: {str(e)}\n{frappe.get_traceback()}",
+            "WhatsApp Avatar Patch Error"
+        )
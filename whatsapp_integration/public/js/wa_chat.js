@@ -1,5 +1,217 @@
 frappe.provide('whatsapp.chat');
 
+// Messages per get_chat_history page
+whatsapp.chat.HISTORY_PAGE_SIZE = 100;
+
+// Per-conversation message cache in IndexedDB, so reopening a chat renders at
+// once and only fetches what changed since its cursor. Falls back to memory
+// when IndexedDB is unavailable (e.g. private browsing).
+whatsapp.chat.MessageCache = class {
+    constructor(max_messages = 500) {
+        this.max_messages = max_messages;
+        this.memory = new Map();
+        this.db = this.open();
+    }
+
+    open() {
+        if (!window.indexedDB) return Promise.resolve(null);
+        return new Promise((resolve) => {
+            const request = indexedDB.open(`whatsapp_chat_${frappe.session.user}`, 1);
+            request.onupgradeneeded = () => {
+                request.result.createObjectStore('conversations', { keyPath: 'conversation' });
+            };
+            request.onsuccess = () => resolve(request.result);
+            request.onerror = () => resolve(null);
+        });
+    }
+
+    async get(conversation) {
+        const db = await this.db;
+        if (!db) return this.memory.get(conversation) || null;
+        return new Promise((resolve) => {
+            const request = db.transaction('conversations').objectStore('conversations').get(conversation);
+            request.onsuccess = () => resolve(request.result || null);
+            request.onerror = () => resolve(null);
+        });
+    }
+
+    async put(conversation, messages, cursor) {
+        const entry = { conversation, messages: messages.slice(-this.max_messages), cursor };
+        const db = await this.db;
+        if (!db) {
+            this.memory.set(conversation, entry);
+            return;
+        }
+        db.transaction('conversations', 'readwrite').objectStore('conversations').put(entry);
+    }
+
+    // Merge changed rows into the cached ones by name, keeping creation order
+    static merge(messages, changes) {
+        const by_name = new Map(messages.map(m => [m.name, m]));
+        changes.forEach(m => by_name.set(m.name, m));
+        return Array.from(by_name.values()).sort((a, b) => (a.creation < b.creation ? -1 : a.creation > b.creation ? 1 : 0));
+    }
+
+    static cursor_of(messages) {
+        let cursor = null;
+        messages.forEach(m => {
+            const key = `${m.modified}|${m.name}`;
+            if (!cursor || key > cursor) cursor = key;
+        });
+        return cursor;
+    }
+};
+
+// Renders only the rows of a long list that are in or near the viewport, with
+// spacers standing in for the rest, so the DOM stays the same size however
+// much history is loaded. Row heights are estimated until a row has been
+// rendered once, and all DOM writes of a frame are batched into one.
+// Items are { key, html }, where html is a single element.
+whatsapp.chat.VirtualList = class {
+    constructor(container, { estimate = 60, gap = 0, overscan = 600, on_reach_top = null } = {}) {
+        this.container = container;
+        this.estimate = estimate;
+        this.gap = gap;
+        this.overscan = overscan;
+        this.on_reach_top = on_reach_top;
+        this.items = [];
+        this.positions = new Map();   // key -> index
+        this.heights = new Map();     // key -> measured height including gap
+        this.version = 0;
+        this.rendered = null;
+        this.frame = null;
+        this.anchor = null;
+        this.pin_bottom = false;
+
+        container.addEventListener('scroll', () => {
+            this.schedule();
+            if (this.on_reach_top && this.items.length && container.scrollTop < this.overscan) {
+                this.on_reach_top();
+            }
+        }, { passive: true });
+    }
+
+    // (Re)create the spacers; search results and placeholders replace them
+    mount() {
+        if (this.wrapper && this.wrapper.parentNode === this.container) return;
+        this.container.classList.add('wa-virtual');
+        this.container.innerHTML = '<div class="wa-virtual-spacer"></div><div class="wa-virtual-items"></div><div class="wa-virtual-spacer"></div>';
+        [this.top, this.wrapper, this.bottom] = this.container.children;
+        this.rendered = null;
+    }
+
+    set_items(items) {
+        this.mount();
+        this.items = items.slice();
+        this.reindex();
+        this.schedule();
+    }
+
+    append(item) {
+        this.mount();
+        this.positions.set(item.key, this.items.length);
+        this.items.push(item);
+        this.version++;
+        this.schedule();
+    }
+
+    // Older rows go above the viewport without moving what is on screen
+    prepend(items) {
+        if (!items.length) return;
+        this.mount();
+        if (!this.anchor && !this.pin_bottom) {
+            this.anchor = this.anchor_at(this.offsets(), this.container.scrollTop);
+        }
+        this.items = items.concat(this.items);
+        this.reindex();
+        this.schedule();
+    }
+
+    scroll_to_bottom() {
+        this.pin_bottom = true;
+        this.anchor = null;
+        this.schedule();
+    }
+
+    reindex() {
+        this.positions = new Map(this.items.map((item, i) => [item.key, i]));
+        this.version++;
+    }
+
+    schedule() {
+        if (this.frame) return;
+        this.frame = requestAnimationFrame(() => this.render());
+    }
+
+    offsets() {
+        const offsets = [0];
+        this.items.forEach((item, i) => {
+            offsets.push(offsets[i] + (this.heights.get(item.key) || this.estimate));
+        });
+        return offsets;
+    }
+
+    // Index of the last row starting at or above `y`
+    find(offsets, y) {
+        let low = 0;
+        let high = this.items.length - 1;
+        while (low < high) {
+            const mid = (low + high + 1) >> 1;
+            if (offsets[mid] <= y) low = mid;
+            else high = mid - 1;
+        }
+        return Math.max(low, 0);
+    }
+
+    anchor_at(offsets, scroll_top) {
+        if (!this.items.length) return null;
+        const index = this.find(offsets, scroll_top);
+        return { key: this.items[index].key, delta: offsets[index] - scroll_top };
+    }
+
+    render() {
+        this.frame = null;
+        if (!this.wrapper || this.wrapper.parentNode !== this.container) return;
+
+        const el = this.container;
+        const offsets = this.offsets();
+        const total = offsets[this.items.length];
+        const anchor = this.pin_bottom ? null : (this.anchor || this.anchor_at(offsets, el.scrollTop));
+        this.anchor = null;
+
+        let scroll_top = el.scrollTop;
+        if (this.pin_bottom) {
+            scroll_top = Math.max(total - el.clientHeight, 0);
+        } else if (anchor && this.positions.has(anchor.key)) {
+            scroll_top = offsets[this.positions.get(anchor.key)] - anchor.delta;
+        }
+
+        const start = this.items.length ? this.find(offsets, scroll_top - this.overscan) : 0;
+        const end = this.items.length ? this.find(offsets, scroll_top + el.clientHeight + this.overscan) + 1 : 0;
+        const r = this.rendered;
+        if (!r || r.start !== start || r.end !== end || r.version !== this.version) {
+            this.top.style.height = `${offsets[start]}px`;
+            this.bottom.style.height = `${total - offsets[end]}px`;
+            this.wrapper.innerHTML = this.items.slice(start, end).map(item => item.html).join('');
+            this.rendered = { start, end, version: this.version };
+
+            // A hidden list has no layout; keep the estimates until it is shown
+            if (el.clientHeight) {
+                Array.from(this.wrapper.children).forEach((node, i) => {
+                    this.heights.set(this.items[start + i].key, node.offsetHeight + this.gap);
+                });
+            }
+        }
+
+        if (this.pin_bottom) {
+            el.scrollTop = el.scrollHeight;
+            this.pin_bottom = false;
+        } else if (anchor && this.positions.has(anchor.key)) {
+            el.scrollTop = this.offsets()[this.positions.get(anchor.key)] - anchor.delta;
+        }
+    }
+};
+
 whatsapp.chat.Widget = class {
     constructor() {
         console.log("WhatsApp Widget v2.2 - Group Fix - HARD RELOAD DONE");
@@ -10,13 +222,51 @@ whatsapp.chat.Widget = class {
         this.retry_count = 0;
         this.max_retries = 3;
         this.is_active_group = false;
+        this.active_chat_key = null;
+
+        // Inbox state; realtime deltas are merged into it instead of reloading
+        this.chats = [];
+        this.inbox_version = null;
+        this.unread = {};
+        this.inbox_reload_timer = null;
+        this.mark_read_timer = null;
+        this.realtime_subscribed = false;
+        // Conversation subscriptions are per tab, so two open tabs don't replace each other's
+        this.tab_id = frappe.utils.get_random(10);
+        this.message_cache = new whatsapp.chat.MessageCache();
+
+        // Messages of the open chat, oldest first; older pages are prepended on scroll
+        this.messages = [];
+        this.history_complete = false;
+        this.loading_older = false;
+        this.local_message_count = 0;
 
         this.render();
+        this.message_list = new whatsapp.chat.VirtualList(document.getElementById('waMessages'), {
+            estimate: 60,
+            gap: 10,
+            on_reach_top: () => this.load_older_messages()
+        });
+        this.chat_list = new whatsapp.chat.VirtualList(document.getElementById('waChatList'), { estimate: 65 });
         this.bind_events();
         this.listen_realtime();
 
         this.check_connection();
-        this.connection_check_interval = setInterval(() => this.check_connection(), 45000);
+        this.connection_check_interval = setInterval(() => {
+            this.check_connection();
+            if (this.realtime_subscribed) this.subscribe_realtime();
+        }, 45000);
+    }
+
+    // Events are only sent to users subscribed to the company's inbox or the
+    // open conversation; the subscription expires unless renewed
+    subscribe_realtime() {
+        if (!this.company) return;
+        this.realtime_subscribed = true;
+        frappe.call({
+            method: 'whatsapp_integration.whatsapp_integration.realtime.subscribe',
+            args: { company: this.company, conversation: this.active_number, tab: this.tab_id }
+        });
     }
 
     destroy() {
@@ -79,6 +329,8 @@ whatsapp.chat.Widget = class {
     bind_events() {
         $('#waChatToggle').on('click', () => {
             $('#waChatWindow').toggleClass('active');
+            if (!this.realtime_subscribed) this.subscribe_realtime();
+            if (this.inbox_version === null && !this.active_number) this.load_recent_chats();
         });
 
         $('.wa-close').on('click', (e) => {
@@ -99,6 +351,11 @@ whatsapp.chat.Widget = class {
             $('#waGroupInfo').hide();
         });
 
+        $('#waChatList').on('click', '.wa-chat-item[data-phone]', (e) => {
+            const item = $(e.currentTarget);
+            this.open_chat(String(item.attr('data-phone')), item.attr('data-name'), item.attr('data-group') === '1');
+        });
+
         $('#waSend').on('click', () => this.send_message());
         $('#waInput').on('keypress', (e) => {
             if (e.which == 13) this.send_message();
@@ -107,7 +364,7 @@ whatsapp.chat.Widget = class {
         $('#waSearch').on('input', (e) => {
             const query = $(e.target).val();
             if (query.length < 2) {
-                if (query.length === 0) this.load_recent_chats();
+                if (query.length === 0) this.render_chat_list();
                 return;
             }
 
@@ -197,40 +454,105 @@ whatsapp.chat.Widget = class {
 
     async load_recent_chats() {
         const list = $('#waChatList');
-        list.html('<div style="padding: 20px; text-align:center; color:#888;"><i class="fa fa-spinner fa-spin"></i> Loading chats...</div>');
+        if (!this.chats.length) {
+            list.html('<div style="padding: 20px; text-align:center; color:#888;"><i class="fa fa-spinner fa-spin"></i> Loading chats...</div>');
+        }
 
         try {
             const response = await frappe.call({
                 method: 'whatsapp_integration.whatsapp_integration.api.get_recent_chats',
-                args: { limit: 50 }
+                args: { limit: 50, with_version: 1, company: this.company }
             });
 
-            list.empty();
-            if (response && response.message && response.message.length) {
-                response.message.forEach(chat => {
-                    const firstLetter = chat.sender_full_name ? chat.sender_full_name[0].toUpperCase() : '?';
-                    const isGroup = chat.is_group;
-                    const avatarBg = isGroup ? '#00a884' : '#2196F3';
-
-                    const item = $(`
-                        <div class="wa-chat-item ${isGroup ? 'wa-group-item' : ''}" data-phone="${chat.phone}">
-                            <div class="wa-avatar-small" style="background:${avatarBg}">${isGroup ? '<i class="fa fa-users"></i>' : firstLetter}</div>
-                            <div class="wa-chat-item-info">
-                                <div class="wa-chat-item-name">${chat.sender_full_name}</div>
-                                <div class="wa-chat-item-last">${chat.last_msg}</div>
-                            </div>
-                            <div class="wa-chat-item-time">${comment_when(chat.time)}</div>
-                        </div>
-                    `);
-                    item.on('click', () => this.open_chat(chat.phone, chat.sender_full_name, isGroup));
-                    list.append(item);
+            if (response && response.message) {
+                this.chats = response.message.chats || [];
+                this.inbox_version = response.message.version;
+                // Server-side counters; the open chat is read
+                this.unread = {};
+                this.chats.forEach(chat => {
+                    if (chat.unread && chat.phone !== this.active_number) this.unread[chat.phone] = chat.unread;
                 });
             }
+            this.render_chat_list();
         } catch (e) {
             console.error(e);
         }
     }
 
+    // Reset the conversation's unread count and send read receipts; messages
+    // arriving while the chat is open are marked in one call per burst
+    mark_read(conversation, delay = 0) {
+        clearTimeout(this.mark_read_timer);
+        this.mark_read_timer = setTimeout(() => {
+            frappe.call({
+                method: 'whatsapp_integration.whatsapp_integration.api.mark_conversation_read',
+                args: { conversation, company: this.company }
+            });
+        }, delay);
+    }
+
+    // Reload once after a burst of missed versions or a reconnect
+    schedule_inbox_reload() {
+        if (this.inbox_version === null || this.inbox_reload_timer) return;
+        this.inbox_reload_timer = setTimeout(() => {
+            this.inbox_reload_timer = null;
+            this.load_recent_chats();
+        }, 1000);
+    }
+
+    // Apply a conversation summary from a realtime event. Returns false if a
+    // version was missed and the inbox has to be reloaded instead.
+    apply_inbox_delta(data) {
+        if (this.inbox_version === null || !data.chat || data.version == null) return true;
+        if (data.version <= this.inbox_version) return true;  // already in the loaded list
+        if (data.version !== this.inbox_version + 1) return false;
+
+        this.inbox_version = data.version;
+        const chat = data.chat;
+        this.chats = [chat].concat(this.chats.filter(c => c.phone !== chat.phone)).slice(0, 50);
+        if (chat.phone !== this.active_number && chat.message_type === 'Incoming') {
+            this.unread[chat.phone] = (this.unread[chat.phone] || 0) + 1;
+        }
+        this.render_chat_list();
+        return true;
+    }
+
+    render_chat_list() {
+        // Don't replace search results
+        if ($('#waSearch').val()) return;
+
+        if (!this.chats.length) {
+            $('#waChatList').html('<div style="padding: 20px; text-align:center; color:#888;">No recent chats found.</div>');
+            return;
+        }
+
+        // Clicks are handled by the delegated handler in bind_events
+        this.chat_list.set_items(this.chats.map(chat => {
+            const firstLetter = chat.sender_full_name ? this.escape_html(chat.sender_full_name[0].toUpperCase()) : '?';
+            const isGroup = chat.is_group;
+            const avatarBg = isGroup ? '#00a884' : '#2196F3';
+            const unread = this.unread[chat.phone];
+            const name = this.escape_html(chat.sender_full_name);
+
+            return {
+                key: chat.phone,
+                html: `
+                    <div class="wa-chat-item ${isGroup ? 'wa-group-item' : ''}" data-phone="${frappe.utils.escape_html(chat.phone)}" data-name="${frappe.utils.escape_html(chat.sender_full_name)}" data-group="${isGroup ? 1 : 0}">
+                        <div class="wa-avatar-small" style="background:${avatarBg}">${isGroup ? '<i class="fa fa-users"></i>' : firstLetter}</div>
+                        <div class="wa-chat-item-info">
+                            <div class="wa-chat-item-name">${name}</div>
+                            <div class="wa-chat-item-last">${this.escape_html(chat.last_msg)}</div>
+                        </div>
+                        <div class="wa-chat-item-time">
+                            ${comment_when(chat.time)}
+                            ${unread ? `<span class="wa-unread-badge">${unread}</span>` : ''}
+                        </div>
+                    </div>
+                `
+            };
+        }));
+    }
+
     async open_chat(phone, name, isGroup = false) {
         const phoneStr = String(phone || '');
         if (!isGroup && (phoneStr.includes('-') || phoneStr.length >= 15)) {
@@ -241,8 +563,12 @@ whatsapp.chat.Widget = class {
         const cleanedPhone = isGroup ? phoneStr : phoneStr.replace(/[\s\+\-]/g, '');
         this.active_number = cleanedPhone;
         this.is_active_group = isGroup;
+        delete this.unread[cleanedPhone];
+        this.subscribe_realtime();
+        this.mark_read(cleanedPhone);
 
         $('#waHeaderTitle').text(name);
+        this.set_header_avatar(null, name);
         $('#waStatus').html(isGroup ? '<span style="color:#25D366; font-weight:bold;">● Group Chat (v2)</span>' : 'Checking...');
         $('#waStatus').attr('data-is-group', isGroup ? '1' : '0');
 
@@ -270,43 +596,156 @@ whatsapp.chat.Widget = class {
                 method: 'whatsapp_integration.whatsapp_integration.api.subscribe_contact_presence',
                 args: { phone: cleanedPhone } // Cleaned for presence subscribe
             });
+            // Cached profile; usually answered without a WhatsApp round trip
+            frappe.call({
+                method: 'whatsapp_integration.whatsapp_integration.api.get_contact_info',
+                args: { phone: cleanedPhone },
+                callback: (r) => {
+                    if (r.message && r.message.status === 'success' && this.active_number === cleanedPhone) {
+                        this.set_header_avatar(r.message.profilePicture, name);
+                        $('#waHeaderTitle').attr('title', r.message.about || '');
+                    }
+                }
+            });
         }
 
-        frappe.call({
-            method: 'whatsapp_integration.whatsapp_integration.api.get_chat_history',
-            args: { sender_phone: phoneStr }, // Original for history
-            callback: (r) => {
-                $('#waMessages').empty();
-                if (r.message) {
-                    r.message.forEach(msg => {
-                        this.add_message(
-                            msg.message,
-                            msg.message_type === 'Incoming' ? 'received' : 'sent',
-                            msg.creation,
-                            msg.media_attachment,
-                            msg.message_status,
-                            msg.message_id,
-                            msg.reply_to_message_id,
-                            msg.reply_to_message_text,
-                            msg.sender_name,
-                            msg.sender,
-                            msg.is_group_message
-                        );
+        this.active_chat_key = phoneStr;
+        this.load_chat_history(phoneStr);
+    }
+
+    // Render the cached history at once, then apply what changed on the server
+    async load_chat_history(conversation) {
+        const cached = await this.message_cache.get(conversation);
+        if (this.active_chat_key !== conversation) return;
+        this.messages = [];
+        this.history_complete = false;
+        this.message_list.set_items([]);
+
+        let messages = cached ? cached.messages : [];
+        let cursor = cached ? cached.cursor : null;
+        if (cached) {
+            this.render_messages(messages);
+        }
+
+        try {
+            if (!cached) {
+                const r = await frappe.call({
+                    method: 'whatsapp_integration.whatsapp_integration.api.get_chat_history',
+                    args: { sender_phone: conversation, limit: whatsapp.chat.HISTORY_PAGE_SIZE, before: '' } // Original for history
+                });
+                messages = r.message || [];
+                this.history_complete = messages.length < whatsapp.chat.HISTORY_PAGE_SIZE;
+                cursor = whatsapp.chat.MessageCache.cursor_of(messages);
+            } else {
+                let more = true;
+                let overlap = 1;  // re-read a few seconds behind the cursor for late commits
+                let changes = [];
+                while (more) {
+                    const r = await frappe.call({
+                        method: 'whatsapp_integration.whatsapp_integration.api.get_chat_history_since',
+                        args: { conversation, cursor, overlap }
                     });
+                    const page = r.message || {};
+                    if (page.error) return;
+                    changes = changes.concat(page.messages || []);
+                    cursor = page.cursor;
+                    more = page.more;
+                    overlap = 0;
+                }
+                // Rows of the overlap that are already cached unchanged
+                const cached_modified = new Map(messages.map(m => [m.name, m.modified]));
+                changes = changes.filter(m => cached_modified.get(m.name) !== m.modified);
+                if (!changes.length) {
+                    this.message_cache.put(conversation, messages, cursor);
+                    return;
                 }
+                messages = whatsapp.chat.MessageCache.merge(messages, changes);
             }
-        });
+        } catch (e) {
+            console.error(e);
+            return;
+        }
+
+        this.message_cache.put(conversation, messages, cursor);
+        if (this.active_chat_key === conversation) {
+            // Keep older pages loaded while this sync was running
+            this.render_messages(whatsapp.chat.MessageCache.merge(this.messages, messages));
+        }
+    }
+
+    msg_to_item(msg) {
+        const item = this.message_item(
+            msg.message,
+            msg.message_type === 'Incoming' ? 'received' : 'sent',
+            msg.creation,
+            msg.media_attachment,
+            msg.message_status,
+            msg.message_id,
+            msg.reply_to_message_id,
+            msg.reply_to_message_text,
+            msg.sender_name,
+            msg.sender,
+            msg.is_group_message
+        );
+        item.key = msg.name;
+        return item;
+    }
+
+    render_messages(messages) {
+        this.messages = messages;
+        this.message_list.set_items(messages.map(msg => this.msg_to_item(msg)));
+        this.message_list.scroll_to_bottom();
+    }
+
+    // Prepend the page before the oldest loaded message (keyset on creation, name)
+    async load_older_messages() {
+        const conversation = this.active_chat_key;
+        if (!conversation || this.loading_older || this.history_complete || !this.messages.length) return;
+
+        this.loading_older = true;
+        const oldest = this.messages[0];
+        try {
+            const r = await frappe.call({
+                method: 'whatsapp_integration.whatsapp_integration.api.get_chat_history',
+                args: { sender_phone: conversation, limit: whatsapp.chat.HISTORY_PAGE_SIZE, before: `${oldest.creation}|${oldest.name}` }
+            });
+            if (this.active_chat_key !== conversation) return;
+
+            const page = r.message || [];
+            if (page.length < whatsapp.chat.HISTORY_PAGE_SIZE) this.history_complete = true;
+            if (page.length) {
+                this.messages = page.concat(this.messages);
+                this.message_list.prepend(page.map(msg => this.msg_to_item(msg)));
+            }
+        } catch (e) {
+            console.error(e);
+        } finally {
+            this.loading_older = false;
+        }
     }
 
     show_inbox() {
         this.active_number = null;
+        this.active_chat_key = null;
         this.is_active_group = false;
+        this.subscribe_realtime();
         $('#waStatus').attr('data-is-group', '0');
         $('#waChatView').hide();
         $('#waInboxView').show();
         $('#waBack').hide();
-        $('#waHeaderTitle').text('WhatsApp Inbox');
-        this.load_recent_chats();
+        $('#waHeaderTitle').text('WhatsApp Inbox').attr('title', '');
+        this.set_header_avatar(null, 'W');
+        if (this.inbox_version === null) this.load_recent_chats();
+        else this.render_chat_list();
+    }
+
+    set_header_avatar(url, name) {
+        const avatar = $('.wa-chat-header .wa-avatar');
+        if (url) {
+            avatar.html(`<img src="${this.escape_html(url)}" alt="">`);
+        } else {
+            avatar.text(String(name || 'W').charAt(0).toUpperCase());
+        }
     }
 
     show_group_info() {
@@ -343,7 +782,12 @@ whatsapp.chat.Widget = class {
     }
 
     add_message(text, type, time = null, media = null, status = null, messageId = null, replyTo = null, replyToText = null, senderName = null, senderId = null, isGroupMsg = null) {
-        const container = $('#waMessages');
+        this.message_list.append(this.message_item(text, type, time, media, status, messageId, replyTo, replyToText, senderName, senderId, isGroupMsg));
+        this.message_list.scroll_to_bottom();
+    }
+
+    // Row of the message pane's virtual list
+    message_item(text, type, time = null, media = null, status = null, messageId = null, replyTo = null, replyToText = null, senderName = null, senderId = null, isGroupMsg = null) {
         const display_time = time ? moment(time).format('HH:mm') : moment().format('HH:mm');
         const safe_text = this.escape_html(text || '');
         let content = '';
@@ -357,17 +801,18 @@ whatsapp.chat.Widget = class {
 
         if (isActuallyGroup && type === 'received') {
             const name = senderName || senderId || 'Member';
-            content += `<div class="wa-msg-sender" style="font-weight:bold; color:#356de4; font-size:12px; margin-bottom:4px;">${name}</div>`;
+            content += `<div class="wa-msg-sender" style="font-weight:bold; color:#356de4; font-size:12px; margin-bottom:4px;">${this.escape_html(name)}</div>`;
         }
 
         content += safe_text;
         if (media) {
-            content += `<br><img src="${media}" style="max-width:100%; border-radius:8px; margin-top:5px;">`;
+            content += `<br><img src="${frappe.utils.escape_html(media)}" style="max-width:100%; border-radius:8px; margin-top:5px;" loading="lazy">`;
         }
 
-        const msg_html = $(`<div class="wa-msg wa-msg-${type}">${content}<div class="wa-msg-time">${display_time}</div></div>`);
-        container.append(msg_html);
-        container.scrollTop(container[0].scrollHeight);
+        return {
+            key: messageId || `local-${++this.local_message_count}`,
+            html: `<div class="wa-msg wa-msg-${type}">${content}<div class="wa-msg-time">${display_time}</div></div>`
+        };
     }
 
     async send_message() {
@@ -393,11 +838,21 @@ whatsapp.chat.Widget = class {
             const chatMatch = isGroup ? (this.active_number === data.group_id) : (this.active_number === data.from);
             if (this.active_number && chatMatch) {
                 this.add_message(data.text, 'received', null, data.media, null, data.message_id, data.reply_to_id, data.reply_to_text, data.sender_name, data.from, isGroup ? 1 : 0);
-            } else {
-                this.load_recent_chats();
+                this.mark_read(this.active_number, 2000);
+            }
+            if (!this.apply_inbox_delta(data)) {
+                this.schedule_inbox_reload();
             }
         });
 
+        // Events published while the socket was down are lost
+        if (frappe.realtime.socket) {
+            frappe.realtime.socket.on('connect', () => {
+                if (this.realtime_subscribed) this.subscribe_realtime();
+                this.schedule_inbox_reload();
+            });
+        }
+
         frappe.realtime.on('whatsapp_presence_update', (data) => {
             if (this.active_number && data.from === this.active_number) {
                 this.handle_presence(data.presence);
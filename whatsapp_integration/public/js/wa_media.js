@@ -291,7 +291,6 @@ whatsapp.chat.Widget.prototype.add_message_with_media = function (text, type, ti
     media = media || null;
     mediaType = mediaType || null;
 
-    const container = $('#waMessages');
     const display_time = time ? moment(time).format('HH:mm') : moment().format('HH:mm');
 
     let safe_text = this.escape_html(text || '');
@@ -356,19 +355,16 @@ whatsapp.chat.Widget.prototype.add_message_with_media = function (text, type, ti
         }
     }
 
-    const msg_html = $(`
-        <div class="wa-msg wa-msg-${type}">
-            ${content}
-            <div class="wa-msg-time">${display_time}</div>
-        </div>
-    `);
-
-    container.append(msg_html);
-
-    // Smooth scroll to bottom
-    container.animate({
-        scrollTop: container[0].scrollHeight
-    }, 300);
+    this.message_list.append({
+        key: `local-${++this.local_message_count}`,
+        html: `
+            <div class="wa-msg wa-msg-${type}">
+                ${content}
+                <div class="wa-msg-time">${display_time}</div>
+            </div>
+        `
+    });
+    this.message_list.scroll_to_bottom();
 };
 
 // ============================================================================
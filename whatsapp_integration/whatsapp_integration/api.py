@@ -1,10 +1,14 @@
 import frappe
 import json
+import os
 import requests
 import re
-from typing import Optional, Dict, Any, List
+from datetime import timedelta
+from typing import Optional, Dict, Any, List, Tuple
+from urllib.parse import quote
 from frappe import _
 from frappe.rate_limiter import rate_limit
+from whatsapp_integration.whatsapp_integration import conversations, history_import, metrics, party_index, realtime, tracing
 from whatsapp_integration.whatsapp_integration.doctype.whatsapp_settings.whatsapp_settings import send_whatsapp_message
 
 # ============================================================================
@@ -90,11 +94,14 @@ def get_default_company() -> Optional[str]:
 # INVOICE NOTIFICATION
 # ============================================================================
 
-def send_invoice_notification(doc, method):
+def send_invoice_notification(doc, method=None):
     """
-    Called when a Sales Invoice is submitted.
-    Sends WhatsApp notification to customer with invoice details.
+    Send WhatsApp notification to customer with invoice details.
+    Runs in the notification queue's background job (see notifications.py).
     """
+    if doc.docstatus == 2:
+        return  # cancelled while queued
+
     try:
         # Find the WhatsApp Settings for this company
         settings_name = frappe.db.get_value(
@@ -157,7 +164,6 @@ def send_invoice_notification(doc, method):
         )
 
         if response.get("status") == "sent":
-            frappe.msgprint(_(f"WhatsApp notification sent to {receiver_number}"))
             # Save as Message for chat history
             msg_id = response.get("result", {}).get("key", {}).get("id")
             save_whatsapp_msg(receiver_number, message, "Outgoing", doc.company, msg_id)
@@ -194,7 +200,12 @@ def log_communication(company: str, receiver: str, message_type: str, status: st
 # WEBHOOK HANDLER
 # ============================================================================
 
+# Database errors a retry can get past. Webhook handlers let them reach
+# handle_callback, which answers 500 so the bridge delivers the event again.
+TRANSIENT_DB_ERRORS = (frappe.QueryDeadlockError, frappe.QueryTimeoutError)
+
 @frappe.whitelist(allow_guest=True)
+@metrics.instrument("handle_callback")
 def handle_callback():
     """
     Webhook endpoint for Node.js service to notify Frappe about WhatsApp events.
@@ -217,11 +228,11 @@ def handle_callback():
 
         if not session_id:
             frappe.log_error("No sessionId in webhook callback", "WhatsApp Webhook Error")
-            return {"status": "error", "message": "No sessionId provided"}
+            return webhook_error(400, "No sessionId provided")
 
         if not token:
             frappe.log_error(f"No token in webhook callback for session {session_id}", "WhatsApp Webhook Error")
-            return {"status": "error", "message": "No authentication token"}
+            return webhook_error(401, "No authentication token")
 
         # Convert session_id back to doc name
         doc_name = session_id.replace("_", " ")
@@ -229,7 +240,7 @@ def handle_callback():
         # Verify settings exist
         if not frappe.db.exists("WhatsApp Settings", doc_name):
             frappe.log_error(f"Settings not found for {doc_name}", "WhatsApp Webhook Error")
-            return {"status": "error", "message": f"Settings for {doc_name} not found"}
+            return webhook_error(404, f"Settings for {doc_name} not found")
 
         # Validate webhook token
         doc = frappe.get_doc("WhatsApp Settings", doc_name)
@@ -240,34 +251,88 @@ def handle_callback():
                 f"Webhook Token Mismatch for {doc_name}. Expected: {stored_token[:8]}..., Received: {token[:8] if token else 'None'}...",
                 "WhatsApp Security Alert"
             )
-            return {"status": "error", "message": "Unauthorized"}
+            # Fixed label: the event name of an unauthenticated request is caller-controlled
+            metrics.inc("whatsapp_webhook_events_total", event="unauthorized", result="unauthorized")
+            return webhook_error(401, "Unauthorized")
 
         # Process event
         event = data.get("event")
         if not event:
-            return {"status": "error", "message": "No event type specified"}
+            return webhook_error(400, "No event type specified")
 
         frappe.logger().info(f"WhatsApp Webhook: {event} for {doc_name}")
 
-        if event == "connection.update":
-            handle_connection_update(doc_name, doc, data)
-        elif event == "messages.upsert":
-            handle_messages_upsert(doc, data)
-        elif event == "message.status":
-            handle_message_status(doc, data)
-        elif event == "presence.update":
-            handle_presence_update(doc, data)
-        else:
-            frappe.logger().warning(f"Unknown webhook event: {event}")
+        if event == "batch":
+            return handle_event_batch(doc_name, doc, session_id, data.get("events") or [])
 
+        dispatch_event(doc_name, doc, session_id, event, data)
         return {"status": "success"}
 
     except Exception as e:
+        frappe.db.rollback()
         frappe.log_error(
             f"Webhook Error: {str(e)}\n{frappe.get_traceback()}",
             "WhatsApp Webhook Error"
         )
-        return {"status": "error", "message": "Internal server error"}
+        return webhook_error(failure_status(e), "Internal server error")
+
+def webhook_error(status_code: int, message: str, **extra) -> Dict[str, Any]:
+    """
+    Error response with a real HTTP status. The bridge only drops an event from
+    its outbox on "success"; it retries 5xx, 401 and 404 responses and
+    dead-letters other 4xx ones.
+    """
+    frappe.local.response.http_status_code = status_code
+    return {"status": "error", "message": message, **extra}
+
+def failure_status(e: Exception) -> int:
+    """HTTP status for an event that raised `e`: 422 if retrying cannot help, else 500."""
+    return 422 if isinstance(e, frappe.ValidationError) else 500
+
+def dispatch_event(doc_name: str, doc, session_id: str, event: str, data: Dict[str, Any]):
+    """Route a single webhook event to its handler."""
+    tracing.start(data, event, session_id)
+    try:
+        with metrics.timer("whatsapp_webhook_duration_seconds", event=event):
+            if event == "connection.update":
+                handle_connection_update(doc_name, doc, data)
+            elif event == "messages.upsert":
+                handle_messages_upsert(doc, data)
+            elif event == "message.status":
+                handle_message_status(doc, data)
+            elif event == "presence.update":
+                handle_presence_update(doc, data)
+            elif event == "history.import":
+                history_import.handle_history_import(doc, data)
+            else:
+                frappe.logger().warning(f"Unknown webhook event: {event}")
+    finally:
+        tracing.finish()
+
+    metrics.inc("whatsapp_webhook_events_total", event=event, result="success")
+
+def handle_event_batch(doc_name: str, doc, session_id: str, events: List[Dict[str, Any]]):
+    """
+    Handle several events delivered in one request, in the order they were queued.
+    Stops at the first event that fails: the events before it are committed and
+    reported as `processed`, so the bridge acknowledges only those and delivers
+    the rest again from the failing event.
+    """
+    for index, item in enumerate(events):
+        event = item.get("event")
+        try:
+            dispatch_event(doc_name, doc, session_id, event, item)
+            frappe.db.commit()
+        except Exception as e:
+            frappe.db.rollback()
+            metrics.inc("whatsapp_webhook_events_total", event=event or "unknown", result="error")
+            frappe.log_error(
+                f"Webhook Error ({event}): {str(e)}\n{frappe.get_traceback()}",
+                "WhatsApp Webhook Error"
+            )
+            return webhook_error(failure_status(e), f"Event {index} ({event}) failed", processed=index)
+
+    return {"status": "success", "processed": len(events)}
 
 def handle_connection_update(doc_name: str, doc, data: Dict[str, Any]):
     """Handle connection status update from Node.js service."""
@@ -282,16 +347,21 @@ def handle_connection_update(doc_name: str, doc, data: Dict[str, Any]):
             update_data["last_connected"] = frappe.utils.now()
 
         frappe.db.set_value("WhatsApp Settings", doc_name, update_data)
+        tracing.mark("saved")
         frappe.db.commit()
+        tracing.mark("committed")
 
-        # Publish real-time event for UI update
+        # Publish real-time event to the open WhatsApp Settings form
         frappe.publish_realtime("whatsapp_connection_update", {
             "status": status,
             "doc_name": doc_name
-        })
+        }, doctype="WhatsApp Settings", docname=doc_name)
+        tracing.mark("published")
 
         frappe.logger().info(f"Connection status updated for {doc_name}: {status}")
     except Exception as e:
+        if isinstance(e, TRANSIENT_DB_ERRORS):
+            raise
         frappe.log_error(
             f"Error updating connection status: {str(e)}\n{frappe.get_traceback()}",
             "WhatsApp Connection Update Error"
@@ -304,19 +374,22 @@ def handle_messages_upsert(doc, data: Dict[str, Any]):
     if not messages:
         return
 
+    # Contact and Customer of every sender in one query
+    parties = party_index.lookup(msg.get("from") for msg in messages if msg.get("from") and not msg.get("isGroup"))
+
     for msg in messages:
         try:
-            wm = handle_incoming_message(doc, msg)
+            wm = handle_incoming_message(doc, msg, parties=parties)
             if wm:
+                tracing.mark("saved", message_id=wm.message_id)
                 frappe.db.commit()
+                tracing.mark("committed")
                 # Notify UI in real-time
-                frappe.publish_realtime("whatsapp_incoming_message", {
-                    "from": wm.sender,
-                    "text": msg.get("text", ""),
-                    "sender_name": msg.get("pushName"),
-                    "media": wm.media_attachment if wm.media_attachment else None
-                })
+                publish_inbox_delta(wm, text=msg.get("text", ""), sender_name=msg.get("pushName"))
+                tracing.mark("published")
         except Exception as e:
+            if isinstance(e, TRANSIENT_DB_ERRORS):
+                raise
             frappe.log_error(
                 f"Error handling incoming message: {str(e)}\n{frappe.get_traceback()}",
                 "WhatsApp Incoming Message Error"
@@ -332,24 +405,34 @@ def handle_message_status(doc, data: Dict[str, Any]):
 
     try:
         # Find the message by message_id
-        existing = frappe.db.exists("WhatsApp Message", {"message_id": message_id})
+        existing = frappe.db.get_value(
+            "WhatsApp Message",
+            {"message_id": message_id},
+            ["name", "company", "receiver", "is_group_message", "group_id"],
+            as_dict=True
+        )
 
         if existing:
             # Update the message status
-            frappe.db.set_value("WhatsApp Message", existing, "message_status", status)
+            frappe.db.set_value("WhatsApp Message", existing.name, "message_status", status)
+            tracing.mark("saved", message_id=message_id)
             frappe.db.commit()
+            tracing.mark("committed")
 
             frappe.logger().info(f"Updated message {message_id} status to {status}")
 
-            # Publish real-time event for UI update
-            frappe.publish_realtime("whatsapp_message_status", {
+            # Publish real-time event to users with the conversation open
+            realtime.publish("whatsapp_message_status", {
                 "messageId": message_id,
                 "status": status
-            })
+            }, existing.company, existing.group_id if existing.is_group_message else existing.receiver)
+            tracing.mark("published")
         else:
             frappe.logger().warning(f"Message {message_id} not found in database for status update")
 
     except Exception as e:
+        if isinstance(e, TRANSIENT_DB_ERRORS):
+            raise
         frappe.log_error(
             f"Error updating message status: {str(e)}\n{frappe.get_traceback()}",
             "WhatsApp Message Status Error"
@@ -363,11 +446,11 @@ def handle_presence_update(doc, data: Dict[str, Any]):
     if not from_jid or not presence:
         return
 
-    # Notify UI in real-time
-    frappe.publish_realtime("whatsapp_presence_update", {
+    # Notify users with the conversation open
+    realtime.publish("whatsapp_presence_update", {
         "from": from_jid,
         "presence": presence
-    })
+    }, doc.company, from_jid)
 
 # ============================================================================
 # API ENDPOINTS - SYSTEM STATUS & CHAT
@@ -390,7 +473,7 @@ def subscribe_contact_presence(phone: str, company: Optional[str] = None):
         node_url = settings.node_url or "http://127.0.0.1:3000"
         session_id = settings.name.replace(" ", "_")
         
-        requests.post(f"{node_url}/sessions/subscribe-presence", json={
+        metrics.node_request("POST", f"{node_url}/sessions/subscribe-presence", "/sessions/subscribe-presence", json={
             "sessionId": session_id,
             "phone": phone
         }, timeout=5)
@@ -431,8 +514,10 @@ def get_system_status(company: Optional[str] = None) -> Dict[str, Any]:
         session_id = doc_name.replace(" ", "_")
 
         try:
-            res = requests.get(
+            res = metrics.node_request(
+                "GET",
                 f"{node_url}/sessions/{session_id}/status",
+                "/sessions/:id/status",
                 timeout=3
             )
             if res.status_code == 200:
@@ -465,13 +550,19 @@ def get_system_status(company: Optional[str] = None) -> Dict[str, Any]:
 
 @frappe.whitelist()
 @rate_limit(limit=30, seconds=60)
-def get_recent_chats(limit: int = 50) -> List[Dict[str, Any]]:
+@metrics.instrument("get_recent_chats")
+def get_recent_chats(limit: int = 50, with_version: bool = False, company: Optional[str] = None):
     """
     Get recent unique chat conversations.
-    Returns list of contacts with their last message.
+    Returns list of contacts with their last message. With `with_version`, returns
+    {"version", "chats"} with the inbox version of `company` (default: the user's
+    default company), so the widget can apply that company's later realtime deltas on top.
     """
     try:
         limit = min(int(limit), 100)  # Cap at 100
+        company = company or get_default_company()
+        # Read before the query, so a delta published meanwhile is applied rather than skipped
+        version = get_inbox_version(company) if frappe.utils.cint(with_version) else None
 
         # Optimized query to get unique contacts (and groups) with their last message
         messages = frappe.db.sql("""
@@ -516,47 +607,16 @@ def get_recent_chats(limit: int = 50) -> List[Dict[str, Any]]:
 
         unique_chats = []
         for m in messages:
-            is_group = m.get("is_group_message") == 1
-            
-            if is_group:
-                phone = m.group_id
-                display_name = m.group_name or f"Group: {m.group_id}"
-                last_msg_text = f"{m.sender_name}: {m.last_msg}" if m.sender != "Me" else f"You: {m.last_msg}"
-            else:
-                # Determine the other party's phone number
-                phone = m.receiver if m.sender == "Me" else m.sender
-                if not phone or phone == "Me":
-                    continue
-                
-                # Get display name
-                display_name = m.sender_name if m.sender != "Me" else None
-                last_msg_text = m.last_msg
+            chat = format_chat_summary(m)
+            if chat:
+                unique_chats.append(chat)
 
-            # Clean phone number (leave group IDs as is)
-            if not is_group:
-                clean_phone = phone.split('@')[0].replace('+', '')
-            else:
-                clean_phone = phone
-
-            if not display_name and not is_group:
-                # Try to find contact by phone
-                contact = frappe.db.get_value(
-                    "Contact",
-                    {"mobile_no": ["like", f"%{clean_phone}%"]},
-                    ["full_name", "name"],
-                    as_dict=1
-                )
-                display_name = contact.full_name if contact else clean_phone
-
-            unique_chats.append({
-                "phone": clean_phone,
-                "sender_full_name": display_name,
-                "last_msg": last_msg_text[:100] if last_msg_text else "",  # Truncate long messages
-                "time": m.time,
-                "message_type": m.message_type,
-                "is_group": is_group
-            })
+        unread = conversations.get_unread_counts([chat["phone"] for chat in unique_chats], company)
+        for chat in unique_chats:
+            chat["unread"] = unread.get(chat["phone"], 0)
 
+        if version is not None:
+            return {"version": version, "chats": unique_chats}
         return unique_chats
 
     except Exception as e:
@@ -564,10 +624,96 @@ def get_recent_chats(limit: int = 50) -> List[Dict[str, Any]]:
             f"Error fetching recent chats: {str(e)}\n{frappe.get_traceback()}",
             "WhatsApp Recent Chats Error"
         )
-        return []
+        return {"version": None, "chats": []} if frappe.utils.cint(with_version) else []
+
+def format_chat_summary(m) -> Optional[Dict[str, Any]]:
+    """
+    Inbox entry for the last message `m` of a conversation, as shown by the chat
+    widget. Used both by get_recent_chats and the realtime inbox delta.
+    """
+    is_group = m.get("is_group_message") == 1
+
+    if is_group:
+        phone = m.group_id
+        display_name = m.group_name or f"Group: {m.group_id}"
+        last_msg_text = f"{m.sender_name}: {m.last_msg}" if m.sender != "Me" else f"You: {m.last_msg}"
+    else:
+        # Determine the other party's phone number
+        phone = m.receiver if m.sender == "Me" else m.sender
+        if not phone or phone == "Me":
+            return None
+
+        # Get display name
+        display_name = m.sender_name if m.sender != "Me" else None
+        last_msg_text = m.last_msg
+
+    # Clean phone number (leave group IDs as is)
+    if not is_group:
+        clean_phone = phone.split('@')[0].replace('+', '')
+    else:
+        clean_phone = phone
+
+    if not display_name and not is_group:
+        # Try to find contact by phone
+        contact = frappe.db.get_value(
+            "Contact",
+            {"mobile_no": ["like", f"%{clean_phone}%"]},
+            ["full_name", "name"],
+            as_dict=1
+        )
+        display_name = contact.full_name if contact else clean_phone
+
+    return {
+        "phone": clean_phone,
+        "sender_full_name": display_name,
+        "last_msg": last_msg_text[:100] if last_msg_text else "",  # Truncate long messages
+        "time": m.time,
+        "message_type": m.message_type,
+        "is_group": is_group
+    }
+
+INBOX_VERSION_KEY = "whatsapp_inbox_version"
+
+def get_inbox_version(company: str) -> int:
+    """Version of `company`'s inbox; bumped for every delta published to its widgets."""
+    cache = frappe.cache()
+    return int(cache.get(cache.make_key(f"{INBOX_VERSION_KEY}:{company}")) or 0)
+
+def next_inbox_version(company: str) -> int:
+    cache = frappe.cache()
+    return cache.incr(cache.make_key(f"{INBOX_VERSION_KEY}:{company}"))
+
+def publish_inbox_delta(wm, text: Optional[str] = None, sender_name: Optional[str] = None):
+    """
+    Tell the company's widgets about a new message. The payload carries the conversation's new
+    inbox entry and the inbox version, so widgets update their list in place and
+    only reload it when they missed a version.
+    """
+    chat = format_chat_summary(frappe._dict({
+        "sender": wm.sender,
+        "sender_name": wm.sender_name,
+        "last_msg": wm.message,
+        "time": wm.creation,
+        "receiver": wm.receiver,
+        "message_type": wm.message_type,
+        "is_group_message": wm.is_group_message,
+        "group_id": wm.group_id,
+        "group_name": wm.group_name
+    }))
+    realtime.publish("whatsapp_incoming_message", {
+        "from": wm.sender,
+        "text": text if text is not None else wm.message,
+        "sender_name": sender_name or wm.sender_name,
+        "media": wm.media_attachment if wm.media_attachment else None,
+        "message_id": wm.message_id,
+        "group_id": wm.group_id if wm.is_group_message else None,
+        "chat": chat,
+        "version": next_inbox_version(wm.company)
+    }, wm.company)
 
 @frappe.whitelist()
 @rate_limit(limit=60, seconds=60)
+@metrics.instrument("search_contacts")
 def search_contacts(query: str, limit: int = 20) -> List[Dict[str, Any]]:
     """
     Search for contacts and customers by name or phone number.
@@ -630,83 +776,92 @@ def search_contacts(query: str, limit: int = 20) -> List[Dict[str, Any]]:
         )
         return []
 
+CHAT_HISTORY_FIELDS = """
+    name,
+    modified,
+    sender,
+    sender_name,
+    receiver,
+    message,
+    creation,
+    message_type,
+    media_attachment,
+    message_id,
+    message_status,
+    reply_to_message_id,
+    reply_to_message_text,
+    is_group_message,
+    group_id,
+    group_name
+"""
+
+def get_conversation_condition(conversation: str) -> Optional[Tuple[str, Dict[str, Any]]]:
+    """
+    SQL condition and values selecting the messages of a contact or group.
+    Returns None if `conversation` is not a valid phone number or group ID.
+    """
+    if not conversation:
+        return None
+
+    # Check if this is a group ID (usually contains @ or is very long)
+    is_group_id = "-" in conversation or "@g.us" in conversation or len(conversation) > 15
+    if is_group_id:
+        return "group_id = %(search)s", {"search": conversation}
+
+    # Validate and clean phone number if it's not a group ID
+    search_term = validate_phone_number(conversation)
+    if not search_term:
+        return None
+    return (
+        "(sender LIKE %(search)s OR receiver LIKE %(search)s) "
+        "AND (is_group_message = 0 OR is_group_message IS NULL)",
+        {"search": f"%{search_term}%"}
+    )
+
 @frappe.whitelist()
 @rate_limit(limit=60, seconds=60)
-def get_chat_history(sender_phone: str, limit: int = 100, offset: int = 0) -> List[Dict[str, Any]]:
+@metrics.instrument("get_chat_history")
+def get_chat_history(sender_phone: str, limit: int = 100, offset: int = 0, before: Optional[str] = None) -> List[Dict[str, Any]]:
     """
     Get chat history with a specific contact or group.
+
+    With `before`, returns the `limit` messages preceding that "<creation>|<name>"
+    cursor (or the newest ones for an empty cursor), oldest first. The chat widget
+    uses this to load older pages while scrolling up, without OFFSET scans.
     """
     try:
-        if not sender_phone:
+        condition = get_conversation_condition(sender_phone)
+        if not condition:
             return []
-
-        # Check if this is a group ID (usually contains @ or is very long)
-        is_group_id = "-" in sender_phone or "@g.us" in sender_phone or len(sender_phone) > 15
-        
-        # Validate and clean phone number if it's not a group ID
-        if not is_group_id:
-            search_term = validate_phone_number(sender_phone)
-            if not search_term:
-                return []
-        else:
-            search_term = sender_phone
+        where, values = condition
 
         # Cap limits
         limit = min(int(limit), 500)
         offset = max(int(offset), 0)
 
-        if is_group_id:
-            # Query for group messages
-            messages = frappe.db.sql("""
-                SELECT
-                    sender,
-                    sender_name,
-                    receiver,
-                    message,
-                    creation,
-                    message_type,
-                    media_attachment,
-                    message_id,
-                    message_status,
-                    reply_to_message_id,
-                    reply_to_message_text,
-                    is_group_message,
-                    group_id,
-                    group_name
-                FROM `tabWhatsApp Message`
-                WHERE group_id = %(search)s
-                ORDER BY creation ASC
-                LIMIT %(limit)s OFFSET %(offset)s
-            """, {
-                "search": search_term,
-                "limit": limit,
-                "offset": offset
-            }, as_dict=1)
-        else:
-            # Query for individual messages
-            messages = frappe.db.sql("""
-                SELECT
-                    sender,
-                    sender_name,
-                    receiver,
-                    message,
-                    creation,
-                    message_type,
-                    media_attachment,
-                    message_id,
-                    message_status,
-                    reply_to_message_id,
-                    reply_to_message_text
+        if before is not None:
+            creation, _sep, name = before.partition("|")
+            if creation:
+                where += " AND (creation < %(creation)s OR (creation = %(creation)s AND name < %(name)s))"
+                values.update({"creation": creation, "name": name})
+
+            messages = frappe.db.sql(f"""
+                SELECT {CHAT_HISTORY_FIELDS}
                 FROM `tabWhatsApp Message`
-                WHERE (sender LIKE %(search)s OR receiver LIKE %(search)s)
-                AND (is_group_message = 0 OR is_group_message IS NULL)
-                ORDER BY creation ASC
-                LIMIT %(limit)s OFFSET %(offset)s
-            """, {
-                "search": f"%{search_term}%",
-                "limit": limit,
-                "offset": offset
-            }, as_dict=1)
+                WHERE {where}
+                ORDER BY creation DESC, name DESC
+                LIMIT %(limit)s
+            """, {**values, "limit": limit}, as_dict=1)
+            messages.reverse()
+            return messages
+
+        messages = frappe.db.sql(f"""
+            SELECT {CHAT_HISTORY_FIELDS}
+            FROM `tabWhatsApp Message`
+            WHERE {where}
+            ORDER BY creation ASC
+            LIMIT %(limit)s OFFSET %(offset)s
+        """, {**values, "limit": limit, "offset": offset}, as_dict=1)
 
         return messages
 
@@ -717,8 +872,65 @@ def get_chat_history(sender_phone: str, limit: int = 100, offset: int = 0) -> Li
         )
         return []
 
+SYNC_OVERLAP_SECONDS = 5
+
+@frappe.whitelist()
+@rate_limit(limit=120, seconds=60)
+@metrics.instrument("get_chat_history_since")
+def get_chat_history_since(
+    conversation: str, cursor: Optional[str] = None, limit: int = 200, overlap: bool = False
+) -> Dict[str, Any]:
+    """
+    Messages of a conversation created or changed (e.g. a new status) after
+    `cursor`, for the widget's local cache. The cursor is "<modified>|<name>" of
+    the last row seen; the response carries the next cursor and whether more
+    rows are waiting.
+
+    Webhook workers commit concurrently, so a row can become visible after the
+    cursor moved past its `modified`. With `overlap` (the first page of a sync)
+    the last SYNC_OVERLAP_SECONDS before the cursor are read again; the widget
+    merges rows by name, so re-read rows are harmless.
+    """
+    try:
+        condition = get_conversation_condition(conversation)
+        if not condition:
+            return {"messages": [], "cursor": cursor, "more": False}
+        where, values = condition
+
+        limit = min(int(limit), 500)
+        modified, _sep, name = (cursor or "").partition("|")
+        if modified and frappe.utils.cint(overlap):
+            where += " AND modified >= %(overlap_from)s"
+            values["overlap_from"] = frappe.utils.get_datetime(modified) - timedelta(seconds=SYNC_OVERLAP_SECONDS)
+        elif modified:
+            where += " AND (modified > %(modified)s OR (modified = %(modified)s AND name > %(name)s))"
+            values.update({"modified": modified, "name": name})
+
+        messages = frappe.db.sql(f"""
+            SELECT {CHAT_HISTORY_FIELDS}
+            FROM `tabWhatsApp Message`
+            WHERE {where}
+            ORDER BY modified ASC, name ASC
+            LIMIT %(limit)s
+        """, {**values, "limit": limit + 1}, as_dict=1)
+
+        more = len(messages) > limit
+        messages = messages[:limit]
+        if messages:
+            cursor = f"{messages[-1].modified}|{messages[-1].name}"
+
+        return {"messages": messages, "cursor": cursor, "more": more}
+
+    except Exception as e:
+        frappe.log_error(
+            f"Error fetching chat history changes: {str(e)}\n{frappe.get_traceback()}",
+            "WhatsApp Chat History Error"
+        )
+        return {"messages": [], "cursor": cursor, "more": False, "error": str(e)}
+
 @frappe.whitelist()
 @rate_limit(limit=60, seconds=60)
+@metrics.instrument("send_chat_message")
 def send_chat_message(message: str, receiver: str, company: Optional[str] = None, media: Optional[Dict] = None) -> Dict[str, Any]:
     """
     Send a WhatsApp message to a contact.
@@ -733,6 +945,10 @@ def send_chat_message(message: str, receiver: str, company: Optional[str] = None
             except (json.JSONDecodeError, ValueError):
                 frappe.log_error(f"Invalid media JSON: {media[:100]}", "WhatsApp Media Parse Error")
                 return {"status": "error", "error": "Invalid media format"}
+        if media:
+            if not isinstance(media, dict):
+                return {"status": "error", "error": "Invalid media format"}
+            media = strip_media_references(media)
 
         # Validate inputs
         if not message or not receiver:
@@ -795,8 +1011,11 @@ def send_chat_message(message: str, receiver: str, company: Optional[str] = None
             "WhatsApp Send Message Error"
         )
         return {"status": "error", "error": str(e)}
+    finally:
+        discard_outgoing_media(media)
 
 @frappe.whitelist()
+@metrics.instrument("get_group_metadata")
 def get_group_metadata(group_id, company=None):
     """
     Fetch group info and participants from Node.js service.
@@ -818,7 +1037,7 @@ def get_group_metadata(group_id, company=None):
         node_url = settings.node_url or "http://127.0.0.1:3000"
         session_id = settings.name.replace(" ", "_")
         
-        response = requests.post(f"{node_url}/sessions/group-metadata", json={
+        response = metrics.node_request("POST", f"{node_url}/sessions/group-metadata", "/sessions/group-metadata", json={
             "sessionId": session_id,
             "groupId": group_id
         }, timeout=10)
@@ -826,26 +1045,34 @@ def get_group_metadata(group_id, company=None):
         
         # Enrich participants with names from Frappe
         if result.get("status") == "success" and "metadata" in result:
-            participants = result["metadata"].get("participants", [])
-            for p in participants:
-                phone = p.get("phone")
-                if not phone: continue
-                
-                # 1. Try to find name in Contacts
-                name = frappe.db.get_value("Contact", {"mobile_no": ["like", f"%{phone}%"]}, "full_name")
-                
-                # 2. Try to find name in WhatsApp Message history
-                if not name:
-                    name = frappe.db.get_value("WhatsApp Message", {"sender": phone}, "sender_name")
-                
-                if name:
-                    p["name"] = name
-                    
+            enrich_group_participants(result["metadata"].get("participants", []))
+
         return result
     except Exception as e:
         frappe.log_error(f"Error fetching group metadata: {str(e)}\n{frappe.get_traceback()}", "WhatsApp Group Metadata Error")
         return {"status": "error", "error": str(e)}
 
+def enrich_group_participants(participants: List[Dict[str, Any]]) -> List[Dict[str, Any]]:
+    """
+    Add display names from Contacts (or message history) to group participants.
+    Participants are updated in place and also returned.
+    """
+    for p in participants:
+        phone = p.get("phone")
+        if not phone: continue
+
+        # 1. Try to find name in Contacts
+        name = frappe.db.get_value("Contact", {"mobile_no": ["like", f"%{phone}%"]}, "full_name")
+
+        # 2. Try to find name in WhatsApp Message history
+        if not name:
+            name = frappe.db.get_value("WhatsApp Message", {"sender": phone}, "sender_name")
+
+        if name:
+            p["name"] = name
+
+    return participants
+
 # ============================================================================
 # MESSAGE HANDLING
 # ============================================================================
@@ -861,12 +1088,22 @@ def save_whatsapp_msg(
     is_group: bool = False,
     group_id: Optional[str] = None,
     group_name: Optional[str] = None,
-    reply_to: Optional[Dict] = None
+    reply_to: Optional[Dict] = None,
+    settings=None,
+    parties: Optional[Dict[str, Any]] = None,
+    remote_jid: Optional[str] = None,
+    participant_jid: Optional[str] = None
 ):
     """
     Save a WhatsApp message to database.
-    Handles deduplication, contact linking, and media attachments.
+    Handles deduplication, contact and customer linking, and media attachments.
     Automatically detects group messages if ID looks like a group.
+    Media is either inline base64 (`data`), a File build_outgoing_media saved in
+    this request (`file`), or a file spooled by the Node bridge (`ref`), which needs
+    the WhatsApp Settings of the session in `settings`. `parties` is a
+    party_index.lookup result covering the number, if the caller has one.
+    `remote_jid` and `participant_jid` make up the WhatsApp message key of
+    incoming messages, used to send read receipts.
     """
     try:
         # Detect group message automatically if group ID looks group-y
@@ -944,21 +1181,13 @@ def save_whatsapp_msg(
             frappe.logger().warning(f"Invalid phone number: {phone}")
             return None
 
-        # Resolve contact if we have a sender name
-        contact_name = None
-        if sender_name and msg_type == "Incoming":
-            contact_name = frappe.db.get_value(
-                "Contact",
-                {"full_name": ["like", f"%{sender_name}%"]},
-                "name"
-            )
-            if not contact_name:
-                # Try by phone number
-                contact_name = frappe.db.get_value(
-                    "Contact",
-                    {"mobile_no": ["like", f"%{real_phone}%"]},
-                    "name"
-                )
+        # Link Contact and Customer through the phone -> party index
+        party = None
+        if not is_group:
+            key = party_index.phone_key(real_phone)
+            if parties is None or key not in parties:
+                parties = party_index.lookup([real_phone])
+            party = parties.get(key)
 
         # Create message document
         wm = frappe.new_doc("WhatsApp Message")
@@ -966,6 +1195,8 @@ def save_whatsapp_msg(
         wm.message = sanitize_message(text) if text else ""
         wm.message_type = msg_type
         wm.message_id = msg_id
+        wm.remote_jid = remote_jid
+        wm.participant_jid = participant_jid
         # Set initial status
         # Outgoing: Sent (will update to Delivered/Read via receipts)
         # Incoming: Already delivered to us
@@ -991,14 +1222,29 @@ def save_whatsapp_msg(
             wm.sender_name = frappe.session.user
             wm.receiver = real_phone
 
-        # Link to contact if found
-        if contact_name:
-            wm.contact = contact_name
+        if party:
+            wm.contact = party["contact"]
+            wm.customer = party["customer"]
 
         wm.insert(ignore_permissions=True)
 
+        if msg_type == "Incoming":
+            conversations.record_incoming(group_id if is_group else real_phone, company, is_group)
+
         # Handle media attachments
-        if media and media.get("data"):
+        outgoing_file = get_outgoing_media_file(media)
+        if media and media.get("ref") and settings:
+            try:
+                wm.db_set("media_attachment", save_spooled_media(settings, media, wm.name))
+            except Exception as e:
+                frappe.log_error(
+                    f"Error fetching spooled media {media.get('ref')}: {str(e)}\n{frappe.get_traceback()}",
+                    "WhatsApp Media Error"
+                )
+        elif outgoing_file:
+            outgoing_file.db_set("attached_to_name", wm.name)
+            wm.db_set("media_attachment", outgoing_file.file_url)
+        elif media and media.get("data"):
             try:
                 from frappe.utils.file_manager import save_file
                 import base64
@@ -1027,16 +1273,20 @@ def save_whatsapp_msg(
         return wm
 
     except Exception as e:
+        # The bridge redelivers incoming messages when the webhook fails
+        if msg_type == "Incoming" and isinstance(e, TRANSIENT_DB_ERRORS):
+            raise
         frappe.log_error(
             f"Error saving WhatsApp message: {str(e)}\n{frappe.get_traceback()}",
             "WhatsApp Message Save Error"
         )
         return None
 
-def handle_incoming_message(settings_doc, msg: Dict[str, Any]):
+def handle_incoming_message(settings_doc, msg: Dict[str, Any], parties: Optional[Dict[str, Any]] = None):
     """
     Process incoming WhatsApp message from webhook.
     Creates message record and handles media attachments.
+    `parties` is the batch's party_index.lookup result, if already done.
     """
     try:
         msg_id = msg.get("id")
@@ -1070,13 +1320,19 @@ def handle_incoming_message(settings_doc, msg: Dict[str, Any]):
             is_group=is_group,
             group_id=group_id,
             group_name=group_name,
-            reply_to=reply_to
+            reply_to=reply_to,
+            settings=settings_doc,
+            parties=parties,
+            remote_jid=msg.get("remoteJid"),
+            participant_jid=msg.get("participant")
         )
 
         frappe.db.commit()
         return wm
 
     except Exception as e:
+        if isinstance(e, TRANSIENT_DB_ERRORS):
+            raise
         frappe.log_error(
             f"Error handling incoming message: {str(e)}\n{frappe.get_traceback()}",
             "WhatsApp Incoming Message Error"
@@ -1095,8 +1351,6 @@ def send_print_as_pdf(doctype: str, name: str, print_format: Optional[str] = Non
     Automatically resolves recipient phone number from document.
     """
     try:
-        import base64
-
         # Validate permissions
         if not frappe.has_permission(doctype, "read", name):
             frappe.throw(_("You don't have permission to access this document"))
@@ -1146,15 +1400,11 @@ def send_print_as_pdf(doctype: str, name: str, print_format: Optional[str] = Non
             frappe.throw(_("Invalid mobile number found: {0}").format(receiver))
 
         # Prepare media attachment
+        company = getattr(doc, 'company', None)
         safe_filename = re.sub(r'[^\w\s.-]', '_', name)
-        media = {
-            "data": base64.b64encode(pdf_content).decode('utf-8'),
-            "filename": f"{safe_filename}.pdf",
-            "mimetype": "application/pdf"
-        }
+        media = build_outgoing_media(pdf_content, f"{safe_filename}.pdf", "application/pdf", company)
 
         # Prepare message
-        company = getattr(doc, 'company', None)
         doc_label = _(doctype)
         message = _(f"Hello, please find the attached PDF for {doc_label}: {name}")
 
@@ -1178,6 +1428,133 @@ def send_print_as_pdf(doctype: str, name: str, print_format: Optional[str] = Non
 # MEDIA & FILE HANDLING
 # ============================================================================
 
+MEDIA_CHUNK_SIZE = 1024 * 1024
+
+def save_spooled_media(settings, media: Dict[str, Any], message_name: str) -> str:
+    """
+    Stream a media file spooled by the Node bridge into the public files folder,
+    attach it to the message and return its URL. The file is never held in memory
+    as a whole; the bridge deletes its copy once the message is committed.
+    """
+    node_url = settings.node_url or "http://127.0.0.1:3000"
+    session_id = settings.name.replace(" ", "_")
+    media_url = f"{node_url}/media/{quote(session_id, safe='')}/{quote(media['ref'], safe='')}"
+    headers = {"X-Webhook-Token": settings.get_password("webhook_token")}
+
+    # Ensure safe, unique filename
+    file_name = re.sub(r'[^\w\s.-]', '', media.get("filename") or "").strip()
+    file_name = file_name or f"whatsapp_{frappe.generate_hash(length=8)}"
+    files_path = frappe.get_site_path("public", "files")
+    if os.path.exists(os.path.join(files_path, file_name)):
+        file_name = f"{frappe.generate_hash(length=8)}_{file_name}"
+    file_path = os.path.join(files_path, file_name)
+
+    response = metrics.node_request(
+        "GET", media_url, "/media/:sessionId/:id", headers=headers, stream=True, timeout=60
+    )
+    response.raise_for_status()
+
+    size = 0
+    tmp_path = f"{file_path}.part"
+    try:
+        with open(tmp_path, "wb") as f:
+            for chunk in response.iter_content(chunk_size=MEDIA_CHUNK_SIZE):
+                f.write(chunk)
+                size += len(chunk)
+        os.replace(tmp_path, file_path)
+    finally:
+        response.close()
+        if os.path.exists(tmp_path):
+            os.remove(tmp_path)
+
+    file_doc = frappe.get_doc({
+        "doctype": "File",
+        "file_name": file_name,
+        "file_url": f"/files/{file_name}",
+        "attached_to_doctype": "WhatsApp Message",
+        "attached_to_name": message_name,
+        "file_size": size,
+        "is_private": 0
+    })
+    file_doc.insert(ignore_permissions=True)
+
+    frappe.db.after_commit.add(lambda: release_spooled_media(media_url, headers))
+    return file_doc.file_url
+
+def release_spooled_media(media_url: str, headers: Dict[str, str]):
+    """Tell the bridge a spooled file was stored; leftovers expire on the bridge anyway."""
+    try:
+        metrics.node_request("DELETE", media_url, "/media/:sessionId/:id", headers=headers, timeout=5)
+    except Exception:
+        frappe.logger().debug(f"Could not release spooled media {media_url}", exc_info=True)
+
+def build_outgoing_media(content: bytes, filename: str, mimetype: str, company: Optional[str] = None) -> Dict[str, Any]:
+    """
+    Build the media payload for /sessions/send.
+    If the company's WhatsApp Settings have "Send Files by Path" enabled, the content
+    is saved as a private File and the Node bridge reads it from disk; otherwise it
+    is sent inline as base64.
+    """
+    import base64
+    from frappe.utils.file_manager import save_file
+
+    company = company or get_default_company()
+    by_path = frappe.db.get_value(
+        "WhatsApp Settings",
+        {"company": company, "integration_enabled": 1},
+        "send_files_by_path"
+    )
+    if not by_path:
+        return {
+            "data": base64.b64encode(content).decode('utf-8'),
+            "filename": filename,
+            "mimetype": mimetype
+        }
+
+    saved_file = save_file(filename, content, "WhatsApp Message", None, decode=False, is_private=1)
+    # Only Files saved here, in this request, may be sent or attached by reference
+    frappe.flags.whatsapp_outgoing_files = (frappe.flags.whatsapp_outgoing_files or set()) | {saved_file.name}
+    return {
+        "path": os.path.abspath(saved_file.get_full_path()),
+        "file_url": saved_file.file_url,
+        "file": saved_file.name,
+        "filename": filename,
+        "mimetype": mimetype
+    }
+
+def get_outgoing_media_file(media: Optional[Dict[str, Any]]):
+    """
+    The unattached File `build_outgoing_media` saved for `media` in this request,
+    or None. `path`, `file` and `file_url` of any other media dict come from the
+    caller and must not be trusted.
+    """
+    name = (media or {}).get("file")
+    if not name or name not in (frappe.flags.whatsapp_outgoing_files or ()):
+        return None
+    file_doc = frappe.get_doc("File", name)
+    if file_doc.attached_to_doctype != "WhatsApp Message" or file_doc.attached_to_name:
+        return None
+    return file_doc
+
+def discard_outgoing_media(media: Optional[Dict[str, Any]]):
+    """Delete the File build_outgoing_media saved for `media` if no message was attached to it, i.e. the send failed."""
+    try:
+        file_doc = get_outgoing_media_file(media) if isinstance(media, dict) else None
+        if file_doc:
+            file_doc.delete(ignore_permissions=True)
+            frappe.flags.whatsapp_outgoing_files.discard(file_doc.name)
+    except Exception as e:
+        frappe.log_error(
+            f"Error deleting unsent media file: {str(e)}\n{frappe.get_traceback()}",
+            "WhatsApp Media Error"
+        )
+
+def strip_media_references(media: Dict[str, Any]) -> Dict[str, Any]:
+    """Drop file references from a media dict that was not built by build_outgoing_media."""
+    if get_outgoing_media_file(media):
+        return media
+    return {key: value for key, value in media.items() if key not in ("path", "file", "file_url", "ref")}
+
 @frappe.whitelist()
 @rate_limit(limit=30, seconds=60)
 def upload_media(file_data: str, filename: str, mimetype: str) -> Dict[str, Any]:
@@ -1280,11 +1657,12 @@ def send_voice_note(audio_data: str, receiver: str, company: Optional[str] = Non
             extension = "webm"
 
         # Prepare media object
-        media = {
-            "data": audio_data,
-            "filename": f"voice_note_{frappe.generate_hash(length=8)}.{extension}",
-            "mimetype": mimetype
-        }
+        media = build_outgoing_media(
+            audio_bytes,
+            f"voice_note_{frappe.generate_hash(length=8)}.{extension}",
+            mimetype,
+            company
+        )
 
         # Send via WhatsApp with voice message indicator
         result = send_chat_message(
@@ -1304,10 +1682,42 @@ def send_voice_note(audio_data: str, receiver: str, company: Optional[str] = Non
         return {"status": "error", "error": str(e)}
 
 @frappe.whitelist()
-def get_contact_info(phone: str) -> Dict[str, Any]:
+@rate_limit(limit=120, seconds=60)
+@metrics.instrument("mark_conversation_read")
+def mark_conversation_read(conversation: str, company: Optional[str] = None) -> Dict[str, Any]:
+    """
+    Reset the current user's unread count of a contact or group in `company`
+    (default: the user's default company) and send read receipts to WhatsApp,
+    through that company's session, for the messages that were unread.
+    """
+    try:
+        if not frappe.has_permission("WhatsApp Message", "read"):
+            frappe.throw(_("Not permitted"), frappe.PermissionError)
+
+        is_group_id = "-" in conversation or "@g.us" in conversation or len(conversation) > 15
+        conversation = conversation if is_group_id else validate_phone_number(conversation)
+        if not conversation:
+            return {"status": "error", "error": "Invalid phone number"}
+
+        return conversations.mark_read(conversation, company or get_default_company())
+    except frappe.PermissionError:
+        raise
+    except Exception as e:
+        frappe.log_error(
+            f"Error marking conversation read: {str(e)}\n{frappe.get_traceback()}",
+            "WhatsApp Read Receipt Error"
+        )
+        return {"status": "error", "error": str(e)}
+
+@frappe.whitelist()
+@metrics.instrument("get_contact_info")
+def get_contact_info(phone: str, refresh: bool = False) -> Dict[str, Any]:
     """
     Get contact information including profile picture and status.
+    Served from WhatsApp Contact Profile when cached; pass `refresh` to bypass the caches.
     """
+    from whatsapp_integration.whatsapp_integration import contact_profile
+
     try:
         # Validate phone number
         phone = validate_phone_number(phone)
@@ -1325,28 +1735,9 @@ def get_contact_info(phone: str) -> Dict[str, Any]:
             return {"status": "error", "error": "WhatsApp not configured"}
 
         doc = frappe.get_doc("WhatsApp Settings", settings_name)
-        node_url = doc.node_url or "http://127.0.0.1:3000"
-        session_id = doc.name.replace(" ", "_")
-
-        # Request contact info from Node service
-        response = requests.post(
-            f"{node_url}/sessions/contact-info",
-            json={
-                "sessionId": session_id,
-                "phone": phone
-            },
-            timeout=10
-        )
-
-        # Check if response is valid JSON
-        try:
-            return response.json()
-        except ValueError:
-            frappe.log_error(
-                f"Node service returned invalid JSON. Status: {response.status_code}, Body: {response.text[:200]}",
-                "WhatsApp Contact Info Invalid Response"
-            )
-            return {"status": "error", "error": f"Invalid response from Node service (status {response.status_code})"}
+        if frappe.utils.cint(refresh):
+            return contact_profile.fetch_profile(doc, phone, refresh=True)
+        return contact_profile.get_profile(doc, phone)
 
     except Exception as e:
         frappe.log_error(
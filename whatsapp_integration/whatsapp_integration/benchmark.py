@@ -0,0 +1,407 @@
+"""
+Read-path benchmark for the WhatsApp inbox.
+
+Seeds `tabWhatsApp Message`, Contact and Customer with reproducible synthetic
+data and times the queries behind the chat widget, capturing EXPLAIN plans so
+query-plan regressions show up as numbers.
+
+Usage:
+    bench --site mysite execute whatsapp_integration.whatsapp_integration.benchmark.seed --kwargs "{'messages': 1000000}"
+    bench --site mysite execute whatsapp_integration.whatsapp_integration.benchmark.run --kwargs "{'output': '/tmp/wa_bench.json'}"
+    bench --site mysite execute whatsapp_integration.whatsapp_integration.benchmark.clear
+
+Never run this against a production site: seeding writes millions of rows.
+"""
+
+import json
+import random
+import statistics
+import time
+from datetime import timedelta
+from typing import Any, Callable, Dict, List, Optional
+
+import frappe
+
+from whatsapp_integration.whatsapp_integration.metrics import capture_queries
+
+# Every seeded row carries this prefix so `clear` can remove it again
+SEED_PREFIX = "WABENCH"
+
+# Names used for the synthetic contacts, combined with a counter to stay unique
+FIRST_NAMES = [
+    "Aarav", "Priya", "Rahul", "Sneha", "Vikram", "Anjali", "Rohan", "Kavya",
+    "Arjun", "Meera", "John", "Maria", "Ahmed", "Fatima", "Chen", "Olga"
+]
+LAST_NAMES = [
+    "Sharma", "Patel", "Kumbhar", "Iyer", "Khan", "Singh", "Smith", "Garcia",
+    "Nair", "Joshi", "Silva", "Müller", "Wang", "Ivanova", "Das", "Rao"
+]
+SAMPLE_TEXTS = [
+    "Hi, is my order shipped?",
+    "Please share the invoice",
+    "Thanks!",
+    "Can you call me back?",
+    "What is the price for 20 units?",
+    "Payment done, please check",
+    "Ok",
+    "Noted, will update by evening",
+    "Sending the PO now",
+    "Is the delivery scheduled for tomorrow?"
+]
+
+
+# ============================================================================
+# QUERY PLANS
+# ============================================================================
+
+def explain(query: str, values=()) -> List[Dict[str, Any]]:
+    """Return the EXPLAIN plan for a SELECT (or CTE) query, empty list otherwise."""
+    statement = query.strip().lower()
+    if not (statement.startswith("select") or statement.startswith("with")):
+        return []
+    try:
+        return frappe.db.sql(f"EXPLAIN {query}", values, as_dict=1)
+    except Exception as e:
+        return [{"error": str(e)}]
+
+
+# ============================================================================
+# DATA GENERATOR
+# ============================================================================
+
+def seed(
+    messages: int = 10000,
+    conversations: Optional[int] = None,
+    group_ratio: float = 0.1,
+    lid_ratio: float = 0.05,
+    contact_ratio: float = 0.6,
+    customer_ratio: float = 0.3,
+    outgoing_ratio: float = 0.4,
+    skew: float = 1.1,
+    days: int = 365,
+    company: Optional[str] = None,
+    random_seed: int = 42,
+    batch_size: int = 5000
+) -> Dict[str, int]:
+    """
+    Seed synthetic WhatsApp data.
+
+    Messages are spread over `conversations` chats following a Zipf-like
+    distribution (a few very busy chats, a long tail of quiet ones).
+    A share of chats are groups, a share of senders appear only as LIDs,
+    and a share of individual chats have a matching Contact and Customer.
+    """
+    from whatsapp_integration.whatsapp_integration.api import get_default_company
+
+    messages = int(messages)
+    batch_size = int(batch_size)
+    conversations = int(conversations or min(max(messages // 50, 10), 200000))
+    company = company or get_default_company()
+    rng = random.Random(int(random_seed))
+
+    chats = _build_conversations(rng, conversations, float(group_ratio), float(lid_ratio))
+    contacts, customers = _seed_parties(rng, chats, float(contact_ratio), float(customer_ratio))
+
+    # Zipf-like weights: chat i gets weight 1 / (i + 1) ** skew
+    cum_weights = []
+    total = 0.0
+    for i in range(len(chats)):
+        total += 1.0 / ((i + 1) ** float(skew))
+        cum_weights.append(total)
+
+    fields = [
+        "name", "creation", "modified", "owner", "modified_by",
+        "sender", "sender_name", "receiver", "message", "message_id",
+        "message_type", "message_status", "is_group_message", "group_id",
+        "group_name", "company", "contact"
+    ]
+    start = frappe.utils.now_datetime() - timedelta(days=int(days))
+    step_seconds = (int(days) * 86400) / max(messages, 1)
+    seeded = 0
+
+    while seeded < messages:
+        count = min(batch_size, messages - seeded)
+        picks = rng.choices(chats, cum_weights=cum_weights, k=count)
+        rows = []
+
+        for offset, chat in enumerate(picks):
+            index = seeded + offset
+            ts = start + timedelta(seconds=index * step_seconds)
+            rows.append(_message_row(rng, chat, index, ts, company, float(outgoing_ratio)))
+
+        frappe.db.bulk_insert("WhatsApp Message", fields, rows, ignore_duplicates=True)
+        frappe.db.commit()
+        seeded += count
+        print(f"Seeded {seeded}/{messages} messages")
+
+    return {
+        "messages": seeded,
+        "conversations": len(chats),
+        "groups": sum(1 for c in chats if c["kind"] == "group"),
+        "contacts": contacts,
+        "customers": customers
+    }
+
+def clear() -> Dict[str, int]:
+    """Delete all rows created by `seed`, and the index and counter rows built for them."""
+    pattern = f"{SEED_PREFIX}%"
+    counts = {}
+
+    # Unread counters of the seeded chats, found through the seeded messages (deleted below)
+    seeded_counters = """
+        JOIN `tabWhatsApp Conversation` c ON c.name = {counter}
+        JOIN (
+            SELECT DISTINCT company, IF(is_group_message = 1, group_id, sender) AS conversation
+            FROM `tabWhatsApp Message`
+            WHERE message_id LIKE %(pattern)s AND message_type = 'Incoming'
+        ) s ON s.company = c.company AND s.conversation = c.conversation
+    """
+    for doctype, counter in (("WhatsApp Conversation Read", "t.conversation"), ("WhatsApp Conversation", "t.name")):
+        joins = seeded_counters.format(counter=counter)
+        counts[doctype] = frappe.db.sql(
+            f"SELECT COUNT(*) FROM `tab{doctype}` t {joins}", {"pattern": pattern}
+        )[0][0]
+        frappe.db.sql(f"DELETE t FROM `tab{doctype}` t {joins}", {"pattern": pattern})
+
+    # Index rows built for the seeded Contacts and Customers
+    party_condition = "contact LIKE %(pattern)s OR customer LIKE %(pattern)s"
+    counts["WhatsApp Party Phone"] = frappe.db.sql(
+        f"SELECT COUNT(*) FROM `tabWhatsApp Party Phone` WHERE {party_condition}", {"pattern": pattern}
+    )[0][0]
+    frappe.db.sql(f"DELETE FROM `tabWhatsApp Party Phone` WHERE {party_condition}", {"pattern": pattern})
+
+    for doctype, field in (
+        ("WhatsApp Message", "message_id"),
+        ("Dynamic Link", "name"),
+        ("Contact", "name"),
+        ("Customer", "name")
+    ):
+        counts[doctype] = frappe.db.count(doctype, {field: ["like", pattern]})
+        frappe.db.sql(f"DELETE FROM `tab{doctype}` WHERE `{field}` LIKE %s", (pattern,))
+    frappe.db.commit()
+    return counts
+
+def _build_conversations(rng: random.Random, count: int, group_ratio: float, lid_ratio: float) -> List[Dict[str, Any]]:
+    chats = []
+    for i in range(count):
+        roll = rng.random()
+        if roll < group_ratio:
+            members = [_phone(rng) for _ in range(rng.randint(3, 120))]
+            chats.append({
+                "kind": "group",
+                "key": f"1203630{rng.randrange(10**11, 10**12)}",
+                "name": f"{rng.choice(LAST_NAMES)} Team {i}",
+                "members": members
+            })
+        elif roll < group_ratio + lid_ratio:
+            chats.append({
+                "kind": "lid",
+                "key": str(rng.randrange(10**14, 10**15)),
+                "name": f"{rng.choice(FIRST_NAMES)} {rng.choice(LAST_NAMES)} {i}"
+            })
+        else:
+            chats.append({
+                "kind": "individual",
+                "key": _phone(rng),
+                "name": f"{rng.choice(FIRST_NAMES)} {rng.choice(LAST_NAMES)} {i}"
+            })
+    return chats
+
+def _seed_parties(rng: random.Random, chats: List[Dict[str, Any]], contact_ratio: float, customer_ratio: float):
+    now = frappe.utils.now()
+    contact_rows, link_rows, customer_rows = [], [], []
+
+    for i, chat in enumerate(chats):
+        if chat["kind"] != "individual" or rng.random() >= contact_ratio:
+            continue
+
+        contact_name = f"{SEED_PREFIX}-CONTACT-{i}"
+        chat["contact"] = contact_name
+        contact_rows.append((
+            contact_name, now, now, "Administrator", "Administrator",
+            chat["name"].split(" ")[0], chat["name"], chat["key"], 1
+        ))
+
+        if rng.random() < customer_ratio / max(contact_ratio, 0.01):
+            customer_name = f"{SEED_PREFIX}-CUSTOMER-{i}"
+            customer_rows.append((
+                customer_name, now, now, "Administrator", "Administrator",
+                chat["name"], chat["key"], "Individual"
+            ))
+            link_rows.append((
+                f"{SEED_PREFIX}-LINK-{i}", now, now, "Administrator", "Administrator",
+                contact_name, "Contact", "links", "Customer", customer_name, chat["name"]
+            ))
+
+    frappe.db.bulk_insert(
+        "Contact",
+        ["name", "creation", "modified", "owner", "modified_by", "first_name", "full_name", "mobile_no", "is_primary_contact"],
+        contact_rows,
+        ignore_duplicates=True
+    )
+    frappe.db.bulk_insert(
+        "Customer",
+        ["name", "creation", "modified", "owner", "modified_by", "customer_name", "mobile_no", "customer_type"],
+        customer_rows,
+        ignore_duplicates=True
+    )
+    frappe.db.bulk_insert(
+        "Dynamic Link",
+        ["name", "creation", "modified", "owner", "modified_by", "parent", "parenttype", "parentfield", "link_doctype", "link_name", "link_title"],
+        link_rows,
+        ignore_duplicates=True
+    )
+    frappe.db.commit()
+    return len(contact_rows), len(customer_rows)
+
+def _message_row(rng: random.Random, chat: Dict[str, Any], index: int, ts, company: str, outgoing_ratio: float):
+    outgoing = rng.random() < outgoing_ratio
+    text = rng.choice(SAMPLE_TEXTS)
+    name = f"{SEED_PREFIX}{index:010d}"
+
+    if chat["kind"] == "group":
+        sender = "Me" if outgoing else rng.choice(chat["members"])
+        sender_name = "Administrator" if outgoing else f"{rng.choice(FIRST_NAMES)} {sender[-4:]}"
+        receiver = chat["key"] if outgoing else "Me"
+        group = (1, chat["key"], chat["name"])
+    else:
+        sender = "Me" if outgoing else chat["key"]
+        sender_name = "Administrator" if outgoing else chat["name"]
+        receiver = chat["key"] if outgoing else "Me"
+        group = (0, None, None)
+
+    return (
+        name, ts, ts, "Administrator", "Administrator",
+        sender, sender_name, receiver, text, name,
+        "Outgoing" if outgoing else "Incoming",
+        rng.choice(["Sent", "Delivered", "Read"]) if outgoing else None,
+        *group, company, chat.get("contact")
+    )
+
+def _phone(rng: random.Random) -> str:
+    return f"91{rng.randrange(7000000000, 9999999999)}"
+
+
+# ============================================================================
+# BENCHMARK RUNNER
+# ============================================================================
+
+def run(repeat: int = 5, with_explain: bool = True, output: Optional[str] = None) -> Dict[str, Any]:
+    """
+    Time the inbox read paths against the current data set.
+
+    For every case the runner records min/median/p95/max latency in ms, the
+    number of SQL queries issued, and (optionally) EXPLAIN plans of the
+    SELECTs from the first run. Results are printed and, if `output` is given,
+    written there as JSON so runs can be diffed.
+    """
+    from whatsapp_integration.whatsapp_integration import api
+
+    repeat = max(int(repeat), 1)
+    cases = _benchmark_cases(api)
+    results = {
+        "site": frappe.local.site,
+        "timestamp": frappe.utils.now(),
+        "message_count": frappe.db.count("WhatsApp Message"),
+        "cases": {}
+    }
+
+    for label, fn in cases:
+        results["cases"][label] = _time_case(fn, repeat, with_explain)
+        stats = results["cases"][label]
+        print(
+            f"{label:<40} median {stats['median_ms']:>9.2f} ms  "
+            f"p95 {stats['p95_ms']:>9.2f} ms  queries {stats['queries']:>5}"
+        )
+
+    if output:
+        with open(output, "w") as f:
+            json.dump(results, f, indent=2, default=str)
+        print(f"Results written to {output}")
+
+    return results
+
+def _benchmark_cases(api) -> List[tuple]:
+    cases = [
+        ("get_recent_chats", lambda: api.get_recent_chats(limit=50)),
+        ("search_contacts (name)", lambda: api.search_contacts("Sharma")),
+        ("search_contacts (phone)", lambda: api.search_contacts("98765"))
+    ]
+
+    # Busiest individual chat and busiest group drive the pagination cases
+    chat = frappe.db.sql("""
+        SELECT sender AS chat, COUNT(*) AS total
+        FROM `tabWhatsApp Message`
+        WHERE is_group_message = 0 AND sender != 'Me'
+        GROUP BY sender
+        ORDER BY total DESC
+        LIMIT 1
+    """, as_dict=1)
+    group = frappe.db.sql("""
+        SELECT group_id AS chat, COUNT(*) AS total
+        FROM `tabWhatsApp Message`
+        WHERE is_group_message = 1
+        GROUP BY group_id
+        ORDER BY total DESC
+        LIMIT 1
+    """, as_dict=1)
+
+    for kind, row in (("chat", chat), ("group", group)):
+        if not row:
+            continue
+        key, total = row[0].chat, row[0].total
+        for page, offset in (("first", 0), ("middle", total // 2), ("deep", max(total - 100, 0))):
+            cases.append((
+                f"get_chat_history ({kind}, {page} page)",
+                lambda key=key, offset=offset: api.get_chat_history(key, limit=100, offset=offset)
+            ))
+
+    if group:
+        members = frappe.db.sql_list("""
+            SELECT DISTINCT sender
+            FROM `tabWhatsApp Message`
+            WHERE group_id = %s AND sender != 'Me'
+            LIMIT 256
+        """, (group[0].chat,))
+        cases.append((
+            "get_group_metadata enrichment",
+            lambda: api.enrich_group_participants([{"phone": m} for m in members])
+        ))
+
+    return cases
+
+def _time_case(fn: Callable, repeat: int, with_explain: bool) -> Dict[str, Any]:
+    timings = []
+    queries = []
+
+    for i in range(repeat):
+        with capture_queries() as captured:
+            started = time.perf_counter()
+            fn()
+            timings.append((time.perf_counter() - started) * 1000)
+        if i == 0:
+            queries = captured
+
+    timings.sort()
+    stats = {
+        "runs": repeat,
+        "min_ms": timings[0],
+        "median_ms": statistics.median(timings),
+        "p95_ms": timings[min(int(round(0.95 * (repeat - 1))), repeat - 1)],
+        "max_ms": timings[-1],
+        "queries": len(queries)
+    }
+
+    if with_explain:
+        plans = []
+        seen = set()
+        for query, values in queries:
+            if query in seen:
+                continue
+            seen.add(query)
+            plan = explain(query, values)
+            if plan:
+                plans.append({"query": " ".join(query.split()), "plan": plan})
+        stats["explain"] = plans
+
+    return stats
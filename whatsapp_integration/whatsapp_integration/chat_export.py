@@ -0,0 +1,235 @@
+"""
+Streaming export of chat history for compliance requests.
+
+`enqueue_export` starts a background job that writes the messages of a
+conversation, a customer and/or a date range to CSV, JSONL or ZIP (a CSV plus,
+optionally, the media files). Rows are read in keyset chunks of EXPORT_CHUNK_SIZE
+on (creation, name) and written straight to the file, so memory use does not
+grow with the size of the export. The result is a private File owned by the
+requesting user. Progress and the final file URL are published to that user as
+`whatsapp_export_progress` realtime events.
+"""
+
+import csv
+import json
+import os
+import zipfile
+from typing import Any, Dict, Iterator, List, Optional, Tuple
+
+import frappe
+from frappe import _
+from frappe.utils import get_datetime, getdate, add_days
+
+EXPORT_CHUNK_SIZE = 5000
+EXPORT_FORMATS = ("csv", "jsonl", "zip")
+
+EXPORT_FIELDS = [
+    "name", "creation", "company", "message_type", "sender", "sender_name", "receiver",
+    "message", "message_status", "message_id", "is_group_message", "group_id", "group_name",
+    "reply_to_message_id", "customer", "contact", "media_attachment"
+]
+
+
+@frappe.whitelist()
+def enqueue_export(
+    conversation: Optional[str] = None,
+    customer: Optional[str] = None,
+    from_date: Optional[str] = None,
+    to_date: Optional[str] = None,
+    format: str = "csv",
+    include_media: bool = False
+) -> Dict[str, Any]:
+    """
+    Export matching messages in the background; progress comes as realtime
+    events. `include_media` only applies to the zip format.
+    """
+    if not frappe.has_permission("WhatsApp Message", "export"):
+        frappe.throw(_("Not permitted"), frappe.PermissionError)
+    if format not in EXPORT_FORMATS:
+        frappe.throw(_("Format must be one of {0}").format(", ".join(EXPORT_FORMATS)))
+    if not (conversation or customer or from_date or to_date):
+        frappe.throw(_("Select a conversation, customer or date range to export"))
+
+    # Validates the filters before anything is queued
+    build_condition(conversation, customer, from_date, to_date)
+
+    export_id = frappe.generate_hash(length=10)
+    frappe.enqueue(
+        "whatsapp_integration.whatsapp_integration.chat_export.run_export",
+        queue="long",
+        timeout=4 * 3600,
+        export_id=export_id,
+        conversation=conversation,
+        customer=customer,
+        from_date=from_date,
+        to_date=to_date,
+        format=format,
+        include_media=frappe.utils.cint(include_media)
+    )
+    return {"status": "queued", "export_id": export_id}
+
+
+def build_condition(
+    conversation: Optional[str] = None,
+    customer: Optional[str] = None,
+    from_date: Optional[str] = None,
+    to_date: Optional[str] = None
+) -> Tuple[str, Dict[str, Any]]:
+    from whatsapp_integration.whatsapp_integration.api import get_conversation_condition
+
+    conditions: List[str] = []
+    values: Dict[str, Any] = {}
+    if conversation:
+        condition = get_conversation_condition(conversation)
+        if not condition:
+            frappe.throw(_("Invalid phone number or group ID: {0}").format(conversation))
+        conditions.append(condition[0])
+        values.update(condition[1])
+    if customer:
+        conditions.append("customer = %(customer)s")
+        values["customer"] = customer
+    if from_date:
+        conditions.append("creation >= %(from_date)s")
+        values["from_date"] = get_datetime(getdate(from_date))
+    if to_date:
+        conditions.append("creation < %(to_date)s")
+        values["to_date"] = get_datetime(add_days(getdate(to_date), 1))
+    return " AND ".join(conditions) or "1=1", values
+
+
+def iter_chunks(where: str, values: Dict[str, Any]) -> Iterator[List[Dict[str, Any]]]:
+    """Matching messages in (creation, name) order, EXPORT_CHUNK_SIZE rows at a time."""
+    cursor = None
+    while True:
+        condition = where
+        params = dict(values, limit=EXPORT_CHUNK_SIZE)
+        if cursor:
+            condition += " AND (creation > %(cursor_creation)s OR (creation = %(cursor_creation)s AND name > %(cursor_name)s))"
+            params.update(cursor_creation=cursor[0], cursor_name=cursor[1])
+
+        rows = frappe.db.sql(f"""
+            SELECT {", ".join(EXPORT_FIELDS)}
+            FROM `tabWhatsApp Message`
+            WHERE {condition}
+            ORDER BY creation ASC, name ASC
+            LIMIT %(limit)s
+        """, params, as_dict=1)
+        if rows:
+            yield rows
+        if len(rows) < EXPORT_CHUNK_SIZE:
+            return
+        cursor = (rows[-1].creation, rows[-1].name)
+
+
+def run_export(
+    export_id: str,
+    conversation: Optional[str] = None,
+    customer: Optional[str] = None,
+    from_date: Optional[str] = None,
+    to_date: Optional[str] = None,
+    format: str = "csv",
+    include_media: int = 0
+):
+    """Background job: write the export file and publish progress to the requesting user."""
+    user = frappe.session.user
+    file_name = f"whatsapp_export_{export_id}.{format}"
+    path = frappe.get_site_path("private", "files", file_name)
+
+    try:
+        where, values = build_condition(conversation, customer, from_date, to_date)
+        total = frappe.db.sql(f"SELECT COUNT(*) FROM `tabWhatsApp Message` WHERE {where}", values)[0][0]
+        _publish(user, export_id, status="running", done=0, total=total)
+
+        done = 0
+        for done in _write(path, format, iter_chunks(where, values), include_media):
+            _publish(user, export_id, status="running", done=done, total=total)
+
+        file_doc = frappe.get_doc({
+            "doctype": "File",
+            "file_name": file_name,
+            "file_url": f"/private/files/{file_name}",
+            "is_private": 1
+        })
+        file_doc.insert(ignore_permissions=True)
+        frappe.db.commit()
+
+        _publish(user, export_id, status="done", done=done, total=total, file_url=file_doc.file_url)
+    except Exception as e:
+        if os.path.exists(path):
+            os.remove(path)
+        frappe.log_error(
+            f"Error exporting chat history {export_id}: {str(e)}\n{frappe.get_traceback()}",
+            "WhatsApp Export Error"
+        )
+        _publish(user, export_id, status="error", error=str(e))
+
+
+def _write(path: str, format: str, chunks: Iterator[List[Dict[str, Any]]], include_media: int) -> Iterator[int]:
+    """Write `chunks` to `path`, yielding the number of rows written after each chunk."""
+    done = 0
+    if format == "jsonl":
+        with open(path, "w", encoding="utf-8") as f:
+            for rows in chunks:
+                for row in rows:
+                    f.write(json.dumps(row, default=str, ensure_ascii=False) + "\n")
+                done += len(rows)
+                yield done
+        return
+
+    if format == "csv":
+        with open(path, "w", newline="", encoding="utf-8") as f:
+            writer = csv.DictWriter(f, fieldnames=EXPORT_FIELDS)
+            writer.writeheader()
+            for rows in chunks:
+                writer.writerows(rows)
+                done += len(rows)
+                yield done
+        return
+
+    # A zip member can't be written while another is open, so the CSV is spooled to
+    # a file next to the archive and added last; media is added chunk by chunk
+    csv_path = f"{path}.csv.tmp"
+    try:
+        with zipfile.ZipFile(path, "w", compression=zipfile.ZIP_DEFLATED, allowZip64=True) as archive, \
+                open(csv_path, "w", newline="", encoding="utf-8") as f:
+            writer = csv.DictWriter(f, fieldnames=EXPORT_FIELDS)
+            writer.writeheader()
+            for rows in chunks:
+                writer.writerows(rows)
+                if include_media:
+                    _write_media(archive, rows)
+                done += len(rows)
+                yield done
+
+            f.close()
+            archive.write(csv_path, "messages.csv")
+    finally:
+        if os.path.exists(csv_path):
+            os.remove(csv_path)
+
+
+def _write_media(archive: zipfile.ZipFile, rows: List[Dict[str, Any]]):
+    """Add the media of `rows` as media/<message name>_<file name>, unique per message."""
+    for row in rows:
+        file_path = _local_path(row.media_attachment) if row.media_attachment else None
+        if file_path and os.path.exists(file_path):
+            archive.write(file_path, f"media/{row.name}_{os.path.basename(file_path)}")
+
+
+def _local_path(file_url: str) -> Optional[str]:
+    """Path of a site file, or None for URLs that resolve outside the site's files folders."""
+    if file_url.startswith("/private/files/"):
+        root = os.path.realpath(frappe.get_site_path("private", "files"))
+        relative = file_url[len("/private/files/"):]
+    elif file_url.startswith("/files/"):
+        root = os.path.realpath(frappe.get_site_path("public", "files"))
+        relative = file_url[len("/files/"):]
+    else:
+        return None
+
+    path = os.path.realpath(os.path.join(root, relative))
+    return path if path.startswith(root + os.sep) else None
+
+
+def _publish(user: str, export_id: str, **data):
+    frappe.publish_realtime("whatsapp_export_progress", {"export_id": export_id, **data}, user=user)
@@ -0,0 +1,211 @@
+"""
+Contact profiles (about text and profile picture) for the chat widget.
+
+Profiles are kept in WhatsApp Contact Profile. A record younger than
+PROFILE_TTL_HOURS is returned as is. An older one is still returned, but a
+background job refreshes it (stale-while-revalidate). Only unknown contacts,
+or records older than PROFILE_STALE_DAYS, wait for the Node bridge, which has
+its own in-memory cache in front of WhatsApp. Profile pictures are downloaded
+into a private File in the background because WhatsApp's CDN URLs expire, and
+are served to chat users by `get_avatar`.
+"""
+
+from datetime import timedelta
+from typing import Any, Dict, Optional
+from urllib.parse import quote
+
+import frappe
+import requests
+from frappe import _
+from frappe.utils import now_datetime
+
+from whatsapp_integration.whatsapp_integration import metrics
+
+PROFILE_TTL_HOURS = 24
+PROFILE_STALE_DAYS = 30
+
+PROFILE_FIELDS = ["phone", "jid", "on_whatsapp", "about", "avatar", "picture_url", "fetched_on"]
+
+
+def get_profile(settings, phone: str) -> Dict[str, Any]:
+    """Profile of `phone` for the session of `settings`, from the cache when possible."""
+    profile = frappe.db.get_value("WhatsApp Contact Profile", phone, PROFILE_FIELDS, as_dict=True)
+    if profile and profile.fetched_on:
+        age = now_datetime() - profile.fetched_on
+        if age < timedelta(hours=PROFILE_TTL_HOURS):
+            metrics.cache_hit("contact_profile")
+            return _response(profile, stale=False)
+        if age < timedelta(days=PROFILE_STALE_DAYS):
+            metrics.inc("whatsapp_cache_requests_total", cache="contact_profile", result="stale")
+            frappe.enqueue(
+                "whatsapp_integration.whatsapp_integration.contact_profile.refresh_profile",
+                queue="short",
+                job_id=f"whatsapp_contact_profile::{phone}",
+                deduplicate=True,
+                settings_name=settings.name,
+                phone=phone
+            )
+            return _response(profile, stale=True)
+
+    metrics.cache_miss("contact_profile")
+    return fetch_profile(settings, phone)
+
+
+def refresh_profile(settings_name: str, phone: str):
+    """Background job: fetch a stale profile again."""
+    try:
+        fetch_profile(frappe.get_doc("WhatsApp Settings", settings_name), phone)
+    except Exception as e:
+        frappe.log_error(
+            f"Error refreshing contact profile {phone}: {str(e)}\n{frappe.get_traceback()}",
+            "WhatsApp Contact Info Error"
+        )
+
+
+def fetch_profile(settings, phone: str, refresh: bool = False) -> Dict[str, Any]:
+    """
+    Ask the Node bridge for the profile and store it. With `refresh`, the bridge
+    skips its own cache as well.
+    """
+    node_url = settings.node_url or "http://127.0.0.1:3000"
+    session_id = settings.name.replace(" ", "_")
+
+    response = metrics.node_request(
+        "POST",
+        f"{node_url}/sessions/contact-info",
+        "/sessions/contact-info",
+        json={"sessionId": session_id, "phone": phone, "refresh": refresh},
+        timeout=10
+    )
+
+    try:
+        info = response.json()
+    except ValueError:
+        frappe.log_error(
+            f"Node service returned invalid JSON. Status: {response.status_code}, Body: {response.text[:200]}",
+            "WhatsApp Contact Info Invalid Response"
+        )
+        return {"status": "error", "error": f"Invalid response from Node service (status {response.status_code})"}
+
+    if info.get("status") != "success":
+        return info
+
+    profile = save_profile(phone, info)
+    return _response(profile, stale=False)
+
+
+def save_profile(phone: str, info: Dict[str, Any]):
+    """Store the bridge's answer; queue an avatar download if the picture changed."""
+    if frappe.db.exists("WhatsApp Contact Profile", phone):
+        doc = frappe.get_doc("WhatsApp Contact Profile", phone)
+    else:
+        doc = frappe.new_doc("WhatsApp Contact Profile")
+        doc.phone = phone
+
+    picture_url = info.get("profilePicture")
+    picture_changed = _picture_key(picture_url) != _picture_key(doc.picture_url)
+
+    doc.jid = info.get("jid")
+    doc.on_whatsapp = 1 if info.get("exists") else 0
+    doc.about = info.get("about")
+    doc.picture_url = picture_url
+    doc.fetched_on = now_datetime()
+    if not picture_url and doc.avatar:
+        _remove_avatar(phone, doc.avatar)
+        doc.avatar = None
+    doc.save(ignore_permissions=True)
+    frappe.db.commit()
+
+    if picture_url and (picture_changed or not doc.avatar):
+        frappe.enqueue(
+            "whatsapp_integration.whatsapp_integration.contact_profile.download_avatar",
+            queue="short",
+            job_id=f"whatsapp_contact_avatar::{phone}",
+            deduplicate=True,
+            phone=phone,
+            url=picture_url
+        )
+    return doc
+
+
+def download_avatar(phone: str, url: str):
+    """Background job: store the profile picture at `url` as the contact's avatar."""
+    from frappe.utils.file_manager import save_file
+
+    try:
+        response = requests.get(url, timeout=15)
+        response.raise_for_status()
+
+        doc = frappe.get_doc("WhatsApp Contact Profile", phone)
+        # A newer picture was seen while this one was downloading
+        if _picture_key(doc.picture_url) != _picture_key(url):
+            return
+
+        previous = doc.avatar
+        saved_file = save_file(
+            f"wa_avatar_{phone}.jpg",
+            response.content,
+            "WhatsApp Contact Profile",
+            phone,
+            decode=False,
+            is_private=1
+        )
+        doc.db_set("avatar", saved_file.file_url)
+        if previous and previous != saved_file.file_url:
+            _remove_avatar(phone, previous)
+    except Exception as e:
+        frappe.log_error(
+            f"Error downloading avatar for {phone}: {str(e)}\n{frappe.get_traceback()}",
+            "WhatsApp Contact Info Error"
+        )
+
+
+@frappe.whitelist()
+def get_avatar(phone: str):
+    """Serve the stored profile picture of `phone` to users who can read WhatsApp messages."""
+    if not frappe.has_permission("WhatsApp Message", "read"):
+        frappe.throw(_("Not permitted"), frappe.PermissionError)
+
+    file_url = frappe.db.get_value("WhatsApp Contact Profile", phone, "avatar")
+    file_name = file_url and frappe.db.get_value(
+        "File",
+        {"file_url": file_url, "attached_to_doctype": "WhatsApp Contact Profile", "attached_to_name": phone},
+        "name"
+    )
+    if not file_name:
+        frappe.throw(_("No profile picture stored for {0}").format(phone), frappe.DoesNotExistError)
+
+    frappe.local.response.filename = f"wa_avatar_{phone}.jpg"
+    frappe.local.response.filecontent = frappe.get_doc("File", file_name).get_content()
+    frappe.local.response.type = "download"
+    frappe.local.response.display_content_as = "inline"
+
+
+def _remove_avatar(phone: str, file_url: str):
+    file_name = frappe.db.get_value(
+        "File",
+        {"file_url": file_url, "attached_to_doctype": "WhatsApp Contact Profile", "attached_to_name": phone},
+        "name"
+    )
+    if file_name:
+        frappe.delete_doc("File", file_name, ignore_permissions=True)
+
+
+def _picture_key(url: Optional[str]) -> Optional[str]:
+    # CDN URLs carry expiring signatures in the query string; the path identifies the picture
+    return url.split("?")[0] if url else None
+
+
+def _response(profile, stale: bool) -> Dict[str, Any]:
+    return {
+        "status": "success",
+        "exists": bool(profile.on_whatsapp),
+        "profilePicture": _avatar_url(profile.phone) if profile.avatar else profile.picture_url,
+        "about": profile.about,
+        "jid": profile.jid,
+        "stale": stale
+    }
+
+
+def _avatar_url(phone: str) -> str:
+    return f"/api/method/whatsapp_integration.whatsapp_integration.contact_profile.get_avatar?phone={quote(phone)}"
@@ -0,0 +1,182 @@
+"""
+Unread counters for the chat widget.
+
+WhatsApp Conversation counts the incoming messages of each chat (phone number
+or group ID) per company, since every company has its own WhatsApp session; the
+count is bumped with a single upsert when an incoming message is saved.
+WhatsApp Conversation Read stores, per user, how many of them the user has
+seen. Unread = incoming - read, so the inbox reads its badges with primary key
+lookups and never counts rows of WhatsApp Message.
+
+The first time a user loads a company's inbox, every existing conversation of
+the company is marked read for them, so new users (and everyone after the
+counters were introduced) don't see the whole history as unread.
+
+Marking a conversation read also sends read receipts for the newly read
+messages to WhatsApp, in one batched call to the Node bridge.
+"""
+
+from typing import Any, Dict, List, Optional
+
+import frappe
+from frappe.utils import now_datetime
+
+from whatsapp_integration.whatsapp_integration import metrics
+
+MAX_READ_RECEIPTS = 200   # newest unread messages acknowledged per mark-as-read
+READ_BASELINE_DEFAULT = "whatsapp_read_baseline"   # user default, per company, set once the baseline exists
+
+
+def counter_name(company: str, conversation: str) -> str:
+    """Name of the WhatsApp Conversation of `conversation` in `company`."""
+    return f"{company}::{conversation}"
+
+
+def record_incoming(conversation: str, company: str, is_group: bool = False):
+    """Count one incoming message of `conversation` received by the session of `company`."""
+    if not conversation or not company:
+        return
+    now = now_datetime()
+    frappe.db.sql("""
+        INSERT INTO `tabWhatsApp Conversation`
+            (name, conversation, is_group, company, incoming_count, last_incoming_on,
+             creation, modified, owner, modified_by)
+        VALUES (%(name)s, %(conversation)s, %(is_group)s, %(company)s, 1, %(now)s,
+                %(now)s, %(now)s, 'Administrator', 'Administrator')
+        ON DUPLICATE KEY UPDATE
+            incoming_count = incoming_count + 1,
+            last_incoming_on = %(now)s,
+            modified = %(now)s
+    """, {
+        "name": counter_name(company, conversation),
+        "conversation": conversation,
+        "is_group": 1 if is_group else 0,
+        "company": company,
+        "now": now
+    })
+
+
+def get_unread_counts(conversations: List[str], company: str, user: Optional[str] = None) -> Dict[str, int]:
+    """Unread messages of each of `conversations` of `company` for `user`, in one query."""
+    if not conversations or not company:
+        return {}
+    user = user or frappe.session.user
+    ensure_read_baseline(company, user)
+
+    rows = frappe.db.sql("""
+        SELECT c.conversation, c.incoming_count - IFNULL(r.read_count, 0)
+        FROM `tabWhatsApp Conversation` c
+        LEFT JOIN `tabWhatsApp Conversation Read` r ON r.name = CONCAT(c.name, '::', %(user)s)
+        WHERE c.name IN %(names)s
+    """, {"names": tuple(counter_name(company, c) for c in conversations), "user": user})
+    return {conversation: max(int(unread), 0) for conversation, unread in rows}
+
+
+def ensure_read_baseline(company: str, user: str):
+    """
+    Mark everything received so far by `company` read for `user`, once. Later
+    conversations have no Read row and count all their messages as unread.
+    """
+    key = f"{READ_BASELINE_DEFAULT}::{company}"
+    if frappe.defaults.get_user_default(key, user):
+        return
+
+    now = now_datetime()
+    frappe.db.sql("""
+        INSERT IGNORE INTO `tabWhatsApp Conversation Read`
+            (name, conversation, user, read_count, read_on, creation, modified, owner, modified_by)
+        SELECT CONCAT(name, '::', %(user)s), name, %(user)s, incoming_count, %(now)s, %(now)s, %(now)s, %(user)s, %(user)s
+        FROM `tabWhatsApp Conversation`
+        WHERE company = %(company)s
+    """, {"company": company, "user": user, "now": now})
+    frappe.defaults.set_user_default(key, str(now), user)
+    frappe.db.commit()
+
+
+def mark_read(conversation: str, company: str, user: Optional[str] = None) -> Dict[str, Any]:
+    """Mark all incoming messages of `conversation` in `company` read by `user` and acknowledge them."""
+    user = user or frappe.session.user
+    name = counter_name(company, conversation)
+    incoming_count = frappe.db.get_value("WhatsApp Conversation", name, "incoming_count")
+    if not incoming_count:
+        return {"status": "success", "marked": 0}
+
+    read_name = f"{name}::{user}"
+    previous = frappe.db.get_value("WhatsApp Conversation Read", read_name, "read_count") or 0
+    unread = incoming_count - previous
+    if unread <= 0:
+        return {"status": "success", "marked": 0}
+
+    now = now_datetime()
+    frappe.db.sql("""
+        INSERT INTO `tabWhatsApp Conversation Read`
+            (name, conversation, user, read_count, read_on, creation, modified, owner, modified_by)
+        VALUES (%(name)s, %(conversation)s, %(user)s, %(count)s, %(now)s, %(now)s, %(now)s, %(user)s, %(user)s)
+        ON DUPLICATE KEY UPDATE
+            read_count = GREATEST(read_count, %(count)s),
+            read_on = %(now)s,
+            modified = %(now)s
+    """, {"name": read_name, "conversation": name, "user": user, "count": incoming_count, "now": now})
+
+    frappe.enqueue(
+        "whatsapp_integration.whatsapp_integration.conversations.send_read_receipts",
+        queue="short",
+        enqueue_after_commit=True,
+        conversation=conversation,
+        company=company,
+        count=min(unread, MAX_READ_RECEIPTS)
+    )
+    return {"status": "success", "marked": unread}
+
+
+def send_read_receipts(conversation: str, company: str, count: int):
+    """Background job: acknowledge the `count` newest incoming messages of `conversation`."""
+    from whatsapp_integration.whatsapp_integration.api import get_conversation_condition
+
+    try:
+        settings = frappe.db.get_value(
+            "WhatsApp Settings", {"company": company, "integration_enabled": 1}, ["name", "node_url"], as_dict=True
+        )
+        condition = get_conversation_condition(conversation)
+        if not settings or not condition:
+            return
+        where, values = condition
+
+        rows = frappe.db.sql(f"""
+            SELECT message_id, sender, group_id, is_group_message, remote_jid, participant_jid
+            FROM `tabWhatsApp Message`
+            WHERE {where}
+            AND company = %(company)s
+            AND message_type = 'Incoming'
+            AND IFNULL(message_id, '') != ''
+            ORDER BY creation DESC
+            LIMIT %(limit)s
+        """, {**values, "company": company, "limit": int(count)}, as_dict=1)
+        if not rows:
+            return
+
+        node_url = settings.node_url or "http://127.0.0.1:3000"
+        response = metrics.node_request(
+            "POST",
+            f"{node_url}/sessions/read",
+            "/sessions/read",
+            json={"sessionId": settings.name.replace(" ", "_"), "keys": [_message_key(row) for row in rows]},
+            timeout=30
+        )
+        response.raise_for_status()
+    except Exception as e:
+        frappe.log_error(
+            f"Error sending read receipts for {conversation}: {str(e)}\n{frappe.get_traceback()}",
+            "WhatsApp Read Receipt Error"
+        )
+
+
+def _message_key(row) -> Dict[str, Optional[str]]:
+    # Messages saved before remote_jid was stored get the JID rebuilt from their sender or group
+    if row.is_group_message:
+        remote_jid = row.remote_jid or (row.group_id if "@" in (row.group_id or "") else f"{row.group_id}@g.us")
+        participant = row.participant_jid or f"{row.sender}@s.whatsapp.net"
+    else:
+        remote_jid = row.remote_jid or f"{row.sender}@s.whatsapp.net"
+        participant = None
+    return {"id": row.message_id, "remoteJid": remote_jid, "participant": participant}
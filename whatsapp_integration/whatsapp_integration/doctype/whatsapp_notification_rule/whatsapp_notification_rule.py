@@ -0,0 +1,40 @@
+import frappe
+from frappe import _
+from frappe.model.document import Document
+from frappe.utils.jinja import get_jenv
+from jinja2 import TemplateSyntaxError
+
+from whatsapp_integration.whatsapp_integration import notification_rules
+
+class WhatsAppNotificationRule(Document):
+    def validate(self):
+        try:
+            get_jenv().from_string(self.message)
+        except TemplateSyntaxError as e:
+            frappe.throw(_("Invalid message template: {0}").format(e))
+
+        if self.condition:
+            try:
+                compile(self.condition, "<condition>", "eval")
+            except SyntaxError as e:
+                frappe.throw(_("Invalid condition: {0}").format(e))
+
+        self.validate_recipient_field()
+
+    def validate_recipient_field(self):
+        meta = frappe.get_meta(self.document_type)
+        fieldname, _sep, linked_fieldname = self.recipient_field.partition(".")
+        field = meta.get_field(fieldname)
+        if not field:
+            frappe.throw(_("{0} has no field {1}").format(self.document_type, fieldname))
+        if linked_fieldname:
+            if field.fieldtype != "Link":
+                frappe.throw(_("{0} is not a Link field").format(fieldname))
+            if not frappe.get_meta(field.options).get_field(linked_fieldname):
+                frappe.throw(_("{0} has no field {1}").format(field.options, linked_fieldname))
+
+    def on_update(self):
+        notification_rules.clear_rule_index()
+
+    def on_trash(self):
+        notification_rules.clear_rule_index()
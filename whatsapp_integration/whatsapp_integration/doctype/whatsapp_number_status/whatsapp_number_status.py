@@ -0,0 +1,5 @@
+import frappe
+from frappe.model.document import Document
+
+class WhatsAppNumberStatus(Document):
+    pass
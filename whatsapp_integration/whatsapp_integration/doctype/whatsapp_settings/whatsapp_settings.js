@@ -28,6 +28,10 @@ frappe.ui.form.on('WhatsApp Settings', {
                 frm.add_custom_button(__('Send Test Message'), function () {
                     frm.trigger('send_test_message');
                 }, __('Actions'));
+
+                frm.add_custom_button(__('Check Customer Numbers'), function () {
+                    frm.trigger('check_customer_numbers');
+                }, __('Actions'));
             } else {
                 frm.add_custom_button(__('Connect WhatsApp'), function () {
                     frm.trigger('connect_whatsapp');
@@ -97,6 +101,21 @@ frappe.ui.form.on('WhatsApp Settings', {
         fetch_qr();
     },
 
+    check_customer_numbers: function (frm) {
+        frappe.confirm(__('Check every Customer and Contact mobile number on WhatsApp? This runs in the background and can take a while for large lists.'), () => {
+            frappe.call({
+                method: 'whatsapp_integration.whatsapp_integration.number_check.enqueue_number_check',
+                args: { name: frm.doc.name },
+                callback: function (r) {
+                    frappe.show_alert({
+                        message: __('Number check started. Results appear in WhatsApp Number Status.'),
+                        indicator: 'blue'
+                    });
+                }
+            });
+        });
+    },
+
     send_test_message: function (frm) {
         if (!frm.doc.test_receiver || !frm.doc.test_message) {
             frappe.msgprint(__('Please enter receiver and message in the Test Messaging section below.'));
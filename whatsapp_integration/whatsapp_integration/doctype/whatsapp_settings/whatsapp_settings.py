@@ -2,6 +2,7 @@ import frappe
 import requests
 from frappe.model.document import Document
 from frappe import _
+from whatsapp_integration.whatsapp_integration import metrics
 
 class WhatsAppSettings(Document):
     def validate(self):
@@ -29,7 +30,7 @@ def get_qr_code(name):
             webhook_url = f"{doc.webhook_url_override.rstrip('/')}/api/method/{callback_method}"
             frappe.logger().info(f"WhatsApp: Using Webhook URL Override: {webhook_url}")
         
-        response = requests.post(f"{node_url}/sessions/start", json={
+        response = metrics.node_request("POST", f"{node_url}/sessions/start", "/sessions/start", json={
             "sessionId": session_id,
             "webhookUrl": webhook_url,
             "webhookToken": doc.get_password("webhook_token")
@@ -70,8 +71,15 @@ def send_whatsapp_message(name, receiver, message, media=None):
         from whatsapp_integration.whatsapp_integration.api import validate_phone_number, sanitize_message
         clean_receiver = validate_phone_number(receiver)
         if not clean_receiver:
+            metrics.inc("whatsapp_messages_sent_total", outcome="invalid_number")
             return {"status": "error", "error": "Invalid phone number"}
 
+        # Skip numbers a recent bulk check found not to be on WhatsApp
+        from whatsapp_integration.whatsapp_integration.number_check import is_known_non_whatsapp
+        if is_known_non_whatsapp(clean_receiver):
+            metrics.inc("whatsapp_messages_sent_total", outcome="not_on_whatsapp")
+            return {"status": "error", "error": "This number is not on WhatsApp"}
+
         # Sanitize message
         if message:
             message = sanitize_message(message)
@@ -84,10 +92,16 @@ def send_whatsapp_message(name, receiver, message, media=None):
         if media:
             payload["media"] = media
 
+        # The bridge only reads media by path for callers holding the session's webhook token
+        headers = {"X-Webhook-Token": doc.get_password("webhook_token", raise_exception=False) or ""}
+
         # Try to send message
-        response = requests.post(
+        response = metrics.node_request(
+            "POST",
             f"{node_url}/sessions/send",
+            "/sessions/send",
             json=payload,
+            headers=headers,
             timeout=60
         )
 
@@ -100,14 +114,48 @@ def send_whatsapp_message(name, receiver, message, media=None):
                 title="WhatsApp Invalid Response",
                 message=f"Node service returned invalid JSON. Status: {response.status_code}, Body: {response.text[:200]}"
             )
+            metrics.inc("whatsapp_messages_sent_total", outcome="invalid_response")
             return {
                 "status": "error",
                 "error": f"Invalid response from Node service (status {response.status_code})"
             }
 
+        # Node service can't or won't read the file (different host, SHARED_FILES_ROOT not set
+        # or a webhook token it doesn't know): send it inline
+        if res_data.get("code") in ("media_path_rejected", "media_path_unauthorized"):
+            frappe.logger().warning(
+                f"Node service rejected media path {media.get('path')}, sending it as base64. "
+                "Check SHARED_FILES_ROOT or disable 'Send Files by Path'."
+            )
+            import base64
+            from whatsapp_integration.whatsapp_integration.api import get_outgoing_media_file
+            # Read through the File saved for this send, never from the path in the payload
+            file_doc = get_outgoing_media_file(media)
+            if not file_doc:
+                metrics.inc("whatsapp_messages_sent_total", outcome="error")
+                return {"status": "error", "error": "Media file not found"}
+            content = file_doc.get_content()
+            if isinstance(content, str):
+                content = content.encode("utf-8")
+            payload["media"] = {
+                "data": base64.b64encode(content).decode('utf-8'),
+                "filename": media.get("filename"),
+                "mimetype": media.get("mimetype")
+            }
+            response = metrics.node_request(
+                "POST",
+                f"{node_url}/sessions/send",
+                "/sessions/send",
+                json=payload,
+                headers=headers,
+                timeout=60
+            )
+            res_data = response.json()
+
         # If session is not connected, try to reconnect
         if response.status_code == 400 and res_data.get("error") == "Session not connected":
             frappe.logger().warning(f"Session {session_id} not connected, attempting to reconnect...")
+            metrics.inc("whatsapp_messages_sent_total", outcome="disconnected")
 
             # Enqueue reconnection in background
             frappe.enqueue(
@@ -123,9 +171,11 @@ def send_whatsapp_message(name, receiver, message, media=None):
                 "error": "WhatsApp session disconnected. Reconnecting in background. Please try again in a moment."
             }
 
+        metrics.inc("whatsapp_messages_sent_total", outcome="sent" if res_data.get("status") == "sent" else "error")
         return res_data
 
     except requests.Timeout:
+        metrics.inc("whatsapp_messages_sent_total", outcome="timeout")
         frappe.log_error(
             title="WhatsApp Send Timeout",
             message=f"Timeout sending message to {receiver}"
@@ -133,6 +183,7 @@ def send_whatsapp_message(name, receiver, message, media=None):
         return {"status": "error", "error": "Request timeout - Node service may be slow"}
 
     except requests.RequestException as e:
+        metrics.inc("whatsapp_messages_sent_total", outcome="network_error")
         frappe.log_error(
             title="WhatsApp Send Error",
             message=f"Network error: {str(e)}\n{frappe.get_traceback()}"
@@ -153,7 +204,7 @@ def logout_whatsapp(name):
     session_id = doc.name.replace(" ", "_")
 
     try:
-        response = requests.delete(f"{node_url}/sessions/{session_id}", timeout=10)
+        response = metrics.node_request("DELETE", f"{node_url}/sessions/{session_id}", "/sessions/:id", timeout=10)
         doc.connection_status = "Disconnected"
         doc.save(ignore_permissions=True)
 
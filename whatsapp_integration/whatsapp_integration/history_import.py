@@ -0,0 +1,200 @@
+"""
+Bulk import of WhatsApp history sync.
+
+When a device is linked, the Node bridge sends the past messages WhatsApp syncs
+to it as `history.import` webhook events of a few hundred messages each. The
+webhook only appends each chunk to a Redis list and enqueues a single drain job
+on the long queue, so a large backfill never holds up live webhooks.
+
+The job imports one chunk at a time: one party_index lookup for all numbers,
+one multi-row INSERT IGNORE (message_id is unique, so messages already saved,
+by an earlier sync or live, are skipped), one commit, then a pause of
+IMPORT_PAUSE seconds so live traffic keeps its share of the database. Imported
+messages keep their WhatsApp timestamp as `creation` and are not counted as
+unread. Media is only attached if the bridge spooled it (HISTORY_SYNC_MEDIA=1).
+"""
+
+import json
+import time
+from datetime import datetime, timezone
+from typing import Any, Dict, List, Optional
+
+import frappe
+from frappe.utils import now_datetime
+from frappe.utils.data import convert_utc_to_system_timezone
+
+from whatsapp_integration.whatsapp_integration import metrics, party_index
+
+QUEUE_KEY = "whatsapp_history_import_queue"
+IMPORT_PAUSE = 0.5           # seconds between chunks
+DRAIN_BUDGET = 20 * 60       # seconds per job; the scheduler enqueues the rest
+
+DRAIN_JOB_ID = "whatsapp_history_import_drain"
+
+MESSAGE_FIELDS = [
+    "name", "creation", "modified", "owner", "modified_by", "company", "message", "message_type",
+    "message_id", "remote_jid", "participant_jid", "message_status", "is_group_message", "group_id",
+    "group_name", "reply_to_message_id", "reply_to_message_text", "sender", "sender_name", "receiver",
+    "contact", "customer"
+]
+
+
+# ============================================================================
+# QUEUEING (webhook)
+# ============================================================================
+
+def handle_history_import(doc, data: Dict[str, Any]):
+    """Webhook handler of `history.import`: queue the chunk for the drain job."""
+    messages = data.get("messages") or []
+    if not messages:
+        return
+
+    entry = {"settings": doc.name, "company": doc.company, "messages": messages}
+    _redis("rpush", _key(QUEUE_KEY), json.dumps(entry))
+    metrics.inc("whatsapp_history_import_total", len(messages), result="queued")
+    enqueue_drain()
+
+
+def enqueue_drain():
+    """Start the drain job unless it is queued or running. Also run by the scheduler."""
+    if not _redis("llen", _key(QUEUE_KEY)):
+        return
+    frappe.enqueue(
+        "whatsapp_integration.whatsapp_integration.history_import.drain_queue",
+        queue="long",
+        timeout=DRAIN_BUDGET + 300,
+        job_id=DRAIN_JOB_ID,
+        deduplicate=True
+    )
+
+
+# ============================================================================
+# IMPORT (background job)
+# ============================================================================
+
+def drain_queue():
+    """Background job: import queued chunks, pausing between them, for up to DRAIN_BUDGET seconds."""
+    key = _key(QUEUE_KEY)
+    deadline = time.monotonic() + DRAIN_BUDGET
+
+    while time.monotonic() < deadline:
+        head = _redis("lrange", key, 0, 0)
+        if not head:
+            return
+        entry = json.loads(head[0])
+        try:
+            import_chunk(entry["settings"], entry["company"], entry["messages"])
+            frappe.db.commit()
+        except Exception as e:
+            frappe.db.rollback()
+            metrics.inc("whatsapp_history_import_total", len(entry["messages"]), result="error")
+            frappe.log_error(
+                f"Error importing history chunk for {entry.get('settings')}: {str(e)}\n{frappe.get_traceback()}",
+                "WhatsApp History Import Error"
+            )
+        _redis("lpop", key)
+        time.sleep(IMPORT_PAUSE)
+
+
+def import_chunk(settings_name: str, company: str, messages: List[Dict[str, Any]]) -> int:
+    """Insert the new messages of one chunk with a single statement. Returns how many were new."""
+    from whatsapp_integration.whatsapp_integration.api import sanitize_message, validate_phone_number
+
+    # Contact and Customer of every 1:1 chat in one query
+    parties = party_index.lookup(msg.get("from") for msg in messages if msg.get("from") and not msg.get("isGroup"))
+
+    now = now_datetime()
+    rows = {}
+    for msg in messages:
+        msg_id = msg.get("id")
+        if not msg_id or msg_id in rows:
+            continue
+
+        is_group = bool(msg.get("isGroup"))
+        phone = validate_phone_number(str(msg.get("from") or "")) if msg.get("from") else None
+        if not phone and not (is_group and msg.get("fromMe")):
+            metrics.inc("whatsapp_history_import_total", result="invalid")
+            continue
+
+        outgoing = bool(msg.get("fromMe"))
+        party = None if is_group else parties.get(party_index.phone_key(phone)) or None
+        reply_to = msg.get("replyTo") or {}
+        created = _timestamp(msg.get("timestamp")) or now
+
+        rows[msg_id] = (
+            frappe.generate_hash(length=10), created, now, "Administrator", "Administrator", company,
+            sanitize_message(msg.get("text") or ""),
+            "Outgoing" if outgoing else "Incoming",
+            msg_id, msg.get("remoteJid"), msg.get("participant"),
+            "Sent" if outgoing else None,
+            1 if is_group else 0,
+            msg.get("groupId") if is_group else None,
+            msg.get("groupName") if is_group else None,
+            reply_to.get("messageId"), reply_to.get("text"),
+            "Me" if outgoing else phone,
+            "Me" if outgoing else (msg.get("pushName") or phone),
+            (msg.get("groupId") if is_group else phone) if outgoing else "Me",
+            party["contact"] if party else None,
+            party["customer"] if party else None,
+        )
+
+    if not rows:
+        return 0
+
+    before = _count_existing(list(rows))
+    frappe.db.bulk_insert("WhatsApp Message", MESSAGE_FIELDS, list(rows.values()), ignore_duplicates=True)
+    imported = len(rows) - before
+    metrics.inc("whatsapp_history_import_total", imported, result="imported")
+    metrics.inc("whatsapp_history_import_total", before, result="duplicate")
+
+    media = {msg["id"]: msg["media"] for msg in messages if msg.get("media") and msg.get("id") in rows}
+    if media:
+        _attach_media(settings_name, media)
+    return imported
+
+
+def _attach_media(settings_name: str, media: Dict[str, Dict[str, Any]]):
+    """Fetch media the bridge spooled for newly imported messages."""
+    from whatsapp_integration.whatsapp_integration.api import save_spooled_media
+
+    settings = frappe.get_doc("WhatsApp Settings", settings_name)
+    for name, msg_id in frappe.db.sql("""
+        SELECT name, message_id FROM `tabWhatsApp Message`
+        WHERE message_id IN %(ids)s AND IFNULL(media_attachment, '') = ''
+    """, {"ids": tuple(media)}):
+        try:
+            file_url = save_spooled_media(settings, media[msg_id], name)
+            frappe.db.set_value("WhatsApp Message", name, "media_attachment", file_url, update_modified=False)
+        except Exception as e:
+            frappe.log_error(
+                f"Error fetching spooled media {media[msg_id].get('ref')}: {str(e)}\n{frappe.get_traceback()}",
+                "WhatsApp Media Error"
+            )
+
+
+def _count_existing(message_ids: List[str]) -> int:
+    return frappe.db.sql("""
+        SELECT COUNT(*) FROM `tabWhatsApp Message` WHERE message_id IN %(ids)s
+    """, {"ids": tuple(message_ids)})[0][0]
+
+
+def _timestamp(seconds) -> Optional[datetime]:
+    try:
+        seconds = int(seconds or 0)
+    except (TypeError, ValueError):
+        return None
+    if seconds <= 0:
+        return None
+    utc = datetime.fromtimestamp(seconds, timezone.utc).replace(tzinfo=None)
+    return convert_utc_to_system_timezone(utc).replace(tzinfo=None)
+
+
+def _key(*parts: str) -> str:
+    return frappe.cache().make_key(":".join(parts))
+
+
+def _redis(command: str, *args):
+    """Run a raw redis command on a key built with _key; RedisWrapper's list methods would prefix it again."""
+    pipe = frappe.cache().pipeline(transaction=False)
+    getattr(pipe, command)(*args)
+    return pipe.execute()[0]
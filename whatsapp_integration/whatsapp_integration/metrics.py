@@ -0,0 +1,256 @@
+"""
+Prometheus-style metrics for the WhatsApp integration.
+
+Counters and histograms are kept in a single Redis hash so that every gunicorn
+worker and background job contributes to the same series. Each series is
+stored under its Prometheus sample name (e.g. `name_bucket{event="x",le="0.1"}`)
+which keeps export a straight dump of the hash.
+
+Scrape with an API key of a System Manager:
+    GET /api/method/whatsapp_integration.whatsapp_integration.metrics.export
+    Authorization: token <api_key>:<api_secret>
+"""
+
+import time
+from contextlib import contextmanager
+from functools import wraps
+from typing import Dict, Optional
+
+import frappe
+import requests
+
+METRICS_KEY = "whatsapp_metrics"
+
+LATENCY_BUCKETS = (0.005, 0.01, 0.025, 0.05, 0.1, 0.25, 0.5, 1, 2.5, 5, 10, 30)
+QUERY_COUNT_BUCKETS = (1, 2, 5, 10, 20, 50, 100, 200, 500)
+
+# name -> (type, help, buckets)
+METRICS = {
+    "whatsapp_webhook_events_total": (
+        "counter", "Webhook events received from the Node bridge, by event type and result.", None
+    ),
+    "whatsapp_webhook_duration_seconds": (
+        "histogram", "Time spent handling a webhook event.", LATENCY_BUCKETS
+    ),
+    "whatsapp_event_e2e_seconds": (
+        "histogram", "Time from the Baileys event in the bridge to the last Frappe stage.", LATENCY_BUCKETS
+    ),
+    "whatsapp_messages_sent_total": (
+        "counter", "Outgoing send attempts, by outcome.", None
+    ),
+    "whatsapp_node_request_duration_seconds": (
+        "histogram", "Latency of HTTP calls to the Node bridge, by endpoint.", LATENCY_BUCKETS
+    ),
+    "whatsapp_request_duration_seconds": (
+        "histogram", "Latency of instrumented API endpoints.", LATENCY_BUCKETS
+    ),
+    "whatsapp_request_db_queries": (
+        "histogram", "SQL queries issued per instrumented API request.", QUERY_COUNT_BUCKETS
+    ),
+    "whatsapp_cache_requests_total": (
+        "counter", "Cache lookups, by cache and result (hit/miss).", None
+    ),
+    "whatsapp_notifications_total": (
+        "counter", "Document notifications, by result (queued/duplicate/processed/skipped/error).", None
+    ),
+    "whatsapp_history_import_total": (
+        "counter", "History sync messages, by result (queued/imported/duplicate/invalid/error).", None
+    ),
+    "whatsapp_queue_depth": (
+        "gauge", "Jobs waiting in each background queue, sampled at scrape time.", None
+    ),
+}
+
+
+# ============================================================================
+# RECORDING
+# ============================================================================
+
+def inc(name: str, value: float = 1, **labels):
+    """Increment a counter."""
+    _write([(_series(name, labels), value)])
+
+def observe(name: str, value: float, **labels):
+    """Record one observation in a histogram."""
+    buckets = METRICS[name][2]
+    updates = [
+        (_series(f"{name}_bucket", labels, le=le), 1)
+        for le in buckets if value <= le
+    ]
+    updates.append((_series(f"{name}_bucket", labels, le="+Inf"), 1))
+    updates.append((_series(f"{name}_sum", labels), value))
+    updates.append((_series(f"{name}_count", labels), 1))
+    _write(updates)
+
+@contextmanager
+def timer(name: str, **labels):
+    """Observe the duration of the block, in seconds."""
+    started = time.perf_counter()
+    try:
+        yield
+    finally:
+        observe(name, time.perf_counter() - started, **labels)
+
+def cache_hit(cache: str):
+    inc("whatsapp_cache_requests_total", cache=cache, result="hit")
+
+def cache_miss(cache: str):
+    inc("whatsapp_cache_requests_total", cache=cache, result="miss")
+
+@contextmanager
+def capture_queries():
+    """
+    Record every `frappe.db.sql` call made inside the block.
+    Yields a list that is filled with `(query, values)` tuples.
+    """
+    captured = []
+    original_sql = frappe.db.sql
+
+    def sql(query, values=(), *args, **kwargs):
+        captured.append((query, values))
+        return original_sql(query, values, *args, **kwargs)
+
+    frappe.db.sql = sql
+    try:
+        yield captured
+    finally:
+        frappe.db.sql = original_sql
+
+def instrument(endpoint: str):
+    """
+    Decorator recording latency and SQL query count of an API endpoint.
+    Place it below `@frappe.whitelist()` and `@rate_limit`.
+    """
+    def decorator(fn):
+        @wraps(fn)
+        def wrapper(*args, **kwargs):
+            started = time.perf_counter()
+            with capture_queries() as queries:
+                try:
+                    return fn(*args, **kwargs)
+                finally:
+                    observe("whatsapp_request_duration_seconds", time.perf_counter() - started, endpoint=endpoint)
+                    observe("whatsapp_request_db_queries", len(queries), endpoint=endpoint)
+        return wrapper
+    return decorator
+
+def node_request(method: str, url: str, endpoint: str, **kwargs) -> requests.Response:
+    """
+    Make an HTTP call to the Node bridge and record its latency.
+    `endpoint` is the route template used as label, e.g. "/sessions/send".
+    """
+    started = time.perf_counter()
+    status = "error"
+    try:
+        response = requests.request(method, url, **kwargs)
+        status = str(response.status_code)
+        return response
+    except requests.Timeout:
+        status = "timeout"
+        raise
+    finally:
+        observe(
+            "whatsapp_node_request_duration_seconds",
+            time.perf_counter() - started,
+            endpoint=endpoint,
+            status=status
+        )
+
+def _series(name: str, labels: Dict[str, str], le: Optional[str] = None) -> str:
+    pairs = [f'{k}="{_escape(v)}"' for k, v in sorted(labels.items())]
+    if le is not None:
+        pairs.append(f'le="{le}"')
+    return f"{name}{{{','.join(pairs)}}}" if pairs else name
+
+def _escape(value) -> str:
+    return str(value).replace("\\", "\\\\").replace("\n", "\\n").replace('"', '\\"')
+
+def _write(updates):
+    # Metrics must never break the code path being measured
+    try:
+        cache = frappe.cache()
+        key = cache.make_key(METRICS_KEY)
+        pipe = cache.pipeline(transaction=False)
+        for field, value in updates:
+            if isinstance(value, int):
+                pipe.hincrby(key, field, value)
+            else:
+                pipe.hincrbyfloat(key, field, value)
+        pipe.execute()
+    except Exception:
+        frappe.logger().debug("WhatsApp metrics write failed", exc_info=True)
+
+
+# ============================================================================
+# EXPORT
+# ============================================================================
+
+@frappe.whitelist()
+def export():
+    """Expose all metrics in the Prometheus text exposition format."""
+    from werkzeug.wrappers import Response
+
+    frappe.only_for("System Manager")
+    return Response(render(), content_type="text/plain; version=0.0.4; charset=utf-8")
+
+@frappe.whitelist()
+def reset():
+    """Clear all recorded metrics."""
+    frappe.only_for("System Manager")
+    cache = frappe.cache()
+    cache.delete(cache.make_key(METRICS_KEY))
+    return {"status": "success"}
+
+def render() -> str:
+    # Raw client on the key _write increments: the wrapper's hgetall would prefix
+    # the key again and unpickle the values
+    cache = frappe.cache()
+    pipe = cache.pipeline(transaction=False)
+    pipe.hgetall(cache.make_key(METRICS_KEY))
+    raw = pipe.execute()[0] or {}
+    samples = {_decode(k): _decode(v) for k, v in raw.items()}
+    samples.update(_queue_depths())
+
+    by_metric = {}
+    for series, value in samples.items():
+        by_metric.setdefault(_metric_name(series), []).append((series, value))
+
+    lines = []
+    for name in sorted(by_metric):
+        kind, help_text, _ = METRICS.get(name, ("untyped", "", None))
+        lines.append(f"# HELP {name} {help_text}")
+        lines.append(f"# TYPE {name} {kind}")
+        for series, value in sorted(by_metric[name], key=lambda s: _sort_key(s[0])):
+            lines.append(f"{series} {value}")
+
+    return "\n".join(lines) + "\n"
+
+def _queue_depths() -> Dict[str, int]:
+    from frappe.utils.background_jobs import get_queue, get_queues_timeout
+
+    depths = {}
+    for queue in get_queues_timeout():
+        try:
+            depths[_series("whatsapp_queue_depth", {"queue": queue})] = get_queue(queue).count
+        except Exception:
+            frappe.logger().debug(f"Could not read depth of queue {queue}", exc_info=True)
+    return depths
+
+def _metric_name(series: str) -> str:
+    name = series.split("{", 1)[0]
+    for suffix in ("_bucket", "_sum", "_count"):
+        base = name[: -len(suffix)]
+        if name.endswith(suffix) and METRICS.get(base, ("",))[0] == "histogram":
+            return base
+    return name
+
+def _sort_key(series: str):
+    # Keep histogram buckets in ascending `le` order, +Inf last
+    if 'le="' not in series:
+        return (series, 0.0)
+    head, le = series.rsplit('le="', 1)
+    le = le.split('"', 1)[0]
+    return (head, float("inf") if le == "+Inf" else float(le))
+
+def _decode(value) -> str:
+    return value.decode() if isinstance(value, bytes) else str(value)
@@ -0,0 +1,209 @@
+"""
+WhatsApp Notification Rules: messages sent when a document of a given type is
+created, saved, submitted or cancelled.
+
+`dispatch` is a doc_events hook on every doctype, so it has to cost nothing for
+doctypes without rules. Enabled rules are indexed by doctype and event in
+process memory; the index is rebuilt only when its version in Redis changes
+(a rule was saved or deleted), and that version is read at most once per
+request. Message templates are compiled once per rule version.
+
+Matching documents go through the notification queue (see notifications.py),
+so the message is rendered and sent by a background job. Link recipients
+(e.g. customer.mobile_no) are resolved with two queries per rule for each
+batch of queued documents.
+"""
+
+from collections import defaultdict
+from typing import Any, Dict, List, Optional
+
+import frappe
+from frappe.utils.jinja import get_jenv
+
+from whatsapp_integration.whatsapp_integration import notifications
+
+INDEX_VERSION_KEY = "whatsapp_notification_rule_index_version"
+
+# doc_events method -> rule event
+EVENTS = {
+    "after_insert": "New",
+    "on_update": "On Save",
+    "on_submit": "On Submit",
+    "on_cancel": "On Cancel",
+}
+
+RULE_FIELDS = ["name", "modified", "document_type", "event", "company", "recipient_field", "condition", "message"]
+
+# Per process and site: {"version": str, "rules": {(doctype, event): [rule, ...]}, "by_name": {name: rule}}
+_indexes = {}
+# Per process: (site, rule name, modified) -> compiled template
+_templates = {}
+
+
+# ============================================================================
+# RULE INDEX
+# ============================================================================
+
+def get_rules(doctype: str, event: str) -> List[Dict[str, Any]]:
+    """Enabled rules for `doctype` and `event`."""
+    return _get_index()["rules"].get((doctype, event), [])
+
+
+def get_rule(name: str) -> Optional[Dict[str, Any]]:
+    return _get_index()["by_name"].get(name)
+
+
+def clear_rule_index():
+    """Make every process rebuild its index. Called when a rule changes."""
+    frappe.cache().delete_value(INDEX_VERSION_KEY)
+
+
+def _get_index():
+    cache = frappe.cache()
+    version = cache.get_value(INDEX_VERSION_KEY)
+    if not version:
+        version = frappe.generate_hash(length=10)
+        cache.set_value(INDEX_VERSION_KEY, version)
+
+    index = _indexes.setdefault(frappe.local.site, {"version": None, "rules": {}, "by_name": {}})
+    if index["version"] != version:
+        rules = defaultdict(list)
+        by_name = {}
+        for rule in frappe.get_all("WhatsApp Notification Rule", filters={"enabled": 1}, fields=RULE_FIELDS):
+            rules[(rule.document_type, rule.event)].append(rule)
+            by_name[rule.name] = rule
+        index.update(version=version, rules=dict(rules), by_name=by_name)
+
+        # Drop templates of rules that changed or are gone
+        current = {(frappe.local.site, rule.name, rule.modified) for rule in by_name.values()}
+        for key in list(_templates):
+            if key[0] == frappe.local.site and key not in current:
+                del _templates[key]
+    return index
+
+
+def _template(rule):
+    key = (frappe.local.site, rule.name, rule.modified)
+    if key not in _templates:
+        _templates[key] = get_jenv().from_string(rule.message)
+    return _templates[key]
+
+
+# ============================================================================
+# DISPATCH
+# ============================================================================
+
+def dispatch(doc, method):
+    """doc_events hook for every doctype: queue the notifications of matching rules."""
+    if frappe.flags.in_install or frappe.flags.in_migrate or frappe.flags.in_patch:
+        return
+    event = EVENTS.get(method)
+    if not event or doc.doctype.startswith("WhatsApp "):
+        return
+
+    for rule in get_rules(doc.doctype, event):
+        try:
+            if rule.condition and not frappe.safe_eval(rule.condition, None, {"doc": doc}):
+                continue
+        except Exception as e:
+            frappe.log_error(
+                f"Error evaluating condition of {rule.name} for {doc.doctype} {doc.name}: {str(e)}",
+                "WhatsApp Notification Rule Error"
+            )
+            continue
+        notifications.queue_notification("rule", doc, rule=rule.name)
+
+
+# ============================================================================
+# DELIVERY (background job)
+# ============================================================================
+
+def resolve_recipients(entries: List[Dict[str, Any]]) -> List[Dict[str, Any]]:
+    """
+    Queue batch preparer: look up link recipients (e.g. customer.mobile_no) of
+    `entries` with one query for the documents and one for the linked records
+    per rule. Returns the extra handler arguments of each entry.
+    """
+    prepared = [{} for _entry in entries]
+    by_rule = defaultdict(list)
+    for i, entry in enumerate(entries):
+        by_rule[entry.get("rule")].append(i)
+
+    for rule_name, indexes in by_rule.items():
+        rule = get_rule(rule_name)
+        if not rule or "." not in rule.recipient_field:
+            continue
+
+        fieldname, _sep, linked_fieldname = rule.recipient_field.partition(".")
+        link_doctype = frappe.get_meta(rule.document_type).get_field(fieldname).options
+        links = dict(frappe.get_all(
+            rule.document_type,
+            filters={"name": ["in", [entries[i]["name"] for i in indexes]]},
+            fields=["name", fieldname],
+            as_list=True
+        ))
+        numbers = dict(frappe.get_all(
+            link_doctype,
+            filters={"name": ["in", list({link for link in links.values() if link})]},
+            fields=["name", linked_fieldname],
+            as_list=True
+        ))
+        for i in indexes:
+            prepared[i] = {"recipient": numbers.get(links.get(entries[i]["name"])) or ""}
+    return prepared
+
+
+def send_rule_notification(doc, rule: str, recipient: Optional[str] = None):
+    """Queue handler: render `rule` for `doc` and send it."""
+    from whatsapp_integration.whatsapp_integration.api import (
+        log_communication, sanitize_message, save_whatsapp_msg, send_whatsapp_message, validate_phone_number
+    )
+
+    rule = get_rule(rule)
+    if not rule:
+        return  # disabled or deleted since the document was queued
+
+    if recipient is None:
+        recipient = resolve_recipient(doc, rule.recipient_field)
+    receiver = validate_phone_number(recipient) if recipient else None
+    if not receiver:
+        frappe.log_error(
+            f"No valid mobile number in {rule.recipient_field} of {doc.doctype} {doc.name} for rule {rule.name}",
+            "WhatsApp Notification Rule Error"
+        )
+        return
+
+    company = doc.get("company") or rule.company
+    settings_name = frappe.db.get_value(
+        "WhatsApp Settings", {"company": company, "integration_enabled": 1}, "name"
+    ) if company else None
+    if not settings_name:
+        frappe.log_error(
+            f"WhatsApp Settings not found or disabled for company {company} (rule {rule.name})",
+            "WhatsApp Notification Skip"
+        )
+        return
+
+    message = sanitize_message(_template(rule).render(doc=doc))
+    response = send_whatsapp_message(settings_name, receiver, message)
+
+    sent = response.get("status") == "sent"
+    log_communication(
+        company=company,
+        receiver=receiver,
+        message_type=rule.name,
+        status="Success" if sent else "Error",
+        error_message=None if sent else response.get("error")
+    )
+    if sent:
+        msg_id = response.get("result", {}).get("key", {}).get("id")
+        save_whatsapp_msg(receiver, message, "Outgoing", company, msg_id)
+
+
+def resolve_recipient(doc, recipient_field: str) -> Optional[str]:
+    fieldname, _sep, linked_fieldname = recipient_field.partition(".")
+    value = doc.get(fieldname)
+    if not linked_fieldname or not value:
+        return value
+    link_doctype = doc.meta.get_field(fieldname).options
+    return frappe.db.get_value(link_doctype, value, linked_fieldname)
@@ -0,0 +1,213 @@
+"""
+Document notifications, sent outside the save path.
+
+doc_events handlers only record which document changed. When the transaction
+commits, the entries are deduplicated per document version (a Redis NX key),
+appended to a Redis list, and a single background job is enqueued to drain it.
+The job sends at most NOTIFICATIONS_PER_MINUTE messages, so a bulk submission
+(e.g. a data import of 500 invoices) becomes one throttled batch instead of 500
+concurrent sends. Saving a document never waits on the Node bridge.
+
+Entries are delivered at least once: an entry is removed from the list only
+after it was handled, so a killed job may resend the message it was sending.
+The scheduler picks up entries left behind by a job that ran out of time.
+"""
+
+import json
+import time
+from typing import Any, Dict, List
+
+import frappe
+
+from whatsapp_integration.whatsapp_integration import metrics
+
+QUEUE_KEY = "whatsapp_notification_queue"
+DEDUPE_TTL = 7 * 24 * 3600   # seconds a document version is remembered as notified
+NOTIFICATIONS_PER_MINUTE = 20
+DRAIN_BATCH_SIZE = 50
+DRAIN_BUDGET = 20 * 60       # seconds per job; the scheduler enqueues the rest
+
+DRAIN_JOB_ID = "whatsapp_notification_drain"
+
+# WhatsApp Settings trigger -> doc_events method
+TRIGGER_EVENTS = {"On Submit": "on_submit", "On Save": "on_update"}
+
+# Entry handler -> function sending the notification for a document
+HANDLERS = {
+    "invoice": "whatsapp_integration.whatsapp_integration.api.send_invoice_notification",
+    "rule": "whatsapp_integration.whatsapp_integration.notification_rules.send_rule_notification",
+}
+
+# Entry handler -> function preparing a batch of its entries (e.g. looking up
+# recipients in one query); returns extra handler arguments for each entry
+PREPARERS = {
+    "rule": "whatsapp_integration.whatsapp_integration.notification_rules.resolve_recipients",
+}
+
+
+# ============================================================================
+# QUEUEING
+# ============================================================================
+
+def on_invoice_event(doc, method):
+    """doc_events hook of Sales Invoice (on_update and on_submit)."""
+    trigger = frappe.db.get_value(
+        "WhatsApp Settings",
+        {"company": doc.company, "integration_enabled": 1},
+        "invoice_notification_trigger"
+    )
+    if TRIGGER_EVENTS.get(trigger) == method:
+        queue_notification("invoice", doc)
+
+
+def queue_notification(handler: str, doc, **extra):
+    """
+    Queue a notification of `doc` by `handler` once the current transaction
+    commits. Nothing is queued if it rolls back.
+    """
+    entry = {"handler": handler, "doctype": doc.doctype, "name": doc.name, "version": str(doc.modified), **extra}
+
+    pending = frappe.flags.whatsapp_pending_notifications
+    if pending is None:
+        pending = frappe.flags.whatsapp_pending_notifications = []
+        frappe.db.after_commit.add(flush_pending)
+        frappe.db.after_rollback.add(discard_pending)
+    pending.append(entry)
+
+
+def flush_pending():
+    """After commit: push this transaction's new entries and start the drain job."""
+    pending = frappe.flags.pop("whatsapp_pending_notifications", None) or []
+    if not pending:
+        return
+
+    # The document is already saved; a failure here must not surface to the user
+    try:
+        # Claim each document version; a version claimed by another transaction is a duplicate
+        pipe = frappe.cache().pipeline(transaction=False)
+        for entry in pending:
+            pipe.set(_dedupe_key(entry), 1, nx=True, ex=DEDUPE_TTL)
+        fresh = [entry for entry, is_new in zip(pending, pipe.execute()) if is_new]
+
+        if len(fresh) < len(pending):
+            metrics.inc("whatsapp_notifications_total", len(pending) - len(fresh), result="duplicate")
+        if not fresh:
+            return
+
+        try:
+            _redis("rpush", _key(QUEUE_KEY), *[json.dumps(entry) for entry in fresh])
+        except Exception:
+            # Not queued: release the claims so the next save can notify
+            _redis("delete", *[_dedupe_key(entry) for entry in fresh])
+            raise
+        metrics.inc("whatsapp_notifications_total", len(fresh), result="queued")
+        enqueue_drain()
+    except Exception as e:
+        frappe.log_error(
+            f"Error queueing notifications: {str(e)}\n{frappe.get_traceback()}",
+            "WhatsApp Notification Error"
+        )
+
+
+def discard_pending():
+    frappe.flags.pop("whatsapp_pending_notifications", None)
+
+
+def enqueue_drain():
+    """Start the drain job unless it is queued or running. Also run by the scheduler."""
+    if not _redis("llen", _key(QUEUE_KEY)):
+        return
+    frappe.enqueue(
+        "whatsapp_integration.whatsapp_integration.notifications.drain_queue",
+        queue="long",
+        timeout=DRAIN_BUDGET + 300,
+        job_id=DRAIN_JOB_ID,
+        deduplicate=True
+    )
+
+
+# ============================================================================
+# DELIVERY
+# ============================================================================
+
+def drain_queue():
+    """Background job: send queued notifications, throttled, for up to DRAIN_BUDGET seconds."""
+    key = _key(QUEUE_KEY)
+    interval = 60 / NOTIFICATIONS_PER_MINUTE
+    deadline = time.monotonic() + DRAIN_BUDGET
+
+    while time.monotonic() < deadline:
+        batch = _redis("lrange", key, 0, DRAIN_BATCH_SIZE - 1)
+        if not batch:
+            return
+        entries = [json.loads(raw) for raw in batch]
+        for entry, prepared in zip(entries, prepare(entries)):
+            started = time.monotonic()
+            deliver(entry, **prepared)
+            _redis("lpop", key)
+            if time.monotonic() >= deadline:
+                return
+            time.sleep(max(interval - (time.monotonic() - started), 0))
+
+
+def prepare(entries: List[Dict[str, Any]]) -> List[Dict[str, Any]]:
+    """Extra handler arguments for each entry of a batch, from the handlers' preparers."""
+    prepared = [{} for _entry in entries]
+    for handler, preparer in PREPARERS.items():
+        indexes = [i for i, entry in enumerate(entries) if entry["handler"] == handler]
+        if not indexes:
+            continue
+        try:
+            results = frappe.get_attr(preparer)([entries[i] for i in indexes])
+        except Exception as e:
+            # Each entry is then prepared by its handler
+            frappe.log_error(
+                f"Error preparing {handler} notifications: {str(e)}\n{frappe.get_traceback()}",
+                "WhatsApp Notification Error"
+            )
+            continue
+        for i, result in zip(indexes, results):
+            prepared[i] = result
+    return prepared
+
+
+def deliver(entry: Dict[str, Any], **prepared):
+    """Send the notification of one queue entry."""
+    try:
+        if not frappe.db.exists(entry["doctype"], entry["name"]):
+            metrics.inc("whatsapp_notifications_total", result="skipped")
+            return
+
+        doc = frappe.get_doc(entry["doctype"], entry["name"])
+        frappe.get_attr(HANDLERS[entry["handler"]])(doc, **_extra(entry), **prepared)
+        frappe.db.commit()
+        metrics.inc("whatsapp_notifications_total", result="processed")
+    except Exception as e:
+        frappe.db.rollback()
+        metrics.inc("whatsapp_notifications_total", result="error")
+        frappe.log_error(
+            f"Error sending notification for {entry.get('doctype')} {entry.get('name')}: {str(e)}\n{frappe.get_traceback()}",
+            "WhatsApp Notification Error"
+        )
+
+
+def _extra(entry: Dict[str, Any]) -> Dict[str, Any]:
+    return {k: v for k, v in entry.items() if k not in ("handler", "doctype", "name", "version")}
+
+
+def _dedupe_key(entry: Dict[str, Any]) -> str:
+    return _key("whatsapp_notification_sent", *(str(entry[k]) for k in sorted(entry)))
+
+
+def _key(*parts: str) -> str:
+    return frappe.cache().make_key(":".join(parts))
+
+
+def _redis(command: str, *args):
+    """
+    Run a raw redis command on keys built with _key. RedisWrapper's list methods
+    would prefix the key a second time (and rpush takes a single value).
+    """
+    pipe = frappe.cache().pipeline(transaction=False)
+    getattr(pipe, command)(*args)
+    return pipe.execute()[0]
@@ -0,0 +1,133 @@
+"""
+Bulk WhatsApp number validation.
+
+Customer and Contact mobiles are checked through the Node bridge's
+/sessions/check-numbers endpoint, which batches them into a few onWhatsApp
+queries under a per-session rate budget. Results are kept in WhatsApp Number
+Status for NUMBER_STATUS_TTL_DAYS, and sends skip numbers known not to be on
+WhatsApp.
+
+Run from WhatsApp Settings > Actions > Check Customer Numbers, or:
+    bench execute whatsapp_integration.whatsapp_integration.number_check.run_number_check \
+        --kwargs "{'settings_name': 'WA-My Company'}"
+"""
+
+from typing import Dict, List
+
+import frappe
+from frappe.utils import add_days, now_datetime
+
+from whatsapp_integration.whatsapp_integration import metrics
+
+NUMBER_STATUS_TTL_DAYS = 30
+CHECK_BATCH_SIZE = 500   # numbers per request; the bridge accepts up to 1000
+
+
+def is_known_non_whatsapp(phone: str) -> bool:
+    """True if `phone` was recently checked and is not on WhatsApp."""
+    status = frappe.db.get_value(
+        "WhatsApp Number Status", phone, ["on_whatsapp", "checked_on"], as_dict=True
+    )
+    return bool(status and not status.on_whatsapp and status.checked_on >= _cutoff())
+
+
+@frappe.whitelist()
+def enqueue_number_check(name: str):
+    """Check every Customer and Contact mobile in the background."""
+    frappe.only_for("System Manager")
+    frappe.enqueue(
+        "whatsapp_integration.whatsapp_integration.number_check.run_number_check",
+        queue="long",
+        timeout=6 * 3600,
+        job_id=f"whatsapp_number_check::{name}",
+        deduplicate=True,
+        settings_name=name
+    )
+    return {"status": "queued"}
+
+
+def run_number_check(settings_name: str):
+    """Check all party mobiles that have no fresh status."""
+    try:
+        fresh = set(frappe.get_all(
+            "WhatsApp Number Status",
+            filters={"checked_on": [">=", _cutoff()]},
+            pluck="name"
+        ))
+        phones = [phone for phone in get_party_numbers() if phone not in fresh]
+        frappe.logger().info(f"WhatsApp: checking {len(phones)} numbers ({len(fresh)} still fresh)")
+
+        statuses = check_numbers(settings_name, phones)
+        missing = sum(1 for exists in statuses.values() if not exists)
+        frappe.logger().info(f"WhatsApp: number check done, {missing} of {len(statuses)} not on WhatsApp")
+    except Exception as e:
+        frappe.log_error(
+            f"Error checking WhatsApp numbers: {str(e)}\n{frappe.get_traceback()}",
+            "WhatsApp Number Check Error"
+        )
+
+
+def check_numbers(settings_name: str, phones: List[str]) -> Dict[str, bool]:
+    """
+    Check validated `phones` with the session of `settings_name` and store the
+    results. Returns phone -> on WhatsApp. Each batch is committed on its own so
+    an interrupted run keeps what it has checked.
+    """
+    settings = frappe.get_doc("WhatsApp Settings", settings_name)
+    node_url = settings.node_url or "http://127.0.0.1:3000"
+    session_id = settings.name.replace(" ", "_")
+
+    statuses = {}
+    for start in range(0, len(phones), CHECK_BATCH_SIZE):
+        batch = phones[start:start + CHECK_BATCH_SIZE]
+        response = metrics.node_request(
+            "POST",
+            f"{node_url}/sessions/check-numbers",
+            "/sessions/check-numbers",
+            json={"sessionId": session_id, "phones": batch},
+            timeout=300
+        )
+        response.raise_for_status()
+
+        results = response.json().get("results") or []
+        save_number_statuses(results)
+        frappe.db.commit()
+        statuses.update({result["phone"]: bool(result["exists"]) for result in results})
+    return statuses
+
+
+def save_number_statuses(results: List[Dict]):
+    """Replace the stored status of each checked number."""
+    if not results:
+        return
+
+    now = now_datetime()
+    user = frappe.session.user
+    frappe.db.delete("WhatsApp Number Status", {"name": ["in", [r["phone"] for r in results]]})
+    frappe.db.bulk_insert(
+        "WhatsApp Number Status",
+        ["name", "phone", "on_whatsapp", "jid", "checked_on", "creation", "modified", "owner", "modified_by"],
+        [
+            (r["phone"], r["phone"], 1 if r["exists"] else 0, r.get("jid"), now, now, now, user, user)
+            for r in results
+        ]
+    )
+
+
+def get_party_numbers() -> List[str]:
+    """Distinct, validated mobile numbers of all Contacts and Customers."""
+    from whatsapp_integration.whatsapp_integration.api import validate_phone_number
+
+    numbers = set()
+    for doctype, fields in (("Contact", ["mobile_no", "phone"]), ("Customer", ["mobile_no"])):
+        for row in frappe.get_all(doctype, fields=fields, as_list=True):
+            for value in row:
+                phone = validate_phone_number(value) if value else None
+                # Group IDs and LIDs can't be checked
+                if phone and phone.isdigit() and len(phone) < 14:
+                    numbers.add(phone)
+    return sorted(numbers)
+
+
+def _cutoff():
+    return add_days(now_datetime(), -NUMBER_STATUS_TTL_DAYS)
@@ -0,0 +1,203 @@
+"""
+Phone -> party index for linking WhatsApp messages to Contacts and Customers.
+
+WhatsApp Party Phone holds one row per number of a Contact (with each Customer
+it is linked to through Dynamic Link) and per Customer mobile, keyed by the
+number's full international digits as WhatsApp reports them. Numbers saved
+without a country code get the default one when they are indexed, so that
+"+91 98765 43210", "09876543210" and "919876543210" match while +44 7700900123
+and +91 7700900123 do not. Contact and Customer doc_events keep it current;
+`rebuild` fills it from scratch (see patches/backfill_party_phone_index.py).
+
+Incoming webhook batches resolve all their senders with one indexed query.
+"""
+
+import re
+from collections import defaultdict
+from typing import Dict, Iterable, List, Optional, Tuple
+
+import frappe
+from frappe import _
+from frappe.utils import now_datetime
+
+MIN_PHONE_DIGITS = 7
+NATIONAL_NUMBER_DIGITS = 10   # saved numbers up to this long without a prefix are national
+INSERT_BATCH_SIZE = 1000
+
+
+def phone_key(phone: Optional[str]) -> Optional[str]:
+    """Digits of `phone`, a number or JID from WhatsApp (so with its country code), or None if it is too short."""
+    if not phone:
+        return None
+    digits = re.sub(r"\D", "", str(phone).split("@")[0])
+    return digits if len(digits) >= MIN_PHONE_DIGITS else None
+
+
+def index_key(number: Optional[str], country_code: str) -> Optional[str]:
+    """
+    phone_key of a number as saved on a Contact or Customer. "+..." and "00..."
+    are international; "0..." and short numbers are national and get `country_code`.
+    """
+    if not number:
+        return None
+    number = str(number).strip()
+    digits = re.sub(r"\D", "", number)
+    if number.startswith("+"):
+        pass
+    elif digits.startswith("00"):
+        digits = digits[2:]
+    elif country_code and digits.startswith("0"):
+        digits = country_code + digits.lstrip("0")
+    elif country_code and len(digits) <= NATIONAL_NUMBER_DIGITS:
+        digits = country_code + digits
+    return phone_key(digits)
+
+
+def default_country_code() -> str:
+    """
+    Calling code, as digits, of numbers saved without one: site config
+    `whatsapp_default_country_code`, else the country of System Settings.
+    """
+    from frappe.geo.country_info import get_country_info
+
+    code = frappe.conf.get("whatsapp_default_country_code")
+    if not code:
+        country = frappe.db.get_single_value("System Settings", "country")
+        code = (get_country_info(country) or {}).get("isd") if country else None
+    return re.sub(r"\D", "", str(code or ""))
+
+
+# ============================================================================
+# LOOKUP
+# ============================================================================
+
+def lookup(phones: Iterable[str]) -> Dict[str, Optional[Dict[str, Optional[str]]]]:
+    """
+    Contact and Customer of each of `phones`, in one query. Returns phone key ->
+    {"contact", "customer"}, or None for numbers without a party. Rows with a
+    Customer win over Contact-only rows.
+    """
+    keys = {key for key in map(phone_key, phones) if key}
+    parties = dict.fromkeys(keys)
+    if not keys:
+        return parties
+
+    rows = frappe.db.sql("""
+        SELECT phone_key, contact, customer
+        FROM `tabWhatsApp Party Phone`
+        WHERE phone_key IN %(keys)s
+        ORDER BY (customer IS NOT NULL AND customer != '') DESC, modified DESC
+    """, {"keys": tuple(keys)}, as_dict=1)
+    for row in rows:
+        if parties[row.phone_key] is None:
+            parties[row.phone_key] = {"contact": row.contact or None, "customer": row.customer or None}
+    return parties
+
+
+# ============================================================================
+# MAINTENANCE (doc_events)
+# ============================================================================
+
+def update_contact(doc, method=None):
+    """Contact on_update: replace the contact's rows."""
+    frappe.db.delete("WhatsApp Party Phone", {"contact": doc.name})
+    numbers = {doc.get("mobile_no"), doc.get("phone")}
+    numbers.update(row.phone for row in doc.get("phone_nos") or [])
+    customers = [link.link_name for link in doc.get("links") or [] if link.link_doctype == "Customer"]
+    _insert_rows(
+        (number, doc.name, customer)
+        for number in numbers if number
+        for customer in (customers or [None])
+    )
+
+
+def remove_contact(doc, method=None):
+    frappe.db.delete("WhatsApp Party Phone", {"contact": doc.name})
+
+
+def update_customer(doc, method=None):
+    """Customer on_update: replace the row of the customer's own mobile."""
+    frappe.db.sql("""
+        DELETE FROM `tabWhatsApp Party Phone`
+        WHERE customer = %s AND IFNULL(contact, '') = ''
+    """, doc.name)
+    if doc.get("mobile_no"):
+        _insert_rows([(doc.mobile_no, None, doc.name)])
+
+
+def remove_customer(doc, method=None):
+    frappe.db.delete("WhatsApp Party Phone", {"customer": doc.name})
+
+
+def rebuild():
+    """Rebuild the whole index from Contacts and Customers."""
+    frappe.db.delete("WhatsApp Party Phone")
+
+    customers_by_contact = defaultdict(list)
+    for contact, customer in frappe.db.sql("""
+        SELECT parent, link_name FROM `tabDynamic Link`
+        WHERE parenttype = 'Contact' AND link_doctype = 'Customer'
+    """):
+        customers_by_contact[contact].append(customer)
+
+    numbers_by_contact = defaultdict(set)
+    for contact, mobile_no, phone in frappe.db.sql("SELECT name, mobile_no, phone FROM `tabContact`"):
+        numbers_by_contact[contact].update((mobile_no, phone))
+    for contact, phone in frappe.db.sql("SELECT parent, phone FROM `tabContact Phone` WHERE parenttype = 'Contact'"):
+        numbers_by_contact[contact].add(phone)
+
+    rows = [
+        (number, contact, customer)
+        for contact, numbers in numbers_by_contact.items()
+        for number in numbers if number
+        for customer in (customers_by_contact.get(contact) or [None])
+    ]
+    rows.extend(
+        (mobile_no, None, customer)
+        for customer, mobile_no in frappe.db.sql("SELECT name, mobile_no FROM `tabCustomer` WHERE IFNULL(mobile_no, '') != ''")
+    )
+    _insert_rows(rows)
+
+
+def link_existing_messages():
+    """Fill contact and customer of individual messages saved before the index existed."""
+    for field in ("customer", "contact"):
+        frappe.db.sql(f"""
+            UPDATE `tabWhatsApp Message` m
+            JOIN `tabWhatsApp Party Phone` p
+                ON p.phone_key = IF(m.message_type = 'Incoming', m.sender, m.receiver)
+            SET m.{field} = p.{field}
+            WHERE IFNULL(m.{field}, '') = ''
+            AND IFNULL(p.{field}, '') != ''
+            AND (m.is_group_message = 0 OR m.is_group_message IS NULL)
+        """)
+
+
+def _insert_rows(rows: Iterable[Tuple[str, Optional[str], Optional[str]]]):
+    now = now_datetime()
+    user = frappe.session.user
+    country_code = default_country_code()
+    values: List[tuple] = []
+    seen = set()
+    for number, contact, customer in rows:
+        key = index_key(number, country_code)
+        if key and (key, contact, customer) not in seen:
+            seen.add((key, contact, customer))
+            values.append((frappe.generate_hash(length=10), key, number, contact, customer, now, now, user, user))
+
+    for start in range(0, len(values), INSERT_BATCH_SIZE):
+        frappe.db.bulk_insert(
+            "WhatsApp Party Phone",
+            ["name", "phone_key", "phone", "contact", "customer", "creation", "modified", "owner", "modified_by"],
+            values[start:start + INSERT_BATCH_SIZE]
+        )
+
+
+# ============================================================================
+# CUSTOMER DASHBOARD
+# ============================================================================
+
+def get_customer_dashboard_data(data):
+    """Add WhatsApp Messages (by their customer link) to the Customer dashboard."""
+    data.setdefault("transactions", []).append({"label": _("WhatsApp"), "items": ["WhatsApp Message"]})
+    return data
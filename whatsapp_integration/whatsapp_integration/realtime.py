@@ -0,0 +1,73 @@
+"""
+Targeted realtime delivery for the chat widget.
+
+Instead of broadcasting to every socket on the site, events go only to users
+whose widget subscribed:
+- per company, for inbox deltas (new messages), once the widget was opened;
+- per conversation, for receipts and presence of the chat open in a browser tab.
+
+Subscriptions are Redis sorted sets of user (or user::tab, for conversations)
+-> expiry. The widget renews its
+subscription every 45 seconds, so closed tabs drop out after SUBSCRIPTION_TTL.
+Events are then published to each subscriber's user room.
+"""
+
+import time
+from typing import Any, Dict, List, Optional
+
+import frappe
+from frappe import _
+
+SUBSCRIPTION_TTL = 120  # seconds
+KEY_PREFIX = "whatsapp_realtime"
+TAB_SEPARATOR = "::"
+
+
+@frappe.whitelist()
+def subscribe(company: str, conversation: Optional[str] = None, tab: Optional[str] = None):
+    """
+    Subscribe the current user to `company`'s inbox and, if given, the browser
+    tab `tab` to the open `conversation` (phone number or group ID). A tab that
+    moves to another chat simply stops renewing the old subscription, which
+    expires after SUBSCRIPTION_TTL; other tabs of the user are not affected.
+    """
+    if not frappe.has_permission("WhatsApp Message", "read"):
+        frappe.throw(_("Not permitted"), frappe.PermissionError)
+    if not frappe.has_permission("Company", "read", company):
+        frappe.throw(_("Not permitted"), frappe.PermissionError)
+
+    user = frappe.session.user
+    expires = time.time() + SUBSCRIPTION_TTL
+
+    pipe = frappe.cache().pipeline(transaction=False)
+    pipe.zadd(_key("company", company), {user: expires})
+    pipe.expire(_key("company", company), SUBSCRIPTION_TTL)
+    if conversation:
+        conversation_key = _key("conversation", company, conversation)
+        pipe.zadd(conversation_key, {f"{user}{TAB_SEPARATOR}{tab or ''}": expires})
+        pipe.expire(conversation_key, SUBSCRIPTION_TTL)
+    pipe.execute()
+
+    return {"status": "success", "ttl": SUBSCRIPTION_TTL}
+
+
+def publish(event: str, message: Dict[str, Any], company: str, conversation: Optional[str] = None):
+    """Publish `event` to the subscribers of `company`, or of one of its conversations."""
+    key = _key("conversation", company, conversation) if conversation else _key("company", company)
+    for user in subscribers(key):
+        frappe.publish_realtime(event, message, user=user)
+
+
+def subscribers(key: str) -> List[str]:
+    cache = frappe.cache()
+    pipe = cache.pipeline(transaction=False)
+    pipe.zremrangebyscore(key, 0, time.time())
+    pipe.zrange(key, 0, -1)
+    _, users = pipe.execute()
+    # Conversation members are "user::tab"; several tabs of a user get one event
+    members = (member.decode() if isinstance(member, bytes) else member for member in users)
+    return list(dict.fromkeys(member.split(TAB_SEPARATOR, 1)[0] for member in members))
+
+
+def _key(*parts: str) -> str:
+    return frappe.cache().make_key(":".join((KEY_PREFIX,) + parts))
@@ -0,0 +1,33 @@
+frappe.query_reports['WhatsApp Event Latency'] = {
+    filters: [
+        {
+            fieldname: 'from_date',
+            label: __('From Date'),
+            fieldtype: 'Datetime',
+            default: frappe.datetime.add_days(frappe.datetime.now_datetime(), -1)
+        },
+        {
+            fieldname: 'to_date',
+            label: __('To Date'),
+            fieldtype: 'Datetime',
+            default: frappe.datetime.now_datetime()
+        },
+        {
+            fieldname: 'event',
+            label: __('Event'),
+            fieldtype: 'Select',
+            options: '\nmessages.upsert\nmessage.status\nconnection.update\npresence.update'
+        },
+        {
+            fieldname: 'min_total_ms',
+            label: __('Slower Than (ms)'),
+            fieldtype: 'Float'
+        },
+        {
+            fieldname: 'limit',
+            label: __('Show Slowest'),
+            fieldtype: 'Int',
+            default: 100
+        }
+    ]
+};
@@ -0,0 +1,93 @@
+import frappe
+from frappe import _
+
+STAGE_COLUMNS = [
+    ("wa_to_bridge_ms", "WhatsApp to Bridge"),
+    ("media_ms", "Media Download"),
+    ("bridge_ms", "Bridge Processing"),
+    ("retry_ms", "Webhook Retries"),
+    ("network_ms", "Network to Frappe"),
+    ("save_ms", "Save"),
+    ("commit_ms", "Commit"),
+    ("publish_ms", "Realtime Publish"),
+]
+
+def execute(filters=None):
+    """Slowest recorded webhook events with their per-stage breakdown."""
+    filters = frappe._dict(filters or {})
+    data = get_data(filters)
+    return get_columns(), data, None, get_chart(data), get_summary(filters)
+
+def get_columns():
+    columns = [
+        {"fieldname": "creation", "label": _("Recorded On"), "fieldtype": "Datetime", "width": 160},
+        {"fieldname": "name", "label": _("Trace"), "fieldtype": "Link", "options": "WhatsApp Event Trace", "width": 120},
+        {"fieldname": "event", "label": _("Event"), "fieldtype": "Data", "width": 130},
+        {"fieldname": "message_id", "label": _("Message ID"), "fieldtype": "Data", "width": 160},
+        {"fieldname": "total_ms", "label": _("Total (ms)"), "fieldtype": "Float", "width": 100},
+        {"fieldname": "webhook_attempts", "label": _("Attempts"), "fieldtype": "Int", "width": 80},
+    ]
+    for fieldname, label in STAGE_COLUMNS:
+        columns.append({"fieldname": fieldname, "label": _(label), "fieldtype": "Float", "width": 110})
+    return columns
+
+def get_conditions(filters):
+    conditions = {}
+    if filters.from_date and filters.to_date:
+        conditions["creation"] = ["between", [filters.from_date, filters.to_date]]
+    elif filters.from_date:
+        conditions["creation"] = [">=", filters.from_date]
+    if filters.event:
+        conditions["event"] = filters.event
+    if filters.min_total_ms:
+        conditions["total_ms"] = [">=", filters.min_total_ms]
+    return conditions
+
+def get_data(filters):
+    return frappe.get_all(
+        "WhatsApp Event Trace",
+        filters=get_conditions(filters),
+        fields=["name", "creation", "event", "message_id", "total_ms", "webhook_attempts"]
+        + [fieldname for fieldname, _label in STAGE_COLUMNS],
+        order_by="total_ms desc",
+        limit_page_length=min(int(filters.limit or 100), 1000)
+    )
+
+def get_chart(data):
+    """Average time spent in each stage across the listed events."""
+    if not data:
+        return None
+
+    averages = []
+    for fieldname, _label in STAGE_COLUMNS:
+        values = [row[fieldname] for row in data if row.get(fieldname) is not None]
+        averages.append(round(sum(values) / len(values), 1) if values else 0)
+
+    return {
+        "data": {
+            "labels": [_(label) for _fieldname, label in STAGE_COLUMNS],
+            "datasets": [{"name": _("Average (ms)"), "values": averages}]
+        },
+        "type": "bar"
+    }
+
+def get_summary(filters):
+    totals = frappe.get_all(
+        "WhatsApp Event Trace",
+        filters=get_conditions(filters),
+        pluck="total_ms",
+        order_by="total_ms asc",
+        limit_page_length=0
+    )
+    if not totals:
+        return []
+
+    def percentile(p):
+        return totals[min(int(round(p * (len(totals) - 1))), len(totals) - 1)]
+
+    return [
+        {"value": len(totals), "label": _("Recorded Events"), "datatype": "Int"},
+        {"value": percentile(0.5), "label": _("p50 Total (ms)"), "datatype": "Float"},
+        {"value": percentile(0.95), "label": _("p95 Total (ms)"), "datatype": "Float"},
+        {"value": totals[-1], "label": _("Max Total (ms)"), "datatype": "Float", "indicator": "Red"},
+    ]
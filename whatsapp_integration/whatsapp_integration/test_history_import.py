@@ -0,0 +1,74 @@
+from unittest.mock import patch
+
+import frappe
+from frappe.tests.utils import FrappeTestCase
+
+from whatsapp_integration.whatsapp_integration import history_import
+
+# Run with: bench --site <site> run-tests --module whatsapp_integration.whatsapp_integration.test_history_import
+
+
+class TestHistoryImport(FrappeTestCase):
+    def setUp(self):
+        self.prefix = f"_TESTWA{frappe.generate_hash(length=6)}"
+        self.settings = frappe._dict(name="WA-_Test History", company="_Test WhatsApp Company")
+        self.clear()
+
+    def tearDown(self):
+        self.clear()
+
+    def clear(self):
+        history_import._redis("delete", history_import._key(history_import.QUEUE_KEY))
+        frappe.db.delete("WhatsApp Message", {"message_id": ["like", f"{self.prefix}%"]})
+        frappe.db.commit()
+
+    def chunk(self, count):
+        return {"messages": [
+            {
+                "id": f"{self.prefix}{i}",
+                "remoteJid": "919876543210@s.whatsapp.net",
+                "fromMe": i % 2 == 1,
+                "from": "919876543210",
+                "text": f"history {i}",
+                "timestamp": 1700000000 + i,
+                "pushName": "History Test",
+                "isGroup": False,
+            }
+            for i in range(count)
+        ]}
+
+    def drain(self):
+        with patch.object(history_import.time, "sleep"):
+            history_import.drain_queue()
+
+    def imported(self):
+        return frappe.get_all(
+            "WhatsApp Message",
+            filters={"message_id": ["like", f"{self.prefix}%"]},
+            fields=["message_id", "message_type", "sender", "receiver"],
+            order_by="creation asc"
+        )
+
+    def test_queued_chunk_is_imported(self):
+        with patch.object(history_import, "enqueue_drain") as enqueue_drain:
+            history_import.handle_history_import(self.settings, self.chunk(3))
+        enqueue_drain.assert_called_once()
+
+        self.drain()
+
+        messages = self.imported()
+        self.assertEqual([m.message_id for m in messages], [f"{self.prefix}{i}" for i in range(3)])
+        self.assertEqual(messages[0].message_type, "Incoming")
+        self.assertEqual(messages[0].receiver, "Me")
+        self.assertEqual(messages[1].message_type, "Outgoing")
+        self.assertEqual(messages[1].sender, "Me")
+        self.assertEqual(history_import._redis("llen", history_import._key(history_import.QUEUE_KEY)), 0)
+
+    def test_reimport_skips_saved_messages(self):
+        with patch.object(history_import, "enqueue_drain"):
+            history_import.handle_history_import(self.settings, self.chunk(2))
+            history_import.handle_history_import(self.settings, self.chunk(3))
+
+        self.drain()
+
+        self.assertEqual(len(self.imported()), 3)
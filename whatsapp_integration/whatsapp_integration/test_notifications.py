@@ -0,0 +1,59 @@
+from unittest.mock import patch
+
+import frappe
+from frappe.tests.utils import FrappeTestCase
+
+from whatsapp_integration.whatsapp_integration import notifications
+
+# Run with: bench --site <site> run-tests --module whatsapp_integration.whatsapp_integration.test_notifications
+
+
+class TestNotificationQueue(FrappeTestCase):
+    def setUp(self):
+        self.docs = [
+            frappe._dict(doctype="Sales Invoice", name=f"_Test WA {frappe.generate_hash(length=8)}", modified=frappe.utils.now())
+            for _i in range(2)
+        ]
+        self.clear()
+
+    def tearDown(self):
+        self.clear()
+
+    def clear(self):
+        notifications.discard_pending()
+        notifications._redis("delete", notifications._key(notifications.QUEUE_KEY))
+        for doc in self.docs:
+            entry = {"handler": "invoice", "doctype": doc.doctype, "name": doc.name, "version": str(doc.modified)}
+            notifications._redis("delete", notifications._dedupe_key(entry))
+
+    def queued(self):
+        return notifications._redis("lrange", notifications._key(notifications.QUEUE_KEY), 0, -1)
+
+    def test_flush_queues_every_pending_entry(self):
+        with patch.object(notifications, "enqueue_drain") as enqueue_drain:
+            for doc in self.docs:
+                notifications.queue_notification("invoice", doc)
+            notifications.flush_pending()
+
+        self.assertEqual(len(self.queued()), 2)
+        enqueue_drain.assert_called_once()
+
+    def test_same_version_is_queued_once(self):
+        with patch.object(notifications, "enqueue_drain"):
+            for _i in range(2):
+                notifications.queue_notification("invoice", self.docs[0])
+                notifications.flush_pending()
+
+        self.assertEqual(len(self.queued()), 1)
+
+    def test_drain_delivers_and_empties_queue(self):
+        with patch.object(notifications, "enqueue_drain"):
+            for doc in self.docs:
+                notifications.queue_notification("invoice", doc)
+            notifications.flush_pending()
+
+        with patch.object(notifications, "deliver") as deliver, patch.object(notifications.time, "sleep"):
+            notifications.drain_queue()
+
+        self.assertEqual([call.args[0]["name"] for call in deliver.call_args_list], [doc.name for doc in self.docs])
+        self.assertEqual(self.queued(), [])
@@ -0,0 +1,133 @@
+"""
+End-to-end latency tracing for webhook events.
+
+The Node bridge stamps every event with a correlation id and epoch-millisecond
+stage timestamps (`wa`, `received`, `media_start`, `media_end`,
+`webhook_queued`, `webhook_sent`). `handle_callback` adds the Frappe stages
+(`frappe_received`, `saved`, `committed`, `published`) and `finish` records the
+breakdown in `WhatsApp Event Trace` for a sample of events plus every slow one.
+Traces are inserted by a background job, so recording one never commits the
+webhook's own transaction.
+
+Site config:
+    whatsapp_trace_sample_rate: fraction of events to record (default 0.01)
+    whatsapp_trace_slow_ms: always record events whose Frappe-side handling took
+        longer than this (default 5000); time spent in the bridge's outbox, e.g.
+        while Frappe was down, does not count
+"""
+
+import json
+import random
+import time
+from typing import Any, Dict, Optional
+
+import frappe
+
+from whatsapp_integration.whatsapp_integration import metrics
+
+DEFAULT_SAMPLE_RATE = 0.01
+DEFAULT_SLOW_MS = 5000
+
+# (field, from stage, to stage) - a stage pair is skipped if either end is missing
+STAGE_SPANS = (
+    ("wa_to_bridge_ms", "wa", "received"),
+    ("media_ms", "media_start", "media_end"),
+    ("retry_ms", "webhook_queued", "webhook_sent"),
+    ("network_ms", "webhook_sent", "frappe_received"),
+    ("save_ms", "frappe_received", "saved"),
+    ("commit_ms", "saved", "committed"),
+    ("publish_ms", "committed", "published"),
+)
+
+def now_ms() -> float:
+    return time.time() * 1000
+
+def start(data: Dict[str, Any], event: str, session_id: str):
+    """Begin tracing the current webhook request."""
+    trace = data.get("trace") or {}
+    stages = dict(trace.get("stages") or {})
+    stages["frappe_received"] = now_ms()
+
+    frappe.local.whatsapp_trace = {
+        "id": trace.get("id") or frappe.generate_hash(length=16),
+        "event": event,
+        "session_id": session_id,
+        "attempts": trace.get("attempts") or 0,
+        "message_id": None,
+        "stages": stages
+    }
+
+def mark(stage: str, message_id: Optional[str] = None):
+    """Record the time a stage completed for the current trace, if any."""
+    trace = getattr(frappe.local, "whatsapp_trace", None)
+    if not trace:
+        return
+    trace["stages"][stage] = now_ms()
+    if message_id and not trace["message_id"]:
+        trace["message_id"] = message_id
+
+def finish():
+    """Compute the stage breakdown, export it as a metric and queue sampled or slow traces for saving."""
+    trace = getattr(frappe.local, "whatsapp_trace", None)
+    frappe.local.whatsapp_trace = None
+    if not trace:
+        return
+
+    try:
+        stages = trace["stages"]
+        breakdown = breakdown_of(stages)
+        metrics.observe("whatsapp_event_e2e_seconds", breakdown["total_ms"] / 1000, event=trace["event"])
+
+        slow_ms = frappe.conf.get("whatsapp_trace_slow_ms", DEFAULT_SLOW_MS)
+        sample_rate = frappe.conf.get("whatsapp_trace_sample_rate", DEFAULT_SAMPLE_RATE)
+
+        if max(stages.values()) - stages["frappe_received"] >= slow_ms:
+            reason = "Slow"
+        elif random.random() < sample_rate:
+            reason = "Sampled"
+        else:
+            return
+
+        # Saved by a job: committing here would also commit the partial writes of a
+        # failing event before the webhook handler rolls them back
+        frappe.enqueue(
+            "whatsapp_integration.whatsapp_integration.tracing.save_trace",
+            queue="short",
+            trace={
+                "correlation_id": trace["id"],
+                "event": trace["event"],
+                "session_id": trace["session_id"],
+                "message_id": trace["message_id"],
+                "webhook_attempts": trace["attempts"],
+                "reason": reason,
+                "stages": json.dumps(stages, indent=1, sort_keys=True),
+                **breakdown
+            }
+        )
+    except Exception as e:
+        frappe.log_error(
+            f"Error recording event trace: {str(e)}\n{frappe.get_traceback()}",
+            "WhatsApp Trace Error"
+        )
+
+def save_trace(trace: Dict[str, Any]):
+    """Background job: insert one WhatsApp Event Trace."""
+    frappe.get_doc({"doctype": "WhatsApp Event Trace", **trace}).insert(ignore_permissions=True)
+
+def breakdown_of(stages: Dict[str, float]) -> Dict[str, float]:
+    breakdown = {}
+    for field, begin, end in STAGE_SPANS:
+        if stages.get(begin) and stages.get(end):
+            breakdown[field] = round(stages[end] - stages[begin], 1)
+
+    # Bridge processing is the time from the Baileys event to the first webhook
+    # attempt, minus any media download that happened in between
+    if stages.get("received") and stages.get("webhook_queued"):
+        breakdown["bridge_ms"] = round(
+            stages["webhook_queued"] - stages["received"] - breakdown.get("media_ms", 0), 1
+        )
+
+    first = stages.get("received") or stages["frappe_received"]
+    last = max(stages.values())
+    breakdown["total_ms"] = round(last - first, 1)
+    return breakdown
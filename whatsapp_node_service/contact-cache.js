@@ -0,0 +1,109 @@
+// Per-session cache of contact profiles (picture URL, about text, existence).
+//
+// A profile is served from memory for CONTACT_INFO_TTL_MS. After that it is
+// still returned for up to CONTACT_INFO_STALE_MS while a refresh runs in the
+// background (stale-while-revalidate), so opening a chat rarely waits on
+// WhatsApp. On a miss the three queries run concurrently, and concurrent
+// misses for the same contact share one fetch. contacts.update events with a
+// new picture or status drop the entry.
+
+const metrics = require('./metrics');
+
+const TTL_MS = parseInt(process.env.CONTACT_INFO_TTL_MS || '3600000', 10);
+const STALE_MS = parseInt(process.env.CONTACT_INFO_STALE_MS || String(24 * 3600000), 10);
+const MAX_ENTRIES = parseInt(process.env.CONTACT_INFO_CACHE_SIZE || '5000', 10);
+
+class ContactInfoCache {
+    constructor({ ttlMs = TTL_MS, staleMs = STALE_MS, maxEntries = MAX_ENTRIES } = {}) {
+        this.ttlMs = ttlMs;
+        this.staleMs = staleMs;
+        this.maxEntries = maxEntries;
+        this.entries = new Map();   // jid -> { info, fetchedAt }, least recently used first
+        this.pending = new Map();   // jid -> Promise<entry>
+    }
+
+    get size() {
+        return this.entries.size;
+    }
+
+    // Resolves to { info, fetchedAt, stale }
+    async get(jid, sock, { refresh = false } = {}) {
+        const entry = this.entries.get(jid);
+        if (entry && !refresh) {
+            const age = Date.now() - entry.fetchedAt;
+            if (age < this.ttlMs + this.staleMs) {
+                this.entries.delete(jid);
+                this.entries.set(jid, entry);
+                if (age < this.ttlMs) {
+                    metrics.cacheRequests.inc({ cache: 'contact_info', result: 'hit' });
+                    return { ...entry, stale: false };
+                }
+                metrics.cacheRequests.inc({ cache: 'contact_info', result: 'stale' });
+                this.revalidate(jid, sock).catch(e => console.log(`Could not refresh contact info for ${jid}: ${e.message}`));
+                return { ...entry, stale: true };
+            }
+        }
+
+        metrics.cacheRequests.inc({ cache: 'contact_info', result: 'miss' });
+        return { ...(await this.revalidate(jid, sock)), stale: false };
+    }
+
+    revalidate(jid, sock) {
+        if (this.pending.has(jid)) return this.pending.get(jid);
+
+        const request = fetchContactInfo(sock, jid)
+            .then(info => {
+                const entry = { info, fetchedAt: Date.now() };
+                this.entries.delete(jid);
+                this.entries.set(jid, entry);
+                if (this.entries.size > this.maxEntries) {
+                    this.entries.delete(this.entries.keys().next().value);
+                }
+                return entry;
+            })
+            .finally(() => this.pending.delete(jid));
+        this.pending.set(jid, request);
+        return request;
+    }
+
+    invalidate(jid) {
+        this.entries.delete(jid);
+    }
+
+    // Drop profiles whose picture or status changed. `events` is anything with
+    // an on(event, handler) method, such as a session supervisor.
+    bind(events) {
+        events.on('contacts.update', (updates) => {
+            for (const update of updates) {
+                if (update.id && (update.imgUrl !== undefined || update.status !== undefined)) {
+                    this.invalidate(update.id);
+                }
+            }
+        });
+    }
+}
+
+// Picture, about text and existence of `jid`, queried concurrently
+async function fetchContactInfo(sock, jid) {
+    const [picture, status, exists] = await Promise.allSettled([
+        sock.profilePictureUrl(jid, 'image'),
+        sock.fetchStatus(jid),
+        sock.onWhatsApp(jid)
+    ]);
+    // Without the existence check there is nothing worth caching
+    if (exists.status === 'rejected') throw exists.reason;
+
+    // fetchStatus returns one object in older Baileys and a list of results in newer ones
+    let about = status.status === 'fulfilled' ? status.value : null;
+    if (Array.isArray(about)) about = about[0]?.status;
+    if (about && typeof about === 'object') about = about.status;
+
+    return {
+        exists: !!(exists.value && exists.value[0]),
+        profilePicture: picture.status === 'fulfilled' ? picture.value || null : null,
+        about: about || null,
+        jid
+    };
+}
+
+module.exports = { ContactInfoCache };
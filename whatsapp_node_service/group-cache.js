@@ -0,0 +1,96 @@
+// Per-session cache of group metadata.
+//
+// Entries expire after a TTL and are refreshed or dropped from the socket's
+// groups.update / group-participants.update events, so incoming group messages
+// and Baileys' own group sends don't need a groupMetadata IQ each time.
+// Concurrent misses for the same group share one in-flight request.
+
+const metrics = require('./metrics');
+
+const DEFAULT_TTL_MS = parseInt(process.env.GROUP_METADATA_TTL_MS || '600000', 10);
+
+class GroupMetadataCache {
+    constructor(ttlMs = DEFAULT_TTL_MS) {
+        this.ttlMs = ttlMs;
+        this.entries = new Map();   // jid -> { metadata, expires }
+        this.pending = new Map();   // jid -> Promise<metadata>
+    }
+
+    get size() {
+        return this.entries.size;
+    }
+
+    // Cached metadata, or undefined if absent or expired. Used as Baileys' cachedGroupMetadata.
+    get(jid) {
+        const entry = this.entries.get(jid);
+        if (!entry) return undefined;
+        if (entry.expires < Date.now()) {
+            this.entries.delete(jid);
+            return undefined;
+        }
+        return entry.metadata;
+    }
+
+    set(jid, metadata) {
+        this.entries.set(jid, { metadata, expires: Date.now() + this.ttlMs });
+    }
+
+    invalidate(jid) {
+        this.entries.delete(jid);
+    }
+
+    // Apply a partial update (e.g. a new subject) from groups.update
+    update(partial) {
+        const cached = this.get(partial.id);
+        if (cached) this.set(partial.id, { ...cached, ...partial });
+    }
+
+    async fetch(jid, sock, { refresh = false } = {}) {
+        if (!refresh) {
+            const cached = this.get(jid);
+            if (cached) {
+                metrics.cacheRequests.inc({ cache: 'group_metadata', result: 'hit' });
+                return cached;
+            }
+        }
+        metrics.cacheRequests.inc({ cache: 'group_metadata', result: 'miss' });
+
+        if (this.pending.has(jid)) return this.pending.get(jid);
+
+        const request = sock.groupMetadata(jid)
+            .then(metadata => {
+                this.set(jid, metadata);
+                return metadata;
+            })
+            .finally(() => this.pending.delete(jid));
+        this.pending.set(jid, request);
+        return request;
+    }
+
+    // Fill the cache with every group the account participates in (one IQ)
+    async warm(sock) {
+        const groups = await sock.groupFetchAllParticipating();
+        for (const [jid, metadata] of Object.entries(groups || {})) {
+            this.set(jid, metadata);
+        }
+        return this.entries.size;
+    }
+
+    // Hook the cache up to the socket's group events. `events` is anything
+    // with an on(event, handler) method, such as a session supervisor.
+    bind(events) {
+        events.on('groups.upsert', (groups) => {
+            for (const metadata of groups) this.set(metadata.id, metadata);
+        });
+        events.on('groups.update', (updates) => {
+            for (const partial of updates) {
+                if (partial.id) this.update(partial);
+            }
+        });
+        events.on('group-participants.update', ({ id }) => {
+            this.invalidate(id);
+        });
+    }
+}
+
+module.exports = { GroupMetadataCache };
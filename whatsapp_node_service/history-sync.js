@@ -0,0 +1,118 @@
+// WhatsApp history sync -> Frappe bulk import.
+//
+// When a device is linked, Baileys emits `messaging-history.set` with batches of
+// past chats and messages (often thousands). They are converted to compact
+// records and queued in the session outbox as `history.import` events of
+// HISTORY_SYNC_CHUNK messages each, which Frappe imports with multi-row inserts
+// in a throttled background job. Media is not downloaded unless
+// HISTORY_SYNC_MEDIA=1; messages without text are imported as "[Media: ...]".
+//
+// Phone numbers are resolved once per distinct JID of a batch, not per message.
+
+const metrics = require('./metrics');
+
+const CHUNK_SIZE = parseInt(process.env.HISTORY_SYNC_CHUNK || '500', 10);
+const SYNC_MEDIA = process.env.HISTORY_SYNC_MEDIA === '1';
+
+const MEDIA_TYPES = ['imageMessage', 'videoMessage', 'audioMessage', 'documentMessage', 'stickerMessage'];
+const SKIPPED_TYPES = ['protocolMessage', 'reactionMessage', 'senderKeyDistributionMessage', 'pollUpdateMessage'];
+
+// Baileys timestamps are numbers or protobuf Longs
+function toSeconds(ts) {
+    if (ts && typeof ts === 'object') return typeof ts.toNumber === 'function' ? ts.toNumber() : Number(ts.low);
+    return Number(ts) || 0;
+}
+
+function messageText(message, messageType) {
+    return message.conversation ||
+        message.extendedTextMessage?.text ||
+        message[messageType]?.caption ||
+        message.buttonsResponseMessage?.selectedButtonId ||
+        message.listResponseMessage?.title || '';
+}
+
+// Queue the messages of one `messaging-history.set` batch. `resolvePhone(jid)`
+// maps a JID to a phone number; `downloadMedia(msg)` spools a media message.
+// Returns the number of messages queued.
+async function queueHistory(session, { chats = [], messages = [], syncType, progress }, { resolvePhone, downloadMedia, enqueue }) {
+    const groupNames = new Map();
+    for (const chat of chats) {
+        if (chat.id?.endsWith('@g.us') && chat.name) groupNames.set(chat.id, chat.name);
+    }
+
+    const phones = new Map();
+    const phoneOf = async (jid) => {
+        if (!phones.has(jid)) phones.set(jid, await resolvePhone(jid));
+        return phones.get(jid);
+    };
+
+    let chunk = [];
+    let queued = 0;
+    const flush = () => {
+        if (!chunk.length) return;
+        enqueue({ messages: chunk, syncType: syncType ?? null, progress: progress ?? null });
+        queued += chunk.length;
+        chunk = [];
+    };
+
+    for (const msg of messages) {
+        const remoteJid = msg.key?.remoteJid;
+        if (!msg.message || !remoteJid || remoteJid === 'status@broadcast') continue;
+
+        const messageType = Object.keys(msg.message)[0];
+        if (SKIPPED_TYPES.includes(messageType)) continue;
+
+        const isGroup = remoteJid.endsWith('@g.us');
+        const isMedia = MEDIA_TYPES.includes(messageType);
+        let text = messageText(msg.message, messageType);
+        let media = null;
+
+        if (isMedia && SYNC_MEDIA) {
+            try {
+                const spooled = await downloadMedia(msg);
+                media = {
+                    ref: spooled.id,
+                    size: spooled.size,
+                    mimetype: msg.message[messageType].mimetype,
+                    filename: msg.message[messageType].fileName || `media_${msg.key.id}`
+                };
+            } catch (err) {
+                // Old media often has expired on WhatsApp's servers
+            }
+        }
+        if (!text && isMedia) text = `[Media: ${messageType.replace('Message', '')}]`;
+        if (!text) continue;
+
+        const contextInfo = msg.message.extendedTextMessage?.contextInfo;
+        const quoted = contextInfo?.quotedMessage;
+
+        chunk.push({
+            id: msg.key.id,
+            remoteJid,
+            participant: msg.key.participant || null,
+            fromMe: !!msg.key.fromMe,
+            // The other party of a 1:1 chat, or the sender within a group
+            from: isGroup
+                ? (msg.key.participant ? await phoneOf(msg.key.participant) : null)
+                : await phoneOf(remoteJid),
+            text,
+            timestamp: toSeconds(msg.messageTimestamp),
+            pushName: msg.pushName || null,
+            media,
+            isGroup,
+            groupId: isGroup ? remoteJid.split('@')[0] : null,
+            groupName: isGroup ? (groupNames.get(remoteJid) || null) : null,
+            replyTo: quoted ? {
+                messageId: contextInfo.stanzaId,
+                text: quoted.conversation || quoted.extendedTextMessage?.text || quoted.imageMessage?.caption || '[Media]'
+            } : null
+        });
+        if (chunk.length >= CHUNK_SIZE) flush();
+    }
+    flush();
+
+    metrics.historyMessages.inc({ session: session.id }, queued);
+    return queued;
+}
+
+module.exports = { queueHistory, CHUNK_SIZE };
@@ -5,7 +5,6 @@ const {
     fetchLatestBaileysVersion,
     makeCacheableSignalKeyStore,
     Browsers,
-    downloadMediaMessage,
     jidNormalizedUser
 } = require('@whiskeysockets/baileys');
 const pino = require('pino');
@@ -15,6 +14,19 @@ const QRCode = require('qrcode');
 const axios = require('axios');
 const fs = require('fs');
 const path = require('path');
+const http = require('http');
+const https = require('https');
+const crypto = require('crypto');
+const metrics = require('./metrics');
+const { Outbox } = require('./outbox');
+const { GroupMetadataCache } = require('./group-cache');
+const { ContactInfoCache } = require('./contact-cache');
+const { LidStore } = require('./lid-store');
+const { LidCache } = require('./lid-cache');
+const { SessionSupervisor } = require('./session-supervisor');
+const mediaSpool = require('./media-spool');
+const numberCheck = require('./number-check');
+const historySync = require('./history-sync');
 
 const app = express();
 app.use(cors());
@@ -49,15 +61,59 @@ app.get('/health', (req, res) => {
         uptime: process.uptime(),
         memory: process.memoryUsage(),
         sessions: sessionStats,
+        outbox: outboxBacklog(),
+        boot: bootSummary(),
+        media: mediaSpool.stats(),
         timestamp: new Date().toISOString()
     });
 });
 
-const sessions = new Map();
+app.get('/metrics', (req, res) => {
+    res.set('Content-Type', 'text/plain; version=0.0.4; charset=utf-8');
+    res.send(metrics.render());
+});
+
+const sessions = new Map(); // sessionId -> SessionSupervisor
 const startingSessions = new Set(); // Tracks sessions currently in progress of connecting
 const reconnectionAttempts = new Map(); // Track reconnection attempts per session
-const lidToPhoneMap = new Map(); // Map LID to actual phone numbers
+const lidCaches = new Map(); // sessionId -> LidCache (LID -> phone), kept across reconnects
+const sockLidCaches = new WeakMap(); // sock -> LidCache of its session
+const outboxes = new Map(); // sessionId -> Outbox; outlives sockets so queued events survive reconnects and logout
 const logger = pino({ level: 'debug' });
+const OUTBOX_DIR = path.join(__dirname, 'outbox');
+
+// Webhook requests reuse connections to Frappe; maxSockets bounds how many
+// sessions can be posting at once (each outbox has at most one request in flight)
+const WEBHOOK_MAX_SOCKETS = parseInt(process.env.WEBHOOK_MAX_SOCKETS || '8', 10);
+const webhookAgents = {
+    httpAgent: new http.Agent({ keepAlive: true, maxSockets: WEBHOOK_MAX_SOCKETS }),
+    httpsAgent: new https.Agent({ keepAlive: true, maxSockets: WEBHOOK_MAX_SOCKETS })
+};
+
+metrics.addCollector(() => {
+    metrics.mapSize.set({ map: 'sessions' }, sessions.size);
+    metrics.mapSize.set({ map: 'startingSessions' }, startingSessions.size);
+    metrics.mapSize.set({ map: 'reconnectionAttempts' }, reconnectionAttempts.size);
+    let lidEntries = 0;
+    lidCaches.forEach(cache => { lidEntries += cache.size; });
+    metrics.mapSize.set({ map: 'lidCache' }, lidEntries);
+    let groupEntries = 0;
+    sessions.forEach(session => { groupEntries += session.groupCache?.size || 0; });
+    metrics.mapSize.set({ map: 'groupMetadata' }, groupEntries);
+    let contactEntries = 0;
+    sessions.forEach(session => { contactEntries += session.contactCache?.size || 0; });
+    metrics.mapSize.set({ map: 'contactInfo' }, contactEntries);
+
+    metrics.sessionResources.reset();
+    sessions.forEach((session, sessionId) => {
+        for (const [kind, count] of Object.entries(session.resources())) {
+            metrics.sessionResources.set({ session: sessionId, kind }, count);
+        }
+    });
+    for (const [sessionId, outbox] of outboxes) {
+        metrics.outboxBacklog.set({ session: sessionId }, outbox.backlog);
+    }
+});
 
 let waVersion = [2, 3000, 1015901307];
 // Update version in background periodically
@@ -73,32 +129,37 @@ const updateVersion = async () => {
 updateVersion();
 setInterval(updateVersion, 3600000); // Once per hour
 
-// Helper function to load LID mappings from session directory
-function loadLidMappings(sessionDir) {
-    try {
-        const files = fs.readdirSync(sessionDir);
-        let loadedCount = 0;
-
-        for (const file of files) {
-            // Look for lid-mapping-*_reverse.json files
-            if (file.startsWith('lid-mapping-') && file.endsWith('_reverse.json')) {
-                const lid = file.replace('lid-mapping-', '').replace('_reverse.json', '');
-                const filePath = path.join(sessionDir, file);
-
-                try {
-                    const phoneNumber = JSON.parse(fs.readFileSync(filePath, 'utf8'));
-                    lidToPhoneMap.set(lid, phoneNumber);
-                    loadedCount++;
-                } catch (err) {
-                    console.error(`Error reading LID mapping file ${file}:`, err);
-                }
-            }
-        }
+// Start a latency trace for an event. Stages are epoch milliseconds and are
+// carried in the webhook payload so Frappe can add its own and record the breakdown.
+function newTrace(waTimestamp) {
+    const stages = { received: Date.now() };
+    if (waTimestamp) stages.wa = Number(waTimestamp) * 1000;
+    return { id: crypto.randomUUID(), stages, attempts: 0 };
+}
 
-        console.log(`Loaded ${loadedCount} LID-to-phone mappings from session directory`);
-    } catch (err) {
-        console.error('Error loading LID mappings:', err);
+// The session's LID cache, loading its mapping log on first use
+function getLidCache(sessionId, sessionDir) {
+    let cache = lidCaches.get(sessionId);
+    if (!cache) {
+        const store = new LidStore(sessionDir);
+        const count = store.load();
+        console.log(`Indexed ${count} LID-to-phone mappings for ${sessionId}`);
+        cache = new LidCache(store);
+        lidCaches.set(sessionId, cache);
     }
+    return cache;
+}
+
+function dropLidCache(sessionId) {
+    const cache = lidCaches.get(sessionId);
+    if (cache) cache.store.close().catch(() => { });
+    lidCaches.delete(sessionId);
+}
+
+// Record a LID -> phone mapping learnt on `sock`, without holding up the caller
+function rememberLid(sock, lid, phone) {
+    sockLidCaches.get(sock)?.remember(lid, phone)
+        .catch(e => console.error(`Failed to remember LID ${lid}:`, e.message));
 }
 
 // Helper function to extract actual phone number from JID
@@ -114,9 +175,12 @@ async function getPhoneNumberFromJid(jid, sock) {
         // For LID (Linked ID) format like 260477250707536@lid
         if (serverPart === 'lid') {
             // Check if we have this LID mapped to a phone number
-            if (lidToPhoneMap.has(baseJid)) {
-                return lidToPhoneMap.get(baseJid);
-            }
+            const lidCache = sockLidCaches.get(sock);
+            const cached = lidCache ? await lidCache.get(baseJid) : undefined;
+            if (cached) return cached;
+
+            // Recently failed to resolve: don't ask WhatsApp again until the negative entry expires
+            if (cached === null) return baseJid;
 
             // Fallback: Query WhatsApp to resolve LID to JID
             try {
@@ -126,18 +190,7 @@ async function getPhoneNumberFromJid(jid, sock) {
                     const resolvedPhone = result.jid.split('@')[0];
                     console.log(`Resolved LID ${baseJid} to phone ${resolvedPhone} via WhatsApp query`);
 
-                    // Cache it in memory
-                    lidToPhoneMap.set(baseJid, resolvedPhone);
-
-                    // Also save to disk if we can find the session dir
-                    const sessionId = Array.from(sessions.entries()).find(([k, v]) => v.sock === sock)?.[0];
-                    if (sessionId) {
-                        const sessionDir = path.join(__dirname, 'sessions', sessionId);
-                        if (fs.existsSync(sessionDir)) {
-                            const mappingFile = path.join(sessionDir, `lid-mapping-${baseJid}_reverse.json`);
-                            fs.writeFileSync(mappingFile, JSON.stringify(resolvedPhone));
-                        }
-                    }
+                    rememberLid(sock, baseJid, resolvedPhone);
 
                     return resolvedPhone;
                 }
@@ -145,6 +198,7 @@ async function getPhoneNumberFromJid(jid, sock) {
                 console.error(`Error resolving LID ${baseJid} via WhatsApp:`, e.message);
             }
 
+            lidCache?.markUnresolved(baseJid);
             console.log(`LID ${baseJid} not found in mapping - keeping LID`);
             return baseJid; // Return LID if no mapping found
         }
@@ -171,10 +225,46 @@ async function getPhoneNumberFromJid(jid, sock) {
     }
 }
 
+// Add `phone` and `full_id` to group participants. Participants that carry
+// their phone number (newer WhatsApp versions) need no lookup; the remaining
+// LIDs are resolved once each, a chunk at a time in parallel.
+const PARTICIPANT_RESOLVE_CONCURRENCY = 20;
+
+async function resolveParticipants(participants, sock) {
+    const phones = new Map();
+    const unresolved = [];
+
+    for (const p of participants) {
+        if (phones.has(p.id)) continue;
+        if (p.phoneNumber) {
+            const phone = p.phoneNumber.split('@')[0].split(':')[0];
+            phones.set(p.id, phone);
+            if (p.id.endsWith('@lid')) rememberLid(sock, p.id.split('@')[0], phone);
+        } else {
+            phones.set(p.id, null);
+            unresolved.push(p.id);
+        }
+    }
+
+    for (let i = 0; i < unresolved.length; i += PARTICIPANT_RESOLVE_CONCURRENCY) {
+        const chunk = unresolved.slice(i, i + PARTICIPANT_RESOLVE_CONCURRENCY);
+        const resolved = await Promise.all(chunk.map(jid => getPhoneNumberFromJid(jid, sock)));
+        chunk.forEach((jid, index) => phones.set(jid, resolved[index]));
+    }
+
+    return participants.map(p => ({
+        ...p,
+        phone: phones.get(p.id), // Add phone number field
+        full_id: p.id // Keep original ID
+    }));
+}
+
+const START_TIMEOUT_MS = 40000;
+
 async function startSession(sessionId, webhookUrl, webhookToken) {
     // Check if session already exists and is connected
-    if (sessions.has(sessionId)) {
-        const existing = sessions.get(sessionId);
+    const existing = sessions.get(sessionId);
+    if (existing) {
         if (existing.status === 'Connected') {
             console.log(`Session ${sessionId} already connected, skipping`);
             return { status: 'Connected' };
@@ -182,15 +272,6 @@ async function startSession(sessionId, webhookUrl, webhookToken) {
         if (existing.qr && existing.status === 'QR Scan Required') {
             return { qr: existing.qr };
         }
-        // If session exists but disconnected, close old socket first
-        if (existing.sock) {
-            console.log(`Closing old socket for ${sessionId} before reconnecting`);
-            try {
-                existing.sock.end();
-            } catch (e) {
-                console.error(`Error closing old socket:`, e);
-            }
-        }
     }
 
     // Prevent duplicate connection attempts
@@ -203,25 +284,41 @@ async function startSession(sessionId, webhookUrl, webhookToken) {
     console.log(`Starting session: ${sessionId}`);
 
     try {
+        // A reconnect reuses the session's supervisor, which closes the old
+        // socket and detaches its listeners before the new one is created
+        let supervisor = existing;
+        if (supervisor && !supervisor.disposed) {
+            if (supervisor.sock) console.log(`Closing old socket for ${sessionId} before reconnecting`);
+            // A manual start during the backoff replaces the scheduled reconnect
+            if (supervisor.reconnectTimer) supervisor.clearTimer(supervisor.reconnectTimer);
+            supervisor.reconnectTimer = null;
+            supervisor.resetSocket();
+        } else {
+            supervisor = new SessionSupervisor(sessionId);
+            supervisor.contactCache = new ContactInfoCache();
+            supervisor.addDisposer(() => dropLidCache(sessionId));
+            supervisor.addDisposer(() => numberCheck.forgetSession(sessionId));
+        }
+
         const sessionDir = path.join(__dirname, 'sessions', sessionId);
         const { state, saveCreds } = await useMultiFileAuthState(sessionDir);
 
-        // Load LID-to-phone mappings from session directory
-        loadLidMappings(sessionDir);
+        // Index LID-to-phone mappings once per process; later ones are appended as they are learnt
+        const lidCache = getLidCache(sessionId, sessionDir);
 
-        // Watch for new LID mapping files and reload
-        const watcher = fs.watch(sessionDir, (eventType, filename) => {
-            if (filename && filename.startsWith('lid-mapping-') && filename.endsWith('_reverse.json')) {
-                console.log(`New LID mapping detected: ${filename}`);
-                loadLidMappings(sessionDir);
-            }
-        });
+        const groupCache = new GroupMetadataCache();
 
-        const sock = makeWASocket({
+        const sock = supervisor.attachSocket(makeWASocket({
             version: waVersion,
             auth: {
                 creds: state.creds,
-                keys: makeCacheableSignalKeyStore(state.keys, logger),
+                // Mappings Baileys learns itself are picked up as its key store writes them
+                keys: makeCacheableSignalKeyStore(
+                    lidCache.store.tapKeyStore(state.keys, (lid, phone) => {
+                        lidCache.remember(lid, phone).catch(() => { });
+                    }),
+                    logger
+                ),
             },
             printQRInTerminal: false,
             logger,
@@ -236,16 +333,24 @@ async function startSession(sessionId, webhookUrl, webhookToken) {
             // Network error handling
             shouldIgnoreJid: () => false,
             markOnlineOnConnect: true,
-        });
+            // Lets Baileys skip the groupMetadata query when sending to a group
+            cachedGroupMetadata: async (jid) => groupCache.get(jid),
+        }));
+        sockLidCaches.set(sock, lidCache);
 
-        const sessionObj = {
-            sock,
+        Object.assign(supervisor, {
+            groupCache,
             qr: null,
             status: 'Connecting',
             webhookUrl,
             webhookToken
-        };
-        sessions.set(sessionId, sessionObj);
+        });
+        groupCache.bind(supervisor);
+        supervisor.contactCache.bind(supervisor);
+        sessions.set(sessionId, supervisor);
+        if (webhookUrl && webhookToken) {
+            setWebhookTarget(sessionId, { webhookUrl, webhookToken });
+        }
 
         // Save webhook config to session directory for auto-reload
         if (webhookUrl && webhookToken) {
@@ -260,16 +365,17 @@ async function startSession(sessionId, webhookUrl, webhookToken) {
             }
         }
 
-        sock.ev.on('creds.update', saveCreds);
+        supervisor.on('creds.update', saveCreds);
 
-        sock.ev.on('connection.update', async (update) => {
+        supervisor.on('connection.update', async (update) => {
             const { connection, lastDisconnect, qr } = update;
 
             if (qr) {
                 console.log(`New QR generated for session: ${sessionId}`);
-                sessionObj.qr = await QRCode.toDataURL(qr);
-                sessionObj.status = 'QR Scan Required';
-                notifyFrappe(sessionObj, 'connection.update', { status: 'QR Scan Required' });
+                supervisor.qr = await QRCode.toDataURL(qr);
+                supervisor.status = 'QR Scan Required';
+                supervisor.notifyReady();
+                notifyFrappe(supervisor, 'connection.update', { status: 'QR Scan Required' });
             }
 
             if (connection === 'close') {
@@ -291,18 +397,20 @@ async function startSession(sessionId, webhookUrl, webhookToken) {
                     console.warn(`Session conflict detected for ${sessionId} - another WhatsApp Web session may be active. Stopping reconnection.`);
                     sessions.delete(sessionId);
                     startingSessions.delete(sessionId);
+                    supervisor.dispose();
                 }
 
                 console.log(`Connection closed for ${sessionId}. Status: ${statusCode}. Error: ${errorMessage}. Reconnecting: ${shouldReconnect}`);
 
-                sessionObj.status = 'Disconnected';
-                notifyFrappe(sessionObj, 'connection.update', { status: 'Disconnected', error: errorMessage });
+                supervisor.status = 'Disconnected';
+                notifyFrappe(supervisor, 'connection.update', { status: 'Disconnected', error: errorMessage });
 
                 if (shouldDeleteSession) {
                     // Only delete session when explicitly logged out (401 or loggedOut reason)
                     console.log(`Session ${sessionId} logged out. Clearing credentials.`);
                     sessions.delete(sessionId);
                     reconnectionAttempts.delete(sessionId);
+                    supervisor.dispose();
                     if (fs.existsSync(sessionDir)) {
                         fs.rmSync(sessionDir, { recursive: true, force: true });
                     }
@@ -316,52 +424,53 @@ async function startSession(sessionId, webhookUrl, webhookToken) {
                     const delayMs = Math.min(5000 * Math.pow(2, attempts), 60000);
 
                     console.log(`Attempting to reconnect ${sessionId} (attempt ${nextAttempt}) in ${delayMs / 1000}s with existing credentials...`);
+                    metrics.reconnects.inc({ session: sessionId });
 
                     // Wait before reconnecting to avoid rapid reconnection loops
-                    setTimeout(() => {
+                    supervisor.reconnectTimer = supervisor.setTimeout(() => {
+                        supervisor.reconnectTimer = null;
                         startSession(sessionId, webhookUrl, webhookToken);
                     }, delayMs);
                 }
             } else if (connection === 'open') {
                 console.log(`WhatsApp Connected: ${sessionId}`);
-                sessionObj.status = 'Connected';
-                sessionObj.qr = null;
+                supervisor.status = 'Connected';
+                supervisor.qr = null;
+                supervisor.notifyReady();
+                recordBootConnected(sessionId);
 
                 // Reset reconnection counter on successful connection
                 reconnectionAttempts.delete(sessionId);
 
-                notifyFrappe(sessionObj, 'connection.update', { status: 'Connected' });
+                notifyFrappe(supervisor, 'connection.update', { status: 'Connected' });
+
+                groupCache.warm(sock)
+                    .then(count => console.log(`Cached metadata of ${count} groups for ${sessionId}`))
+                    .catch(e => console.warn(`Could not prefetch groups for ${sessionId}: ${e.message}`));
             }
         });
 
-        // Listen for contacts to build LID-to-phone mapping
-        sock.ev.on('contacts.upsert', (contacts) => {
+        // Listen for contacts to build LID-to-phone mapping; new pairs are
+        // written to the LID store in one batched append
+        supervisor.on('contacts.upsert', (contacts) => {
+            const updates = [];
             for (const contact of contacts) {
                 // Store mapping: contact.lid -> contact.id (phone number)
                 if (contact.lid && contact.id) {
                     const lid = contact.lid.split('@')[0];
                     const phone = contact.id.split('@')[0].split(':')[0];
-
-                    if (lidToPhoneMap.get(lid) !== phone) {
-                        lidToPhoneMap.set(lid, phone);
-                        console.log(`Contact mapping stored: LID ${lid} -> Phone ${phone}`);
-
-                        // Save to disk for persistence
-                        const sessionDir = path.join(__dirname, 'sessions', sessionId);
-                        if (fs.existsSync(sessionDir)) {
-                            const mappingFile = path.join(sessionDir, `lid-mapping-${lid}_reverse.json`);
-                            try {
-                                fs.writeFileSync(mappingFile, JSON.stringify(phone));
-                            } catch (e) {
-                                console.error(`Failed to save LID mapping for ${lid}:`, e);
-                            }
-                        }
-                    }
+                    updates.push(lidCache.remember(lid, phone));
                 }
             }
+            Promise.all(updates)
+                .then(results => {
+                    const stored = results.filter(Boolean).length;
+                    if (stored) console.log(`Contact sync stored ${stored} new LID mappings for ${sessionId}`);
+                })
+                .catch(e => console.error(`Failed to store LID mappings for ${sessionId}:`, e.message));
         });
 
-        sock.ev.on('presence.update', async (update) => {
+        supervisor.on('presence.update', async (update) => {
             const { id, presences } = update;
             const from = await getPhoneNumberFromJid(id, sock);
 
@@ -386,15 +495,17 @@ async function startSession(sessionId, webhookUrl, webhookToken) {
                 }
 
                 console.log(`Presence update for ${from} (${id}): ${JSON.stringify(presence)}`);
-                notifyFrappe(sessionObj, 'presence.update', { from, presence });
+                notifyFrappe(supervisor, 'presence.update', { from, presence });
             }
         });
 
-        sock.ev.on('messages.upsert', async (m) => {
+        supervisor.on('messages.upsert', async (m) => {
             if (m.type === 'notify') {
                 for (const msg of m.messages) {
                     if (!msg.key.fromMe && msg.message) {
-                        console.log(`Incoming message from: ${msg.key.remoteJid}`);
+                        const trace = newTrace(msg.messageTimestamp);
+                        console.log(`Incoming message from: ${msg.key.remoteJid} [trace ${trace.id}]`);
+                        metrics.messagesReceived.inc({ session: sessionId });
 
                         // Build LID-to-phone mapping from message metadata
                         const remoteJid = msg.key.remoteJid;
@@ -418,9 +529,16 @@ async function startSession(sessionId, webhookUrl, webhookToken) {
 
                         if (isMedia) {
                             try {
-                                const buffer = await downloadMediaMessage(msg, 'buffer', {}, { logger });
+                                const endDownload = metrics.mediaDownloadDuration.startTimer({ session: sessionId });
+                                trace.stages.media_start = Date.now();
+                                // Streamed to the spool; Frappe fetches it by reference
+                                const spooled = await mediaSpool.download(sessionId, msg, sock, logger);
+                                trace.stages.media_end = Date.now();
+                                endDownload();
+                                metrics.mediaDownloadBytes.observe({ session: sessionId }, spooled.size);
                                 mediaPayload = {
-                                    data: buffer.toString('base64'),
+                                    ref: spooled.id,
+                                    size: spooled.size,
                                     mimetype: msg.message[messageType].mimetype,
                                     filename: msg.message[messageType].fileName || `media_${Date.now()}`
                                 };
@@ -445,9 +563,8 @@ async function startSession(sessionId, webhookUrl, webhookToken) {
                                     console.log(`LID message - using participant: ${participantNumber} instead of LID: ${lid}`);
                                     phoneNumber = participantNumber;
                                 }
-                                // Method 2: Check our LID-to-phone mapping
-                                else if (lidToPhoneMap.has(lid)) {
-                                    phoneNumber = lidToPhoneMap.get(lid);
+                                // Method 2: Our LID-to-phone mapping (already consulted above)
+                                else if (phoneNumber !== lid) {
                                     console.log(`LID message - mapped ${lid} to ${phoneNumber} from contact store`);
                                 }
                                 // Method 3: Query WhatsApp for phone number using sock.onWhatsApp
@@ -478,7 +595,7 @@ async function startSession(sessionId, webhookUrl, webhookToken) {
 
                                 // Try to get group name from metadata
                                 try {
-                                    const groupMetadata = await sock.groupMetadata(msg.key.remoteJid);
+                                    const groupMetadata = await groupCache.fetch(msg.key.remoteJid, sock);
                                     groupName = groupMetadata.subject;
                                 } catch (e) {
                                     console.warn(`Could not fetch group metadata for ${groupId}`);
@@ -503,6 +620,8 @@ async function startSession(sessionId, webhookUrl, webhookToken) {
                             const payload = {
                                 messages: [{
                                     id: msg.key.id,
+                                    remoteJid: msg.key.remoteJid,
+                                    participant: msg.key.participant || null,
                                     from: phoneNumber,
                                     text: text,
                                     timestamp: msg.messageTimestamp,
@@ -514,15 +633,29 @@ async function startSession(sessionId, webhookUrl, webhookToken) {
                                     replyTo: replyTo
                                 }]
                             };
-                            notifyFrappe(sessionObj, 'messages.upsert', payload);
+                            notifyFrappe(supervisor, 'messages.upsert', payload, trace);
                         }
                     }
                 }
             }
         });
 
+        // Past chats sent by WhatsApp after linking, imported into Frappe in bulk
+        supervisor.on('messaging-history.set', async (history) => {
+            try {
+                const queued = await historySync.queueHistory(supervisor, history, {
+                    resolvePhone: jid => getPhoneNumberFromJid(jid, sock),
+                    downloadMedia: msg => mediaSpool.download(sessionId, msg, sock, logger),
+                    enqueue: data => notifyFrappe(supervisor, 'history.import', data)
+                });
+                console.log(`[${sessionId}] History sync: queued ${queued} of ${history.messages?.length || 0} messages (progress ${history.progress ?? '-'})`);
+            } catch (err) {
+                console.error(`[${sessionId}] Error queueing history sync:`, err);
+            }
+        });
+
         // Listen for message status updates (delivery/read receipts)
-        sock.ev.on('messages.update', async (updates) => {
+        supervisor.on('messages.update', async (updates) => {
             for (const update of updates) {
                 const { key, update: statusUpdate } = update;
 
@@ -544,26 +677,13 @@ async function startSession(sessionId, webhookUrl, webhookToken) {
                         timestamp: Date.now()
                     };
 
-                    notifyFrappe(sessionObj, 'message.status', payload);
+                    notifyFrappe(supervisor, 'message.status', payload);
                 }
             }
         });
 
-        // Wait for QR or connection
-        return new Promise((resolve) => {
-            let attempts = 0;
-            const check = setInterval(() => {
-                attempts++;
-                if (sessionObj.qr || sessionObj.status === 'Connected') {
-                    clearInterval(check);
-                    resolve({ qr: sessionObj.qr, status: sessionObj.status });
-                }
-                if (attempts > 40) { // 40 seconds timeout
-                    clearInterval(check);
-                    resolve({ error: 'Timeout waiting for QR. Session loading in background.' });
-                }
-            }, 1000);
-        });
+        // Resolves on the first QR or open event
+        return await supervisor.waitForReady(START_TIMEOUT_MS);
     } catch (err) {
         console.error(`Error starting session ${sessionId}:`, err);
         startingSessions.delete(sessionId);
@@ -574,70 +694,158 @@ async function startSession(sessionId, webhookUrl, webhookToken) {
     }
 }
 
-async function notifyFrappe(session, event, data) {
+// Queue a webhook event in the session's durable outbox. Returns immediately;
+// delivery happens in order in the background and survives Frappe downtime.
+function notifyFrappe(session, event, data, trace = newTrace()) {
     if (!session.webhookUrl) return;
-    const sessionId = Array.from(sessions.entries()).find(([k, v]) => v === session)?.[0];
 
-    if (!sessionId) {
-        console.error('Could not find sessionId for webhook notification');
-        return;
+    trace.stages.webhook_queued = Date.now();
+    getOutbox(session.id).enqueue(event, data, trace);
+}
+
+function getOutbox(sessionId) {
+    let outbox = outboxes.get(sessionId);
+    if (!outbox) {
+        const dir = path.join(OUTBOX_DIR, sessionId);
+        outbox = new Outbox(dir, entries => deliverWebhook(sessionId, outbox, entries));
+        try {
+            outbox.target = JSON.parse(fs.readFileSync(path.join(dir, 'target.json'), 'utf8'));
+        } catch (e) {
+            outbox.target = null;
+        }
+        outboxes.set(sessionId, outbox);
     }
+    return outbox;
+}
 
-    const maxRetries = 3;
-    let attempt = 0;
+// The webhook target is kept next to the outbox so a backlog can still be
+// delivered after the session itself was logged out and its folder removed
+function setWebhookTarget(sessionId, target) {
+    const outbox = getOutbox(sessionId);
+    outbox.target = target;
+    try {
+        fs.writeFileSync(path.join(outbox.dir, 'target.json'), JSON.stringify(target));
+    } catch (e) {
+        console.error(`Failed to save outbox target for ${sessionId}:`, e);
+    }
+    outbox.schedule();
+}
 
-    while (attempt < maxRetries) {
-        try {
-            const payload = {
-                sessionId: sessionId,
-                event,
-                ...data
-            };
-
-            const headers = {
-                'X-Webhook-Token': session.webhookToken,
-                'X-Requested-With': 'XMLHttpRequest',
-                'Content-Type': 'application/json'
-            };
-
-            const response = await axios.post(session.webhookUrl, payload, {
-                headers,
-                timeout: 10000,  // 10 second timeout
-                maxRedirects: 5
-            });
-
-            console.log(`[${sessionId}] Webhook delivered: ${event} - Status: ${response.status}`);
-            return response.data;
+function outboxBacklog() {
+    const backlog = {};
+    for (const [sessionId, outbox] of outboxes) {
+        backlog[sessionId] = outbox.backlog;
+    }
+    return backlog;
+}
 
-        } catch (e) {
-            attempt++;
-            console.error(`[${sessionId}] Webhook failed (attempt ${attempt}/${maxRetries}): ${e.message}`);
+// 4xx responses that don't mean the event is invalid: a rotated token, settings
+// being recreated or a rate limit. Those events are retried like 5xx ones.
+const RETRYABLE_WEBHOOK_STATUSES = new Set([401, 403, 404, 408, 409, 429]);
+
+// Deliver a batch of outbox entries in a single POST. A lone entry is sent as
+// a plain event; several are packed as { event: 'batch', events: [...] }.
+// Only a response with status "success" acknowledges the entries. Throwing
+// keeps the batch queued for a retry, minus the `processed` entries Frappe
+// reports it handled before a failure; other 4xx responses are marked permanent
+// so the outbox isolates and dead-letters the rejected entries.
+async function deliverWebhook(sessionId, outbox, entries) {
+    const { webhookUrl, webhookToken } = outbox.target || {};
+    if (!webhookUrl) throw new Error('No webhook configured');
+
+    const now = Date.now();
+    const events = entries.map(entry => {
+        const trace = entry.trace || newTrace();
+        trace.attempts = (trace.attempts || 0) + 1;
+        trace.stages.webhook_sent = now;
+        return { event: entry.event, ...entry.data, trace };
+    });
 
-            if (e.response) {
-                console.error(`  Response Status: ${e.response.status}`);
-                console.error(`  Response Data:`, JSON.stringify(e.response.data).substring(0, 200));
+    const payload = events.length === 1
+        ? { sessionId: sessionId, ...events[0] }
+        : { sessionId: sessionId, event: 'batch', events };
 
-                // Don't retry on 4xx errors (client errors)
-                if (e.response.status >= 400 && e.response.status < 500) {
-                    console.error(`  Client error - not retrying`);
-                    break;
-                }
-            } else if (e.request) {
-                console.error(`  No response received - server may be down`);
-            } else {
-                console.error(`  Error setting up request:`, e.message);
-            }
+    const headers = {
+        'X-Webhook-Token': webhookToken,
+        'X-Correlation-Id': events[0].trace.id,
+        'X-Requested-With': 'XMLHttpRequest',
+        'Content-Type': 'application/json'
+    };
+
+    metrics.webhookRequests.inc({ session: sessionId });
+    metrics.webhookBatchSize.observe({ session: sessionId }, events.length);
+
+    try {
+        const response = await axios.post(webhookUrl, payload, {
+            headers,
+            timeout: 10000 + 500 * events.length,
+            maxRedirects: 5,
+            maxBodyLength: Infinity,
+            ...webhookAgents
+        });
+
+        const result = response.data?.message;
+        if (result?.status !== 'success') {
+            throw new Error(`Webhook not acknowledged: ${JSON.stringify(response.data).substring(0, 200)}`);
+        }
+
+        console.log(`[${sessionId}] Webhook delivered: ${payload.event}${events.length > 1 ? ` x${events.length}` : ''} - Status: ${response.status} [trace ${events[0].trace.id}]`);
+        const delivered = Date.now();
+        for (const entry of entries) {
+            const queued = entry.trace?.stages?.webhook_queued || entry.ts;
+            metrics.webhookDuration.observe({ session: sessionId, event: entry.event }, (delivered - queued) / 1000);
+        }
+    } catch (e) {
+        console.error(`[${sessionId}] Webhook failed (${events.length} events, attempt ${events[0].trace.attempts}): ${e.message}`);
+
+        if (e.response) {
+            console.error(`  Response Status: ${e.response.status}`);
+            console.error(`  Response Data:`, JSON.stringify(e.response.data).substring(0, 200));
 
-            // Wait before retry (exponential backoff)
-            if (attempt < maxRetries) {
-                const delay = Math.min(1000 * Math.pow(2, attempt), 5000);
-                console.log(`  Retrying in ${delay}ms...`);
-                await new Promise(resolve => setTimeout(resolve, delay));
+            const processed = e.response.data?.message?.processed;
+            if (Number.isInteger(processed) && processed > 0) e.delivered = processed;
+
+            // Don't retry invalid events (client errors)
+            const status = e.response.status;
+            if (status >= 400 && status < 500 && !RETRYABLE_WEBHOOK_STATUSES.has(status)) {
+                if (entries.length === 1) metrics.webhookFailures.inc({ session: sessionId });
+                e.permanent = true;
             }
+        } else if (e.request) {
+            console.error(`  No response received - server may be down`);
         }
+
+        if (!e.permanent) metrics.webhookRetries.inc({ session: sessionId });
+        throw e;
     }
+}
+
+// Directories /sessions/send may read media from by path, separated like PATH
+// (e.g. the bench's sites/<site>/public/files and sites/<site>/private/files)
+const SHARED_FILES_ROOTS = (process.env.SHARED_FILES_ROOT || '')
+    .split(path.delimiter)
+    .filter(Boolean)
+    .map(root => {
+        try {
+            return fs.realpathSync(root);
+        } catch (e) {
+            console.warn(`SHARED_FILES_ROOT ${root} does not exist`);
+            return null;
+        }
+    })
+    .filter(Boolean);
 
-    console.error(`[${sessionId}] Webhook failed after ${maxRetries} attempts - giving up`);
+// Real path of `filePath` if it is a file under one of the shared roots, else null
+async function resolveSharedFile(filePath) {
+    if (!SHARED_FILES_ROOTS.length || typeof filePath !== 'string') return null;
+    try {
+        const realPath = await fs.promises.realpath(filePath);
+        if (!SHARED_FILES_ROOTS.some(root => realPath.startsWith(root + path.sep))) return null;
+        const stat = await fs.promises.stat(realPath);
+        return stat.isFile() ? realPath : null;
+    } catch (e) {
+        return null;
+    }
 }
 
 // API Endpoints
@@ -654,9 +862,11 @@ app.post('/sessions/send', async (req, res) => {
     const session = sessions.get(sessionId);
 
     if (!session || session.status !== 'Connected') {
+        metrics.messagesSent.inc({ session: sessionId, outcome: 'not_connected' });
         return res.status(400).json({ error: 'Session not connected' });
     }
 
+    const endSend = metrics.sendDuration.startTimer({ session: sessionId });
     try {
         let cleanedReceiver = receiver.replace(/[\s\+]/g, ''); // Don't remove - for groups
         let jid;
@@ -668,32 +878,55 @@ app.post('/sessions/send', async (req, res) => {
             jid = `${cleanedReceiver}@s.whatsapp.net`;
         }
 
+        // Media is either a file under SHARED_FILES_ROOT, which Baileys streams
+        // from disk, or inline base64
+        let source;
+        if (media && media.path) {
+            // Reading files from disk is reserved to Frappe: this route is otherwise unauthenticated
+            if (!hasWebhookToken(req, sessionId)) {
+                endSend();
+                metrics.messagesSent.inc({ session: sessionId, outcome: 'rejected' });
+                return res.status(401).json({ error: 'Unauthorized', code: 'media_path_unauthorized' });
+            }
+            const filePath = await resolveSharedFile(media.path);
+            if (!filePath) {
+                endSend();
+                metrics.messagesSent.inc({ session: sessionId, outcome: 'rejected' });
+                return res.status(400).json({
+                    error: 'Media path is not a file under SHARED_FILES_ROOT',
+                    code: 'media_path_rejected'
+                });
+            }
+            source = { url: filePath };
+        } else if (media && media.data) {
+            source = Buffer.from(media.data, 'base64');
+        }
+
         let result;
-        if (media && media.data) {
-            const buffer = Buffer.from(media.data, 'base64');
+        if (source) {
             const mimetype = media.mimetype || 'application/pdf';
             const filename = media.filename || 'file';
             const options = {};
 
             if (mimetype.startsWith('image/')) {
-                options.image = buffer;
+                options.image = source;
                 if (message && message !== filename) {
                     options.caption = message;
                 }
             } else if (mimetype.startsWith('video/')) {
-                options.video = buffer;
+                options.video = source;
                 if (message && message !== filename) {
                     options.caption = message;
                 }
             } else if (mimetype.startsWith('audio/')) {
-                options.audio = buffer;
+                options.audio = source;
                 options.mimetype = mimetype;
                 // Check if this is a voice note (PTT)
                 if (filename.includes('voice_note') || message.includes('🎤')) {
                     options.ptt = true;  // Mark as Push-To-Talk voice message
                 }
             } else {
-                options.document = buffer;
+                options.document = source;
                 options.mimetype = mimetype;
                 options.fileName = filename;
                 if (message && message !== filename) {
@@ -706,6 +939,8 @@ app.post('/sessions/send', async (req, res) => {
         }
 
         console.log(`Send Success for ${sessionId}, Message ID: ${result.key.id}`);
+        endSend();
+        metrics.messagesSent.inc({ session: sessionId, outcome: 'sent' });
         res.json({
             status: 'sent',
             messageId: result.key.id,
@@ -713,28 +948,28 @@ app.post('/sessions/send', async (req, res) => {
         });
     } catch (e) {
         console.error(`Send Exception for ${sessionId}:`, e);
+        endSend();
+        metrics.messagesSent.inc({ session: sessionId, outcome: 'error' });
         res.status(500).json({ error: e.message });
     }
 });
 
 app.post('/sessions/group-metadata', async (req, res) => {
-    const { sessionId, groupId } = req.body;
+    const { sessionId, groupId, refresh } = req.body;
     const session = sessions.get(sessionId);
     if (!session || session.status !== 'Connected') {
         return res.status(400).json({ error: 'Session not connected' });
     }
     try {
         const jid = groupId.includes('@') ? groupId : `${groupId}@g.us`;
-        const metadata = await session.sock.groupMetadata(jid);
-
-        // Resolve LIDs to phone numbers for all participants
-        if (metadata.participants && metadata.participants.length) {
-            for (let p of metadata.participants) {
-                const phone = await getPhoneNumberFromJid(p.id, session.sock);
-                p.phone = phone; // Add phone number field
-                p.full_id = p.id; // Keep original ID
-            }
-        }
+        const cached = await session.groupCache.fetch(jid, session.sock, { refresh: !!refresh });
+
+        // Resolve LIDs to phone numbers for all participants, on a copy so the
+        // cached metadata stays as Baileys expects it
+        const metadata = {
+            ...cached,
+            participants: await resolveParticipants(cached.participants || [], session.sock)
+        };
 
         res.json({ status: 'success', metadata });
     } catch (e) {
@@ -773,11 +1008,44 @@ app.get('/sessions/:sessionId/status', (req, res) => {
     res.json({ status: session.status });
 });
 
+// Whether the request carries the session's webhook token, i.e. comes from Frappe.
+// Required to read or delete spooled media and to send files by path.
+function hasWebhookToken(req, sessionId) {
+    const token = req.get('X-Webhook-Token');
+    const expected = outboxes.get(sessionId)?.target?.webhookToken;
+    return !!token && !!expected && token.length === expected.length &&
+        crypto.timingSafeEqual(Buffer.from(token), Buffer.from(expected));
+}
+
+// Spooled incoming media
+app.get('/media/:sessionId/:id', (req, res) => {
+    const { sessionId, id } = req.params;
+    if (!hasWebhookToken(req, sessionId)) return res.status(401).json({ error: 'Unauthorized' });
+
+    const filePath = mediaSpool.spoolPath(sessionId, id);
+    if (!filePath || !fs.existsSync(filePath)) return res.status(404).json({ error: 'Media not found' });
+    res.set('Content-Type', 'application/octet-stream');
+    fs.createReadStream(filePath).pipe(res);
+});
+
+app.delete('/media/:sessionId/:id', async (req, res) => {
+    const { sessionId, id } = req.params;
+    if (!hasWebhookToken(req, sessionId)) return res.status(401).json({ error: 'Unauthorized' });
+    res.json({ removed: await mediaSpool.remove(sessionId, id) });
+});
+
+app.get('/sessions/:sessionId/outbox', (req, res) => {
+    const outbox = outboxes.get(req.params.sessionId);
+    if (!outbox) return res.status(404).json({ error: 'Outbox not found' });
+    res.json(outbox.stats());
+});
+
 app.delete('/sessions/:sessionId', async (req, res) => {
     const session = sessions.get(req.params.sessionId);
     if (session) {
-        await session.sock.logout();
+        if (session.sock) await session.sock.logout();
         sessions.delete(req.params.sessionId);
+        session.dispose();
         const sessionDir = path.join(__dirname, 'sessions', req.params.sessionId);
         if (fs.existsSync(sessionDir)) {
             fs.rmSync(sessionDir, { recursive: true, force: true });
@@ -790,36 +1058,129 @@ const PORT = 3000;
 app.listen(PORT, '0.0.0.0', async () => {
     console.log(`WhatsApp Bridge running on port ${PORT}`);
 
+    // Resume delivery of events queued before the restart, including those of
+    // sessions that have since been logged out
+    if (fs.existsSync(OUTBOX_DIR)) {
+        for (const sessionId of fs.readdirSync(OUTBOX_DIR)) {
+            if (fs.lstatSync(path.join(OUTBOX_DIR, sessionId)).isDirectory()) {
+                getOutbox(sessionId);
+            }
+        }
+    }
+
+    // Media Frappe never collected
+    mediaSpool.sweep();
+    setInterval(() => mediaSpool.sweep(), 3600000);
+
     // Auto-load existing sessions from disk
+    restoreSessions().catch(e => console.error('Failed to restore sessions:', e));
+});
+
+// ============================================================================
+// BOOT RESTORE
+// ============================================================================
+
+// Saved sessions are reconnected a few at a time so a restart doesn't hit
+// WhatsApp with every session at once. Paired sessions go first, most
+// recently active (newest creds.json) first; unpaired ones only produce a QR.
+const BOOT_CONCURRENCY = parseInt(process.env.BOOT_CONCURRENCY || '4', 10);
+
+const bootState = {
+    startedAt: null,
+    sessions: [],
+    started: 0,
+    connected: new Set(),
+    allConnectedMs: null
+};
+
+function savedSessions() {
     const sessionsDir = path.join(__dirname, 'sessions');
-    if (fs.existsSync(sessionsDir)) {
-        const folders = fs.readdirSync(sessionsDir);
-        for (const sessionId of folders) {
-            const sessionPath = path.join(sessionsDir, sessionId);
-            if (fs.lstatSync(sessionPath).isDirectory()) {
-                console.log(`Auto-starting session: ${sessionId}`);
-                try {
-                    // Try to load webhook config
-                    let webhookUrl, webhookToken;
-                    const webhookConfigPath = path.join(sessionPath, 'webhook-config.json');
-                    if (fs.existsSync(webhookConfigPath)) {
-                        try {
-                            const webhookConfig = JSON.parse(fs.readFileSync(webhookConfigPath, 'utf8'));
-                            webhookUrl = webhookConfig.webhookUrl;
-                            webhookToken = webhookConfig.webhookToken;
-                            console.log(`Loaded webhook config for ${sessionId}`);
-                        } catch (e) {
-                            console.error(`Failed to load webhook config for ${sessionId}:`, e);
-                        }
-                    }
-                    startSession(sessionId, webhookUrl, webhookToken).catch(e => console.error(`Failed to auto-start ${sessionId}:`, e));
-                } catch (err) {
-                    console.error(`Error starting session ${sessionId}:`, err);
-                }
+    if (!fs.existsSync(sessionsDir)) return [];
+
+    const saved = [];
+    for (const sessionId of fs.readdirSync(sessionsDir)) {
+        const sessionPath = path.join(sessionsDir, sessionId);
+        if (!fs.lstatSync(sessionPath).isDirectory()) continue;
+
+        let paired = false;
+        let lastActive = 0;
+        try {
+            const credsPath = path.join(sessionPath, 'creds.json');
+            lastActive = fs.statSync(credsPath).mtimeMs;
+            paired = !!JSON.parse(fs.readFileSync(credsPath, 'utf8')).me;
+        } catch (e) {
+            // No usable credentials: the session will need a new QR scan
+        }
+
+        // Try to load webhook config
+        let webhookUrl, webhookToken;
+        const webhookConfigPath = path.join(sessionPath, 'webhook-config.json');
+        if (fs.existsSync(webhookConfigPath)) {
+            try {
+                const webhookConfig = JSON.parse(fs.readFileSync(webhookConfigPath, 'utf8'));
+                webhookUrl = webhookConfig.webhookUrl;
+                webhookToken = webhookConfig.webhookToken;
+            } catch (e) {
+                console.error(`Failed to load webhook config for ${sessionId}:`, e);
             }
         }
+
+        saved.push({ sessionId, paired, lastActive, webhookUrl, webhookToken });
     }
-});
+
+    return saved.sort((a, b) => (b.paired - a.paired) || (b.lastActive - a.lastActive));
+}
+
+async function restoreSessions() {
+    const saved = savedSessions();
+    if (!saved.length) return;
+
+    bootState.startedAt = Date.now();
+    bootState.sessions = saved.filter(s => s.paired).map(s => s.sessionId);
+    console.log(`Restoring ${saved.length} sessions (${bootState.sessions.length} paired), ${BOOT_CONCURRENCY} at a time`);
+
+    let next = 0;
+    const worker = async () => {
+        while (next < saved.length) {
+            const { sessionId, webhookUrl, webhookToken } = saved[next++];
+            console.log(`Auto-starting session: ${sessionId}`);
+            try {
+                // Returns once the session connected, showed a QR or timed out
+                const result = await startSession(sessionId, webhookUrl, webhookToken);
+                if (result?.error) console.warn(`Session ${sessionId} not ready yet: ${result.error}`);
+            } catch (err) {
+                console.error(`Failed to auto-start ${sessionId}:`, err);
+            }
+            bootState.started++;
+        }
+    };
+    await Promise.all(Array.from({ length: Math.min(BOOT_CONCURRENCY, saved.length) }, worker));
+
+    console.log(`Boot restore started ${bootState.started} sessions in ${((Date.now() - bootState.startedAt) / 1000).toFixed(1)}s`);
+}
+
+function recordBootConnected(sessionId) {
+    if (!bootState.startedAt || bootState.allConnectedMs !== null) return;
+    if (!bootState.sessions.includes(sessionId)) return;
+
+    bootState.connected.add(sessionId);
+    if (bootState.connected.size === bootState.sessions.length) {
+        bootState.allConnectedMs = Date.now() - bootState.startedAt;
+        metrics.bootDuration.set({}, bootState.allConnectedMs / 1000);
+        console.log(`All ${bootState.sessions.length} paired sessions connected ${(bootState.allConnectedMs / 1000).toFixed(1)}s after boot`);
+    }
+}
+
+function bootSummary() {
+    if (!bootState.startedAt) return null;
+    return {
+        concurrency: BOOT_CONCURRENCY,
+        paired: bootState.sessions.length,
+        started: bootState.started,
+        connected: bootState.connected.size,
+        allConnectedMs: bootState.allConnectedMs
+    };
+}
 
 // Anti-Crash Insurance: Log errors instead of stopping the process
 process.on('uncaughtException', (err) => {
@@ -836,7 +1197,7 @@ process.on('unhandledRejection', (reason, promise) => {
 
 // Get contact information including profile picture
 app.post('/sessions/contact-info', async (req, res) => {
-    const { sessionId, phone } = req.body;
+    const { sessionId, phone, refresh } = req.body;
     const session = sessions.get(sessionId);
 
     if (!session || session.status !== 'Connected') {
@@ -847,32 +1208,13 @@ app.post('/sessions/contact-info', async (req, res) => {
         let cleanedPhone = phone.replace(/[\s\+\-]/g, '');
         const jid = cleanedPhone.includes('@') ? cleanedPhone : `${cleanedPhone}@s.whatsapp.net`;
 
-        // Get profile picture
-        let profilePicUrl = null;
-        try {
-            profilePicUrl = await session.sock.profilePictureUrl(jid, 'image');
-        } catch (e) {
-            console.log(`No profile picture for ${phone}`);
-        }
-
-        // Get status/about
-        let status = null;
-        try {
-            const statusInfo = await session.sock.fetchStatus(jid);
-            status = statusInfo?.status;
-        } catch (e) {
-            console.log(`Could not fetch status for ${phone}`);
-        }
-
-        // Check if number exists on WhatsApp
-        const [exists] = await session.sock.onWhatsApp(jid);
+        const { info, fetchedAt, stale } = await session.contactCache.get(jid, session.sock, { refresh: !!refresh });
 
         res.json({
             status: 'success',
-            exists: !!exists,
-            profilePicture: profilePicUrl,
-            about: status,
-            jid: jid
+            ...info,
+            fetchedAt,
+            stale
         });
 
     } catch (e) {
@@ -891,15 +1233,12 @@ app.post('/sessions/check-number', async (req, res) => {
     }
 
     try {
-        let cleanedPhone = phone.replace(/[\s\+\-]/g, '');
-        const jid = cleanedPhone.includes('@') ? cleanedPhone : `${cleanedPhone}@s.whatsapp.net`;
-
-        const [result] = await session.sock.onWhatsApp(jid);
+        const [result] = await numberCheck.checkNumbers(sessionId, session.sock, [phone]);
 
         res.json({
             status: 'success',
-            exists: !!result,
-            jid: result?.jid || jid
+            exists: result.exists,
+            jid: result.jid
         });
 
     } catch (e) {
@@ -908,6 +1247,57 @@ app.post('/sessions/check-number', async (req, res) => {
     }
 });
 
+// Check many numbers at once; queries are chunked and rate limited per session
+app.post('/sessions/check-numbers', async (req, res) => {
+    const { sessionId, phones } = req.body;
+    const session = sessions.get(sessionId);
+
+    if (!session || session.status !== 'Connected') {
+        return res.status(400).json({ error: 'Session not connected' });
+    }
+    if (!Array.isArray(phones) || phones.length > numberCheck.MAX_NUMBERS) {
+        return res.status(400).json({ error: `phones must be an array of at most ${numberCheck.MAX_NUMBERS} numbers` });
+    }
+
+    try {
+        const results = await numberCheck.checkNumbers(sessionId, session.sock, phones);
+        res.json({ status: 'success', results });
+    } catch (e) {
+        console.error(`Error checking numbers for ${sessionId}: ${e.message}`);
+        res.status(500).json({ error: e.message });
+    }
+});
+
+const MAX_READ_KEYS = 1000;
+const READ_RECEIPT_CHUNK = parseInt(process.env.READ_RECEIPT_CHUNK || '100', 10);
+
+// Send read receipts for many messages; keys are { id, remoteJid, participant }
+app.post('/sessions/read', async (req, res) => {
+    const { sessionId, keys } = req.body;
+    const session = sessions.get(sessionId);
+
+    if (!session || session.status !== 'Connected') {
+        return res.status(400).json({ error: 'Session not connected' });
+    }
+    if (!Array.isArray(keys) || keys.length > MAX_READ_KEYS) {
+        return res.status(400).json({ error: `keys must be an array of at most ${MAX_READ_KEYS} message keys` });
+    }
+
+    try {
+        const valid = keys
+            .filter(k => k && k.id && k.remoteJid)
+            .map(k => ({ id: k.id, remoteJid: k.remoteJid, participant: k.participant || undefined, fromMe: false }));
+        for (let i = 0; i < valid.length; i += READ_RECEIPT_CHUNK) {
+            await session.sock.readMessages(valid.slice(i, i + READ_RECEIPT_CHUNK));
+        }
+        metrics.readReceipts.inc({ session: sessionId }, valid.length);
+        res.json({ status: 'success', read: valid.length });
+    } catch (e) {
+        console.error(`Error sending read receipts for ${sessionId}: ${e.message}`);
+        res.status(500).json({ error: e.message });
+    }
+});
+
 // Get session info
 app.get('/sessions/:sessionId', (req, res) => {
     const session = sessions.get(req.params.sessionId);
@@ -918,7 +1308,9 @@ app.get('/sessions/:sessionId', (req, res) => {
     res.json({
         status: session.status,
         qr: session.qr,
-        hasWebhook: !!session.webhookUrl
+        hasWebhook: !!session.webhookUrl,
+        lidCache: lidCaches.get(req.params.sessionId)?.snapshot(),
+        resources: session.resources()
     });
 });
 
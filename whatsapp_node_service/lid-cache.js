@@ -0,0 +1,105 @@
+// Bounded, per-session LID -> phone cache in front of a LidStore.
+//
+// Recently used mappings are kept in an LRU capped at LID_CACHE_SIZE entries;
+// anything else is read through from the session's mapping log. LIDs that
+// WhatsApp could not resolve are remembered as negative entries for
+// LID_NEGATIVE_TTL_MS so they don't trigger a new query on every message.
+
+const metrics = require('./metrics');
+
+const DEFAULT_MAX_ENTRIES = parseInt(process.env.LID_CACHE_SIZE || '10000', 10);
+const DEFAULT_NEGATIVE_TTL_MS = parseInt(process.env.LID_NEGATIVE_TTL_MS || '3600000', 10);
+
+class LidCache {
+    constructor(store, { maxEntries = DEFAULT_MAX_ENTRIES, negativeTtlMs = DEFAULT_NEGATIVE_TTL_MS } = {}) {
+        this.store = store;
+        this.maxEntries = maxEntries;
+        this.negativeTtlMs = negativeTtlMs;
+        this.entries = new Map();    // lid -> phone, least recently used first
+        this.negative = new Map();   // lid -> expiry timestamp, oldest first
+        this.stats = { hits: 0, storeHits: 0, negativeHits: 0, misses: 0, evictions: 0 };
+    }
+
+    get size() {
+        return this.entries.size;
+    }
+
+    // Resolves to the phone number, null for a LID known to be unresolvable,
+    // or undefined when nothing is known about it
+    async get(lid) {
+        if (this.entries.has(lid)) {
+            const phone = this.entries.get(lid);
+            this.entries.delete(lid);
+            this.entries.set(lid, phone);
+            this._count('hits', 'hit');
+            return phone;
+        }
+
+        const expires = this.negative.get(lid);
+        if (expires !== undefined) {
+            if (expires > Date.now()) {
+                this._count('negativeHits', 'negative');
+                return null;
+            }
+            this.negative.delete(lid);
+        }
+
+        const phone = await this.store.lookup(lid);
+        if (phone) {
+            this._put(lid, phone);
+            this._count('storeHits', 'store');
+            return phone;
+        }
+
+        this._count('misses', 'miss');
+        return undefined;
+    }
+
+    // Record a mapping, persisting it if it is new. Resolves to true if it was.
+    async remember(lid, phone) {
+        if (this.entries.get(lid) === phone) return false;
+        this.negative.delete(lid);
+
+        const stored = this.store.has(lid) ? await this.store.lookup(lid) : undefined;
+        // Bulk syncs shouldn't flush the working set, so only refresh entries already cached
+        if (this.entries.has(lid)) this._put(lid, phone);
+        if (stored === phone) return false;
+
+        this.store.append(lid, phone);
+        return true;
+    }
+
+    markUnresolved(lid) {
+        this.negative.delete(lid);
+        this.negative.set(lid, Date.now() + this.negativeTtlMs);
+        if (this.negative.size > this.maxEntries) {
+            this.negative.delete(this.negative.keys().next().value);
+        }
+    }
+
+    snapshot() {
+        return {
+            ...this.stats,
+            size: this.entries.size,
+            negative: this.negative.size,
+            maxEntries: this.maxEntries,
+            stored: this.store.size
+        };
+    }
+
+    _put(lid, phone) {
+        this.entries.delete(lid);
+        this.entries.set(lid, phone);
+        if (this.entries.size > this.maxEntries) {
+            this.entries.delete(this.entries.keys().next().value);
+            this.stats.evictions++;
+        }
+    }
+
+    _count(stat, result) {
+        this.stats[stat]++;
+        metrics.cacheRequests.inc({ cache: 'lid', result });
+    }
+}
+
+module.exports = { LidCache };
@@ -0,0 +1,202 @@
+// Persistent LID -> phone number mappings for one session.
+//
+// Mappings live in a single append-only log (`lid-mappings.log`, one
+// "<lid> <phone>" pair per line) that is indexed once when the session starts
+// and appended to in batches afterwards. Only the byte offset of each LID's
+// latest line is kept in memory; the phone number is read from the log on
+// demand, so memory stays small no matter how many contacts the account has.
+// The log replaces scanning the per-LID `lid-mapping-<lid>_reverse.json` files
+// of the Baileys key store, which are imported once the first time a session
+// runs with the log.
+
+const fs = require('fs');
+const path = require('path');
+
+const LOG_FILE = 'lid-mappings.log';
+const FLUSH_DELAY_MS = 100;
+const MAX_LINE_BYTES = 64;
+
+class LidStore {
+    constructor(sessionDir) {
+        this.sessionDir = sessionDir;
+        this.logPath = path.join(sessionDir, LOG_FILE);
+        this.index = new Map();     // lid -> byte offset of its latest line
+        this.fileSize = 0;
+        this.pending = new Map();   // lid -> phone, queued for the next append
+        this.writing = new Map();   // lid -> phone, being appended right now
+        this.writes = Promise.resolve();
+        this.flushTimer = null;
+        this.handle = null;
+    }
+
+    get size() {
+        return this.index.size + this.pending.size;
+    }
+
+    // Build the offset index. Returns the number of mappings.
+    load() {
+        if (!fs.existsSync(this.logPath)) {
+            this._importLegacy();
+            return this.index.size;
+        }
+
+        const data = fs.readFileSync(this.logPath);
+        let lines = 0;
+        let start = 0;
+        while (start < data.length) {
+            let end = data.indexOf(10, start);
+            if (end === -1) end = data.length;
+            const space = data.indexOf(32, start);
+            if (space > start && space < end) {
+                this.index.set(data.toString('latin1', start, space), start);
+                lines++;
+            }
+            start = end + 1;
+        }
+        this.fileSize = data.length;
+
+        // Remapped LIDs leave stale lines behind; rewrite once they dominate
+        if (lines > 1000 && lines > this.index.size * 2) {
+            const mappings = new Map();
+            for (const [lid, offset] of this.index) {
+                mappings.set(lid, parseLine(data.toString('latin1', offset, offset + MAX_LINE_BYTES))[1]);
+            }
+            this._rewrite(mappings);
+        }
+        return this.index.size;
+    }
+
+    has(lid) {
+        return this.pending.has(lid) || this.writing.has(lid) || this.index.has(lid);
+    }
+
+    // Phone number stored for `lid`, or undefined
+    async lookup(lid) {
+        if (this.pending.has(lid)) return this.pending.get(lid);
+        if (this.writing.has(lid)) return this.writing.get(lid);
+
+        const offset = this.index.get(lid);
+        if (offset === undefined) return undefined;
+
+        try {
+            if (!this.handle) this.handle = await fs.promises.open(this.logPath, 'r');
+            const buffer = Buffer.alloc(MAX_LINE_BYTES);
+            const { bytesRead } = await this.handle.read(buffer, 0, MAX_LINE_BYTES, offset);
+            const [storedLid, phone] = parseLine(buffer.toString('latin1', 0, bytesRead));
+            return storedLid === lid ? phone : undefined;
+        } catch (e) {
+            console.error(`Failed to read LID mapping ${lid} from ${this.logPath}:`, e.message);
+            return undefined;
+        }
+    }
+
+    // Queue a mapping; queued mappings are written with a single append
+    append(lid, phone) {
+        this.pending.set(lid, phone);
+        if (!this.flushTimer) {
+            this.flushTimer = setTimeout(() => this.flush(), FLUSH_DELAY_MS);
+        }
+    }
+
+    flush() {
+        if (this.flushTimer) clearTimeout(this.flushTimer);
+        this.flushTimer = null;
+        if (!this.pending.size) return this.writes;
+
+        const batch = this.pending;
+        this.pending = new Map();
+
+        // Appends are chained so offsets are handed out in file order
+        this.writes = this.writes.then(async () => {
+            let chunk = '';
+            const offsets = [];
+            for (const [lid, phone] of batch) {
+                this.writing.set(lid, phone);
+                offsets.push([lid, this.fileSize + chunk.length]);
+                chunk += `${lid} ${phone}\n`;
+            }
+            try {
+                await fs.promises.appendFile(this.logPath, chunk, 'latin1');
+                this.fileSize += chunk.length;
+                for (const [lid, offset] of offsets) this.index.set(lid, offset);
+            } catch (e) {
+                console.error(`Failed to save LID mappings in ${this.sessionDir}:`, e);
+            } finally {
+                for (const lid of batch.keys()) this.writing.delete(lid);
+            }
+        });
+        return this.writes;
+    }
+
+    async close() {
+        await this.flush();
+        if (this.handle) await this.handle.close().catch(() => { });
+        this.handle = null;
+    }
+
+    // Report the reverse (lid -> phone) entries Baileys writes to its key store,
+    // instead of watching the session directory for new files
+    tapKeyStore(keys, onMapping) {
+        const set = keys.set.bind(keys);
+        keys.set = async (data) => {
+            const mappings = data && data['lid-mapping'];
+            if (mappings) {
+                for (const [key, value] of Object.entries(mappings)) {
+                    if (key.endsWith('_reverse') && value) {
+                        onMapping(key.slice(0, -'_reverse'.length), String(value).split(':')[0]);
+                    }
+                }
+            }
+            return set(data);
+        };
+        return keys;
+    }
+
+    _importLegacy() {
+        const mappings = new Map();
+        try {
+            for (const file of fs.readdirSync(this.sessionDir)) {
+                if (!file.startsWith('lid-mapping-') || !file.endsWith('_reverse.json')) continue;
+                const lid = file.slice('lid-mapping-'.length, -'_reverse.json'.length);
+                try {
+                    const phone = JSON.parse(fs.readFileSync(path.join(this.sessionDir, file), 'utf8'));
+                    if (phone) mappings.set(lid, String(phone));
+                } catch (err) {
+                    console.error(`Error reading LID mapping file ${file}:`, err);
+                }
+            }
+        } catch (err) {
+            console.error('Error importing LID mappings:', err);
+        }
+
+        this._rewrite(mappings);
+        if (mappings.size) console.log(`Imported ${mappings.size} LID mapping files into ${LOG_FILE}`);
+    }
+
+    _rewrite(mappings) {
+        this.index.clear();
+        let chunk = '';
+        for (const [lid, phone] of mappings) {
+            this.index.set(lid, chunk.length);
+            chunk += `${lid} ${phone}\n`;
+        }
+        this.fileSize = chunk.length;
+
+        const tmpPath = `${this.logPath}.tmp`;
+        try {
+            fs.mkdirSync(this.sessionDir, { recursive: true });
+            fs.writeFileSync(tmpPath, chunk, 'latin1');
+            fs.renameSync(tmpPath, this.logPath);
+        } catch (e) {
+            console.error(`Failed to write ${this.logPath}:`, e);
+        }
+    }
+}
+
+function parseLine(text) {
+    const line = text.split('\n', 1)[0];
+    const space = line.indexOf(' ');
+    return space > 0 ? [line.slice(0, space), line.slice(space + 1)] : [line, undefined];
+}
+
+module.exports = { LidStore };
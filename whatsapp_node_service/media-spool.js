@@ -0,0 +1,145 @@
+// Spool for incoming media.
+//
+// Media is streamed from WhatsApp straight to a file under media-spool/<session hash>/
+// instead of being buffered and base64-encoded into the webhook. Frappe receives
+// a reference, fetches the file from GET /media/:sessionId/:id and deletes it
+// once stored. Files Frappe never collects are swept after MEDIA_SPOOL_TTL_MS.
+
+const fs = require('fs');
+const path = require('path');
+const crypto = require('crypto');
+const { pipeline } = require('stream/promises');
+const { Transform } = require('stream');
+const { downloadMediaMessage } = require('@whiskeysockets/baileys');
+
+const SPOOL_DIR = path.join(__dirname, 'media-spool');
+const MAX_CONCURRENT_DOWNLOADS = parseInt(process.env.MEDIA_DOWNLOAD_CONCURRENCY || '3', 10);
+const SPOOL_TTL_MS = parseInt(process.env.MEDIA_SPOOL_TTL_MS || String(24 * 3600 * 1000), 10);
+const SAFE_NAME = /^[\w.-]+$/;
+
+// Bounds how many downloads run at once; the rest wait in FIFO order
+class Semaphore {
+    constructor(limit) {
+        this.limit = limit;
+        this.active = 0;
+        this.queue = [];
+    }
+
+    async acquire() {
+        if (this.active < this.limit) {
+            this.active++;
+            return;
+        }
+        await new Promise(resolve => this.queue.push(resolve));
+    }
+
+    release() {
+        const next = this.queue.shift();
+        if (next) next();
+        else this.active--;
+    }
+}
+
+const downloads = new Semaphore(MAX_CONCURRENT_DOWNLOADS);
+
+// Session IDs carry the company name ("WA-Smith_&_Sons"), so the spool folder
+// is named after a hash of the ID rather than the ID itself
+function sessionDir(sessionId) {
+    return crypto.createHash('sha256').update(String(sessionId)).digest('hex').slice(0, 32);
+}
+
+function spoolPath(sessionId, id) {
+    if (!sessionId || !SAFE_NAME.test(id) || id.startsWith('.')) return null;
+    return path.join(SPOOL_DIR, sessionDir(sessionId), id);
+}
+
+// Download the media of `msg` into the spool. Resolves to { id, size }.
+async function download(sessionId, msg, sock, logger) {
+    await downloads.acquire();
+    const id = `${String(msg.key.id).replace(/[^\w-]/g, '')}-${crypto.randomBytes(4).toString('hex')}`;
+    const filePath = spoolPath(sessionId, id);
+    if (!filePath) {
+        downloads.release();
+        throw new Error(`Cannot spool media ${id} of session ${sessionId}`);
+    }
+    const tmpPath = `${filePath}.part`;
+
+    try {
+        await fs.promises.mkdir(path.dirname(filePath), { recursive: true });
+        const stream = await downloadMediaMessage(msg, 'stream', {}, {
+            logger,
+            reuploadRequest: sock.updateMediaMessage
+        });
+
+        let size = 0;
+        const counter = new Transform({
+            transform(chunk, encoding, callback) {
+                size += chunk.length;
+                callback(null, chunk);
+            }
+        });
+        await pipeline(stream, counter, fs.createWriteStream(tmpPath));
+        await fs.promises.rename(tmpPath, filePath);
+        return { id, size };
+    } catch (e) {
+        fs.promises.unlink(tmpPath).catch(() => { });
+        throw e;
+    } finally {
+        downloads.release();
+    }
+}
+
+async function remove(sessionId, id) {
+    const filePath = spoolPath(sessionId, id);
+    if (!filePath) return false;
+    try {
+        await fs.promises.unlink(filePath);
+        return true;
+    } catch (e) {
+        return false;
+    }
+}
+
+// Delete spooled files older than the TTL (Frappe never fetched them)
+async function sweep() {
+    let removed = 0;
+    const cutoff = Date.now() - SPOOL_TTL_MS;
+    let sessionDirs = [];
+    try {
+        sessionDirs = await fs.promises.readdir(SPOOL_DIR);
+    } catch (e) {
+        return removed;
+    }
+
+    for (const sessionId of sessionDirs) {
+        const dir = path.join(SPOOL_DIR, sessionId);
+        let files = [];
+        try {
+            files = await fs.promises.readdir(dir);
+        } catch (e) {
+            continue;
+        }
+        for (const file of files) {
+            const filePath = path.join(dir, file);
+            try {
+                const stat = await fs.promises.stat(filePath);
+                if (stat.mtimeMs < cutoff) {
+                    await fs.promises.unlink(filePath);
+                    removed++;
+                }
+            } catch (e) { }
+        }
+    }
+    if (removed) console.log(`Media spool: removed ${removed} files older than ${SPOOL_TTL_MS / 3600000}h`);
+    return removed;
+}
+
+function stats() {
+    return {
+        activeDownloads: downloads.active,
+        queuedDownloads: downloads.queue.length,
+        maxConcurrentDownloads: MAX_CONCURRENT_DOWNLOADS
+    };
+}
+
+module.exports = { download, remove, sweep, spoolPath, stats };
@@ -0,0 +1,198 @@
+// Minimal Prometheus registry for the WhatsApp bridge.
+// Renders the text exposition format (0.0.4) without pulling in prom-client.
+
+const { monitorEventLoopDelay } = require('perf_hooks');
+
+const LATENCY_BUCKETS = [0.005, 0.01, 0.025, 0.05, 0.1, 0.25, 0.5, 1, 2.5, 5, 10, 30, 60];
+const SIZE_BUCKETS = [16e3, 64e3, 256e3, 1e6, 4e6, 16e6, 64e6];
+const BATCH_BUCKETS = [1, 2, 5, 10, 20, 50, 100];
+
+const registry = [];
+const collectors = [];
+
+function labelKey(labelNames, labels) {
+    return labelNames.map(name => String(labels[name] ?? '')).join('\u0001');
+}
+
+function formatLabels(labelNames, labels, extra = {}) {
+    const pairs = labelNames
+        .map(name => [name, labels[name] ?? ''])
+        .concat(Object.entries(extra))
+        .map(([k, v]) => `${k}="${String(v).replace(/\\/g, '\\\\').replace(/\n/g, '\\n').replace(/"/g, '\\"')}"`);
+    return pairs.length ? `{${pairs.join(',')}}` : '';
+}
+
+class Counter {
+    constructor(name, help, labelNames = []) {
+        Object.assign(this, { name, help, labelNames, type: 'counter', values: new Map() });
+        registry.push(this);
+    }
+
+    inc(labels = {}, value = 1) {
+        const key = labelKey(this.labelNames, labels);
+        const entry = this.values.get(key);
+        if (entry) entry.value += value;
+        else this.values.set(key, { labels, value });
+    }
+
+    lines() {
+        return Array.from(this.values.values(), ({ labels, value }) =>
+            `${this.name}${formatLabels(this.labelNames, labels)} ${value}`);
+    }
+}
+
+class Gauge {
+    constructor(name, help, labelNames = []) {
+        Object.assign(this, { name, help, labelNames, type: 'gauge', values: new Map() });
+        registry.push(this);
+    }
+
+    set(labels = {}, value) {
+        this.values.set(labelKey(this.labelNames, labels), { labels, value });
+    }
+
+    reset() {
+        this.values.clear();
+    }
+
+    lines() {
+        return Array.from(this.values.values(), ({ labels, value }) =>
+            `${this.name}${formatLabels(this.labelNames, labels)} ${value}`);
+    }
+}
+
+class Histogram {
+    constructor(name, help, labelNames = [], buckets = LATENCY_BUCKETS) {
+        Object.assign(this, { name, help, labelNames, buckets, type: 'histogram', values: new Map() });
+        registry.push(this);
+    }
+
+    observe(labels = {}, value) {
+        const key = labelKey(this.labelNames, labels);
+        let entry = this.values.get(key);
+        if (!entry) {
+            entry = { labels, counts: new Array(this.buckets.length).fill(0), sum: 0, count: 0 };
+            this.values.set(key, entry);
+        }
+        for (let i = 0; i < this.buckets.length; i++) {
+            if (value <= this.buckets[i]) entry.counts[i]++;
+        }
+        entry.sum += value;
+        entry.count++;
+    }
+
+    // Returns a function that observes the elapsed time in seconds when called
+    startTimer(labels = {}) {
+        const started = process.hrtime.bigint();
+        return (extraLabels = {}) => {
+            const seconds = Number(process.hrtime.bigint() - started) / 1e9;
+            this.observe({ ...labels, ...extraLabels }, seconds);
+            return seconds;
+        };
+    }
+
+    lines() {
+        const out = [];
+        for (const { labels, counts, sum, count } of this.values.values()) {
+            this.buckets.forEach((le, i) => {
+                out.push(`${this.name}_bucket${formatLabels(this.labelNames, labels, { le })} ${counts[i]}`);
+            });
+            out.push(`${this.name}_bucket${formatLabels(this.labelNames, labels, { le: '+Inf' })} ${count}`);
+            out.push(`${this.name}_sum${formatLabels(this.labelNames, labels)} ${sum}`);
+            out.push(`${this.name}_count${formatLabels(this.labelNames, labels)} ${count}`);
+        }
+        return out;
+    }
+}
+
+// Collectors run right before rendering to sample gauges (map sizes, memory, ...)
+function addCollector(fn) {
+    collectors.push(fn);
+}
+
+function render() {
+    for (const collect of collectors) {
+        try {
+            collect();
+        } catch (e) {
+            console.error('Metrics collector failed:', e.message);
+        }
+    }
+
+    const out = [];
+    for (const metric of registry) {
+        out.push(`# HELP ${metric.name} ${metric.help}`);
+        out.push(`# TYPE ${metric.name} ${metric.type}`);
+        out.push(...metric.lines());
+    }
+    return out.join('\n') + '\n';
+}
+
+// ============================================================================
+// BRIDGE METRICS
+// ============================================================================
+
+const messagesReceived = new Counter('wa_messages_received_total', 'Incoming WhatsApp messages, by session.', ['session']);
+const messagesSent = new Counter('wa_messages_sent_total', 'Outgoing send attempts, by session and outcome.', ['session', 'outcome']);
+const sendDuration = new Histogram('wa_send_duration_seconds', 'Latency of sock.sendMessage, by session.', ['session']);
+const mediaDownloadDuration = new Histogram('wa_media_download_duration_seconds', 'Time to download incoming media, by session.', ['session']);
+const mediaDownloadBytes = new Histogram('wa_media_download_bytes', 'Size of downloaded incoming media, by session.', ['session'], SIZE_BUCKETS);
+const webhookDuration = new Histogram('wa_webhook_delivery_duration_seconds', 'Time from outbox enqueue to Frappe acknowledging the webhook, including retries.', ['session', 'event']);
+const webhookRetries = new Counter('wa_webhook_retries_total', 'Failed webhook attempts that will be retried, by session.', ['session']);
+const webhookFailures = new Counter('wa_webhook_failures_total', 'Webhook events rejected by Frappe (4xx) and dead-lettered, by session.', ['session']);
+const webhookRequests = new Counter('wa_webhook_requests_total', 'HTTP requests made to the Frappe webhook, by session.', ['session']);
+const webhookBatchSize = new Histogram('wa_webhook_batch_size', 'Events packed into each webhook request.', ['session'], BATCH_BUCKETS);
+const outboxBacklog = new Gauge('wa_outbox_backlog', 'Webhook events queued in the outbox and not yet acknowledged by Frappe.', ['session']);
+const cacheRequests = new Counter('wa_cache_requests_total', 'In-memory cache lookups, by cache and result (hit/miss).', ['cache', 'result']);
+const numberChecks = new Counter('wa_number_checks_total', 'Numbers checked with onWhatsApp, by session and result (exists/missing).', ['session', 'result']);
+const readReceipts = new Counter('wa_read_receipts_total', 'Messages acknowledged with read receipts, by session.', ['session']);
+const historyMessages = new Counter('wa_history_sync_messages_total', 'History sync messages queued for import into Frappe, by session.', ['session']);
+const reconnects = new Counter('wa_reconnects_total', 'Scheduled reconnect attempts, by session.', ['session']);
+const eventLoopLag = new Gauge('wa_event_loop_lag_seconds', 'Event-loop delay since the previous scrape.', ['quantile']);
+const mapSize = new Gauge('wa_map_entries', 'Entries held in in-memory maps.', ['map']);
+const sessionResources = new Gauge('wa_session_resources', 'Resources held by each session supervisor, by kind.', ['session', 'kind']);
+const bootDuration = new Gauge('wa_boot_all_connected_seconds', 'Time from boot until every paired session was connected.');
+const memory = new Gauge('wa_process_memory_bytes', 'Process memory usage, by kind.', ['kind']);
+
+const loopDelay = monitorEventLoopDelay({ resolution: 20 });
+loopDelay.enable();
+
+addCollector(() => {
+    eventLoopLag.set({ quantile: '0.5' }, loopDelay.percentile(50) / 1e9);
+    eventLoopLag.set({ quantile: '0.99' }, loopDelay.percentile(99) / 1e9);
+    eventLoopLag.set({ quantile: '1' }, loopDelay.max / 1e9);
+    loopDelay.reset();
+
+    const usage = process.memoryUsage();
+    memory.set({ kind: 'rss' }, usage.rss);
+    memory.set({ kind: 'heap_used' }, usage.heapUsed);
+    memory.set({ kind: 'external' }, usage.external);
+    memory.set({ kind: 'array_buffers' }, usage.arrayBuffers);
+});
+
+module.exports = {
+    Counter,
+    Gauge,
+    Histogram,
+    addCollector,
+    render,
+    messagesReceived,
+    messagesSent,
+    sendDuration,
+    mediaDownloadDuration,
+    mediaDownloadBytes,
+    webhookDuration,
+    webhookRetries,
+    webhookFailures,
+    webhookRequests,
+    webhookBatchSize,
+    outboxBacklog,
+    reconnects,
+    numberChecks,
+    readReceipts,
+    historyMessages,
+    cacheRequests,
+    mapSize,
+    sessionResources,
+    bootDuration
+};
@@ -0,0 +1,116 @@
+// Bulk "is this number on WhatsApp" checks.
+//
+// onWhatsApp accepts many JIDs in one usync query, so numbers are checked in
+// chunks of CHECK_NUMBERS_CHUNK instead of one query per number. Each session
+// has a budget of CHECK_NUMBERS_PER_MINUTE numbers; chunks wait for budget
+// rather than firing back to back, so validating a large customer list does
+// not look like contact scraping to WhatsApp.
+
+const metrics = require('./metrics');
+
+const CHUNK_SIZE = parseInt(process.env.CHECK_NUMBERS_CHUNK || '50', 10);
+const PER_MINUTE = parseInt(process.env.CHECK_NUMBERS_PER_MINUTE || '600', 10);
+const MAX_NUMBERS = 1000;   // per request; callers page through larger lists
+
+// Token bucket refilled at `perMinute` tokens per minute. Takes are served in order.
+class RateBudget {
+    constructor(perMinute) {
+        this.perMinute = perMinute;
+        this.tokens = perMinute;
+        this.updated = Date.now();
+        this.queue = Promise.resolve();
+    }
+
+    take(count) {
+        const run = this.queue.then(() => this._take(Math.min(count, this.perMinute)));
+        this.queue = run.catch(() => { });
+        return run;
+    }
+
+    async _take(count) {
+        this._refill();
+        if (this.tokens < count) {
+            const waitMs = Math.ceil((count - this.tokens) / this.perMinute * 60000);
+            await new Promise(resolve => setTimeout(resolve, waitMs));
+            this._refill();
+        }
+        this.tokens -= count;
+    }
+
+    _refill() {
+        const now = Date.now();
+        this.tokens = Math.min(this.perMinute, this.tokens + (now - this.updated) / 60000 * this.perMinute);
+        this.updated = now;
+    }
+}
+
+const budgets = new Map(); // sessionId -> RateBudget
+
+function budgetFor(sessionId) {
+    let budget = budgets.get(sessionId);
+    if (!budget) {
+        budget = new RateBudget(PER_MINUTE);
+        budgets.set(sessionId, budget);
+    }
+    return budget;
+}
+
+function toJid(phone) {
+    const cleaned = String(phone).replace(/[\s\+\-]/g, '');
+    return cleaned.includes('@') ? cleaned : `${cleaned}@s.whatsapp.net`;
+}
+
+// Key under which a number and WhatsApp's answer for it are matched. WhatsApp
+// answers some numbers with a rewritten JID: Brazilian mobiles without the
+// ninth digit (55 AA 9XXXXXXXX -> 55 AA XXXXXXXX) and Mexican mobiles without
+// the 1 after the country code (52 1 XXXXXXXXXX -> 52 XXXXXXXXXX).
+function matchKey(user) {
+    if (user.length === 13 && user.startsWith('55') && user[4] === '9') return user.slice(0, 4) + user.slice(5);
+    if (user.length === 13 && user.startsWith('521')) return '52' + user.slice(3);
+    return user;
+}
+
+async function queryNumbers(sock, jids) {
+    const answers = new Map();   // match key -> { exists, jid }
+    for (const result of (await sock.onWhatsApp(...jids)) || []) {
+        if (result && result.jid) {
+            answers.set(matchKey(result.jid.split('@')[0]), { exists: result.exists !== false, jid: result.jid });
+        }
+    }
+    return answers;
+}
+
+// Check `phones` on `sock`. Resolves to [{ phone, exists, jid }] in input order.
+// onWhatsApp leaves numbers that are not on WhatsApp out of its answer. A number
+// left out of a chunk's answer is queried again on its own before it is reported
+// as missing, so a rewrite matchKey doesn't know can't mark it missing.
+async function checkNumbers(sessionId, sock, phones) {
+    const budget = budgetFor(sessionId);
+    const results = [];
+
+    for (let i = 0; i < phones.length; i += CHUNK_SIZE) {
+        const chunk = phones.slice(i, i + CHUNK_SIZE);
+        const jids = chunk.map(toJid);
+        await budget.take(jids.length);
+        const answers = await queryNumbers(sock, jids);
+
+        for (let index = 0; index < chunk.length; index++) {
+            let answer = answers.get(matchKey(jids[index].split('@')[0]));
+            if (!answer && jids.length > 1) {
+                await budget.take(1);
+                // Any answer to a single-number query is about that number
+                answer = (await queryNumbers(sock, [jids[index]])).values().next().value;
+            }
+            const exists = answer ? answer.exists : false;
+            metrics.numberChecks.inc({ session: sessionId, result: exists ? 'exists' : 'missing' });
+            results.push({ phone: chunk[index], exists, jid: answer?.jid || jids[index] });
+        }
+    }
+    return results;
+}
+
+function forgetSession(sessionId) {
+    budgets.delete(sessionId);
+}
+
+module.exports = { checkNumbers, forgetSession, MAX_NUMBERS };
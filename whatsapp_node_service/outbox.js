@@ -0,0 +1,303 @@
+// Durable, ordered webhook outbox (one per session).
+//
+// Events are appended as JSON lines to segment files and delivered to Frappe in
+// order. Delivery is retried with backoff until Frappe acknowledges it, so a
+// Frappe restart or migration window delays events instead of losing them.
+// Pending events are handed to the deliver callback in batches, flushed when a
+// batch fills up or a few milliseconds after the first event was queued.
+//
+// Layout of an outbox directory:
+//   segment-<first seq>.log   JSON lines: { seq, event, data, trace, ts }
+//   ack.json                  { acked: <highest delivered seq> }
+//   dead-letter.log           entries Frappe rejected as invalid (a permanent 4xx response)
+
+const fs = require('fs');
+const path = require('path');
+
+const SEGMENT_ENTRIES = 500;     // entries per segment file before rolling
+const MAX_IN_MEMORY = 2000;      // newest entries kept in memory; older ones are re-read from disk
+const BATCH_SIZE = 50;           // max entries per delivery
+const MAX_BATCH_BYTES = 4 * 1024 * 1024;
+const FLUSH_DELAY_MS = 5;        // how long a partial batch waits for more events
+const MAX_BACKOFF_MS = 30000;
+
+class Outbox {
+    constructor(dir, deliver, options = {}) {
+        this.dir = dir;
+        this.deliver = deliver;  // async (entries) => void; throw with err.permanent = true to dead-letter,
+                                 // and err.delivered = n if the first n entries were handled anyway
+        this.segmentEntries = options.segmentEntries || SEGMENT_ENTRIES;
+        this.maxInMemory = options.maxInMemory || MAX_IN_MEMORY;
+        this.batchSize = options.batchSize || BATCH_SIZE;
+        this.maxBatchBytes = options.maxBatchBytes || MAX_BATCH_BYTES;
+        this.flushDelayMs = options.flushDelayMs ?? FLUSH_DELAY_MS;
+
+        this.acked = 0;
+        this.lastSeq = 0;
+        this.segments = [];      // first seq of each segment file, ascending
+        this.buffer = [];        // newest entries, contiguous and ending at lastSeq
+        this.stream = null;
+        this.draining = false;
+        this.failures = 0;
+        this.retryTimer = null;
+        this.closed = false;
+        this.deadLettered = 0;
+
+        fs.mkdirSync(dir, { recursive: true });
+        this._load();
+    }
+
+    get backlog() {
+        return this.lastSeq - this.acked;
+    }
+
+    // Append an event. Never blocks on disk: the write is queued on a stream.
+    enqueue(event, data, trace) {
+        if (this.closed) throw new Error('Outbox is closed');
+
+        const entry = { seq: ++this.lastSeq, event, data, trace, ts: Date.now() };
+        if (!this.stream || entry.seq - this.segments[this.segments.length - 1] >= this.segmentEntries) {
+            this._rollSegment(entry.seq);
+        }
+        const line = JSON.stringify(entry) + '\n';
+        this.stream.write(line);
+
+        // Kept off the persisted line; re-derived from the line length on replay
+        entry.bytes = line.length;
+        this.buffer.push(entry);
+        if (this.buffer.length > this.maxInMemory) this.buffer.shift();
+
+        if (this.backlog >= this.batchSize && this.retryTimer && !this.failures) {
+            // A full batch is waiting: don't sit out the flush delay
+            clearTimeout(this.retryTimer);
+            this.retryTimer = null;
+        }
+        this.schedule(this.backlog >= this.batchSize ? 0 : this.flushDelayMs);
+        return entry.seq;
+    }
+
+    // Start draining on the next tick unless a drain or backoff is already pending
+    schedule(delayMs = 0) {
+        if (this.draining || this.retryTimer || this.closed) return;
+        this.retryTimer = setTimeout(() => {
+            this.retryTimer = null;
+            this.drain();
+        }, delayMs);
+    }
+
+    async drain() {
+        if (this.draining || this.closed) return;
+        this.draining = true;
+
+        try {
+            while (this.backlog > 0 && !this.closed) {
+                const batch = await this._nextBatch();
+                if (!batch.length) break;
+
+                try {
+                    await this.deliver(batch);
+                } catch (e) {
+                    // Entries Frappe handled before the failing one are not sent again
+                    const delivered = Math.min(e.delivered || 0, batch.length - 1);
+                    const rest = batch.slice(delivered);
+                    if (delivered) await this._ack(batch[delivered - 1].seq);
+
+                    if (!e.permanent) return this._retryLater(rest[0], e);
+                    if (rest.length === 1) {
+                        this._deadLetter(rest[0], e);
+                    } else {
+                        // Isolate the rejected entries by delivering one at a time
+                        for (const entry of rest) {
+                            try {
+                                await this.deliver([entry]);
+                            } catch (err) {
+                                if (!err.permanent) {
+                                    await this._ack(entry.seq - 1);
+                                    return this._retryLater(entry, err);
+                                }
+                                this._deadLetter(entry, err);
+                            }
+                        }
+                    }
+                }
+
+                this.failures = 0;
+                await this._ack(batch[batch.length - 1].seq);
+            }
+        } catch (e) {
+            console.error(`Outbox ${path.basename(this.dir)}: drain error:`, e);
+            this.draining = false;
+            this.schedule(MAX_BACKOFF_MS);
+            return;
+        }
+
+        this.draining = false;
+    }
+
+    // Keep the entry; retry the whole queue later, in order
+    _retryLater(entry, err) {
+        this.failures++;
+        const delay = Math.min(1000 * Math.pow(2, this.failures - 1), MAX_BACKOFF_MS);
+        console.error(`Outbox ${path.basename(this.dir)}: delivery of #${entry.seq} failed (${err.message}), ${this.backlog} pending, retrying in ${delay}ms`);
+        this.draining = false;
+        this.schedule(delay);
+    }
+
+    close() {
+        this.closed = true;
+        if (this.retryTimer) clearTimeout(this.retryTimer);
+        this.retryTimer = null;
+        if (this.stream) this.stream.end();
+        this.stream = null;
+    }
+
+    stats() {
+        return {
+            backlog: this.backlog,
+            acked: this.acked,
+            lastSeq: this.lastSeq,
+            segments: this.segments.length,
+            inMemory: this.buffer.length,
+            consecutiveFailures: this.failures,
+            deadLettered: this.deadLettered
+        };
+    }
+
+    _load() {
+        try {
+            const ack = JSON.parse(fs.readFileSync(path.join(this.dir, 'ack.json'), 'utf8'));
+            this.acked = ack.acked || 0;
+        } catch (e) {
+            this.acked = 0;
+        }
+
+        this.segments = fs.readdirSync(this.dir)
+            .filter(f => f.startsWith('segment-') && f.endsWith('.log'))
+            .map(f => parseInt(f.slice(8, -4), 10))
+            .filter(n => !isNaN(n))
+            .sort((a, b) => a - b);
+
+        this.lastSeq = this.acked;
+        if (this.segments.length) {
+            const last = this._readSegmentSync(this.segments[this.segments.length - 1]);
+            const lastEntrySeq = last.length ? last[last.length - 1].seq : this.segments[this.segments.length - 1] - 1;
+            this.lastSeq = Math.max(this.acked, lastEntrySeq);
+        }
+
+        this._compact();
+        if (this.backlog > 0) {
+            console.log(`Outbox ${path.basename(this.dir)}: ${this.backlog} undelivered events to replay`);
+            this.schedule();
+        }
+    }
+
+    _rollSegment(firstSeq) {
+        if (this.stream) this.stream.end();
+        this.segments.push(firstSeq);
+        this.stream = fs.createWriteStream(this._segmentPath(firstSeq), { flags: 'a' });
+        this.stream.on('error', (e) => console.error(`Outbox ${path.basename(this.dir)}: write error:`, e));
+    }
+
+    async _nextBatch() {
+        const from = this.acked + 1;
+        const bufferStart = this.buffer.length ? this.buffer[0].seq : this.lastSeq + 1;
+
+        if (from >= bufferStart) {
+            return this._limitBytes(this.buffer.slice(from - bufferStart, from - bufferStart + this.batchSize));
+        }
+
+        // Older than what memory holds: replay from the segment files
+        await this._flush();
+        const index = this._segmentIndexFor(from);
+        if (index < 0) return [];
+        const entries = await this._readSegment(this.segments[index]);
+        return this._limitBytes(entries
+            .filter(e => e.seq >= from && e.seq < bufferStart)
+            .slice(0, this.batchSize));
+    }
+
+    // Always at least one entry, so a single oversized event still goes out alone
+    _limitBytes(entries) {
+        let total = 0;
+        for (let i = 0; i < entries.length; i++) {
+            total += entries[i].bytes || 0;
+            if (i > 0 && total > this.maxBatchBytes) return entries.slice(0, i);
+        }
+        return entries;
+    }
+
+    async _ack(seq) {
+        if (seq <= this.acked) return;
+        this.acked = seq;
+        const ackPath = path.join(this.dir, 'ack.json');
+        const tmpPath = `${ackPath}.tmp`;
+        await fs.promises.writeFile(tmpPath, JSON.stringify({ acked: seq }));
+        await fs.promises.rename(tmpPath, ackPath);
+        this._compact();
+    }
+
+    // Delete segments whose entries are all acknowledged (never the one being written)
+    _compact() {
+        while (this.segments.length > 1 && this.segments[1] - 1 <= this.acked) {
+            const first = this.segments.shift();
+            fs.promises.unlink(this._segmentPath(first)).catch(() => { });
+        }
+        if (this.segments.length === 1 && !this.stream && this.acked >= this.lastSeq) {
+            fs.promises.unlink(this._segmentPath(this.segments.shift())).catch(() => { });
+        }
+    }
+
+    _deadLetter(entry, err) {
+        this.deadLettered++;
+        console.error(`Outbox ${path.basename(this.dir)}: #${entry.seq} (${entry.event}) rejected by Frappe, moved to dead-letter.log: ${err.message}`);
+        const line = JSON.stringify({ ...entry, error: err.message, failedAt: Date.now() }) + '\n';
+        fs.promises.appendFile(path.join(this.dir, 'dead-letter.log'), line).catch(() => { });
+    }
+
+    _flush() {
+        return new Promise(resolve => (this.stream ? this.stream.write('', resolve) : resolve()));
+    }
+
+    _segmentIndexFor(seq) {
+        for (let i = this.segments.length - 1; i >= 0; i--) {
+            if (this.segments[i] <= seq) return i;
+        }
+        return -1;
+    }
+
+    _segmentPath(firstSeq) {
+        return path.join(this.dir, `segment-${String(firstSeq).padStart(12, '0')}.log`);
+    }
+
+    async _readSegment(firstSeq) {
+        try {
+            return parseLines(await fs.promises.readFile(this._segmentPath(firstSeq), 'utf8'));
+        } catch (e) {
+            return [];
+        }
+    }
+
+    _readSegmentSync(firstSeq) {
+        try {
+            return parseLines(fs.readFileSync(this._segmentPath(firstSeq), 'utf8'));
+        } catch (e) {
+            return [];
+        }
+    }
+}
+
+// A torn last line (crash mid-write) is skipped rather than failing the replay
+function parseLines(text) {
+    const entries = [];
+    for (const line of text.split('\n')) {
+        if (!line) continue;
+        try {
+            const entry = JSON.parse(line);
+            entry.bytes = line.length + 1;
+            entries.push(entry);
+        } catch (e) { }
+    }
+    return entries;
+}
+
+module.exports = { Outbox };
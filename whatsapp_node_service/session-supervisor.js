@@ -0,0 +1,165 @@
+// Owns everything a WhatsApp session allocates: the socket, the listeners
+// registered on it, timers, and any other resource with a cleanup step.
+//
+// One supervisor lives for as long as the session does and is what the
+// `sessions` map holds. A reconnect calls resetSocket() before the new socket
+// is created, so the old socket's listeners are detached before it is ended
+// and it cannot fire a second 'close' into the reconnect logic. Logout and
+// conflicts call dispose(), which also clears timers and runs disposers.
+
+class SessionSupervisor {
+    constructor(id) {
+        this.id = id;
+        this.sock = null;
+        this.status = 'Connecting';
+        this.qr = null;
+        this.webhookUrl = null;
+        this.webhookToken = null;
+        this.groupCache = null;
+        this.contactCache = null;
+        this.reconnectTimer = null;
+        this.readyWaiters = new Set();
+
+        this.listeners = [];        // [event, handler] registered on the current socket
+        this.timers = new Set();
+        this.disposers = [];
+        this.disposed = false;
+        this.socketsCreated = 0;
+    }
+
+    attachSocket(sock) {
+        this.resetSocket();
+        this.sock = sock;
+        this.socketsCreated++;
+        return sock;
+    }
+
+    // Register a listener on the current socket; it is removed with the socket
+    on(event, handler) {
+        this.sock.ev.on(event, handler);
+        this.listeners.push([event, handler]);
+    }
+
+    setTimeout(fn, ms) {
+        const timer = setTimeout(() => {
+            this.timers.delete(timer);
+            fn();
+        }, ms);
+        this.timers.add(timer);
+        return timer;
+    }
+
+    setInterval(fn, ms) {
+        const timer = setInterval(fn, ms);
+        this.timers.add(timer);
+        return timer;
+    }
+
+    clearTimer(timer) {
+        clearTimeout(timer);
+        clearInterval(timer);
+        this.timers.delete(timer);
+    }
+
+    // Resolves as soon as the session shows a QR code or connects, or with an
+    // error after `timeoutMs`. Survives reconnects of the same session.
+    waitForReady(timeoutMs) {
+        if (this.isReady()) return Promise.resolve(this.readyState());
+
+        return new Promise((resolve) => {
+            const waiter = (result) => {
+                this.clearTimer(timer);
+                this.readyWaiters.delete(waiter);
+                resolve(result);
+            };
+            const timer = this.setTimeout(
+                () => waiter({ error: 'Timeout waiting for QR. Session loading in background.' }),
+                timeoutMs
+            );
+            this.readyWaiters.add(waiter);
+        });
+    }
+
+    // Call after the QR code or connection status changed
+    notifyReady() {
+        if (!this.isReady()) return;
+        for (const waiter of Array.from(this.readyWaiters)) waiter(this.readyState());
+    }
+
+    isReady() {
+        return !!this.qr || this.status === 'Connected';
+    }
+
+    readyState() {
+        return { qr: this.qr, status: this.status };
+    }
+
+    // Run `fn` when the session is disposed (caches, file handles, ...)
+    addDisposer(fn) {
+        this.disposers.push(fn);
+    }
+
+    // Detach listeners from the current socket and close it
+    resetSocket() {
+        const sock = this.sock;
+        if (!sock) return;
+
+        for (const [event, handler] of this.listeners) {
+            try {
+                sock.ev.off(event, handler);
+            } catch (e) {
+                console.error(`[${this.id}] Error removing ${event} listener:`, e.message);
+            }
+        }
+        this.listeners = [];
+
+        try {
+            sock.end(undefined);
+        } catch (e) {
+            console.error(`[${this.id}] Error closing socket:`, e.message);
+        }
+        this.sock = null;
+    }
+
+    // Release every resource of the session; it cannot be restarted afterwards
+    dispose() {
+        if (this.disposed) return;
+        this.disposed = true;
+
+        this.resetSocket();
+        for (const waiter of Array.from(this.readyWaiters)) {
+            waiter({ status: 'Disconnected', error: 'Session closed' });
+        }
+        for (const timer of this.timers) {
+            clearTimeout(timer);
+            clearInterval(timer);
+        }
+        this.timers.clear();
+
+        for (const dispose of this.disposers.splice(0)) {
+            try {
+                dispose();
+            } catch (e) {
+                console.error(`[${this.id}] Error disposing session resource:`, e.message);
+            }
+        }
+        this.groupCache = null;
+        this.contactCache = null;
+        this.status = 'Disconnected';
+    }
+
+    resources() {
+        return {
+            socket: this.sock ? 1 : 0,
+            listeners: this.listeners.length,
+            timers: this.timers.size,
+            readyWaiters: this.readyWaiters.size,
+            disposers: this.disposers.length,
+            groupCacheEntries: this.groupCache?.size || 0,
+            contactCacheEntries: this.contactCache?.size || 0,
+            socketsCreated: this.socketsCreated
+        };
+    }
+}
+
+module.exports = { SessionSupervisor };